@@ -0,0 +1,66 @@
+from pydantic_settings import BaseSettings
+
+class Settings(BaseSettings):
+    OPENAI_API_KEY: str
+
+    REDIS_URL: str
+
+    # Knowledge base / RAG
+    KB_DOCS_DIR: str = "../kb/app/docs"
+    KB_INDEX_DIR: str = "data/kb"
+    KB_KEEP_GENERATIONS: int = 3
+    KB_RELOAD_INTERVAL_S: float = 5.0
+    RAG_TOP_K: int = 4
+    RAG_MIN_DENSE_SCORE: float = 0.25
+    EMBEDDER: str = "hashing"  # hashing | openai
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    EMBEDDING_DIM: int = 256
+    EMBEDDING_BATCH: int = 128
+
+    # Streaming de la respuesta por oraciones
+    LLM_STREAMING: bool = True
+    STREAM_MIN_SEGMENT_CHARS: int = 80
+
+    # Presupuesto del prompt, contado con tiktoken (si falta el encoding, se
+    # estima de más: 3 chars/token + 10%, ver prompt_builder.py)
+    PROMPT_TOKEN_BUDGET: int = 3000
+    PROMPT_ENCODING: str = "o200k_base"
+
+    # Caché de respuestas del LLM
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_TTL_S: int = 86400
+    RESPONSE_CACHE_MAX_ENTRIES: int = 10000
+
+    # Streams compartidos con whatsapp_webhook
+    TURNS_STREAM: str = "wa:turns"
+    OUTBOUND_STREAM: str = "wa:out"
+    OUTBOUND_STREAM_MAXLEN: int = 100000
+
+    # Consumer group del worker
+    WORKER_GROUP: str = "agent"
+    WORKER_CONCURRENCY: int = 16
+    WORKER_BLOCK_MS: int = 5000
+    WORKER_CLAIM_IDLE_MS: int = 60000
+    WORKER_CLAIM_INTERVAL_MS: int = 15000
+
+    # Ejecutor de respuestas: tope de LLM en curso por worker (el resto de
+    # WORKER_CONCURRENCY hace de cola), SLO de espera y heartbeat del lock
+    # del usuario (menor a un tercio de LOCK_TTL_MS del webhook)
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_QUEUE_SLO_MS: int = 10000
+    LOCK_HEARTBEAT_MS: int = 4000
+    # Dueño de cada turno (por turn_id): un turno reclamado por otro worker
+    # mientras el primero sigue vivo no se responde dos veces. El lease se
+    # renueva con el heartbeat; al publicar la salida final queda marcado
+    # como respondido REPLY_DONE_TTL_S.
+    REPLY_LEASE_MS: int = 12000
+    REPLY_DONE_TTL_S: int = 24 * 60 * 60
+    OVERLOAD_REPLY: str = (
+        "Estamos recibiendo muchos mensajes en este momento. "
+        "Por favor escríbenos de nuevo en unos minutos."
+    )
+
+    class Config:
+        env_file = ".env"
+
+settings = Settings()
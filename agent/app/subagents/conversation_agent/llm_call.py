@@ -1,24 +1,56 @@
-from typing import List, Dict
+from typing import AsyncIterator, Dict, Optional
 from openai import AsyncOpenAI
 
-from app.subagents.conversation_agent.prompt import CONVERSATION_PROMPT
+from app.subagents.conversation_agent.prompt_builder import PromptPlan
 
 
-async def conversational_llm(messages: List[Dict[str, str]], context: str, openai_client: AsyncOpenAI) -> str:
+def _record_usage(usage: Optional[Dict[str, int]], response) -> None:
+    if usage is not None and getattr(response, "usage", None) is not None:
+        usage["input_tokens"] = response.usage.input_tokens
+        usage["output_tokens"] = response.usage.output_tokens
+
+
+async def conversational_llm(plan: PromptPlan, openai_client: AsyncOpenAI,
+                             usage: Optional[Dict[str, int]] = None) -> str:
     """
-    Makes an asynchronous call to the OpenAI chat completion API with the provided messages.
+    Makes an asynchronous call to the OpenAI Responses API with a prompt built by PromptBuilder.
 
     Args:
-        messages (List[Dict[str, str]]): A list of message dictionaries for the conversation.
-        context (str): The context to be used in the conversation.
+        plan (PromptPlan): Static instructions plus the budgeted input (history, context and user turn).
         openai_client (AsyncOpenAI): An instance of the AsyncOpenAI client.
+        usage (dict, optional): If given, filled with the `input_tokens` and `output_tokens` reported by the API.
 
     Returns:
         str: The content of the response from the LLM.
     """
     response = await openai_client.responses.create(
         model="gpt-4.1-mini",
-        instructions=CONVERSATION_PROMPT.format(contexto=context),
-        input=messages,
+        instructions=plan.instructions,
+        input=plan.input,
+        temperature=0.2,
+    )
+    _record_usage(usage, response)
+    return response.output_text
+
+
+async def conversational_llm_stream(plan: PromptPlan, openai_client: AsyncOpenAI,
+                                    usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+    """
+    Same call as `conversational_llm` but streamed. `usage` is filled from the
+    final `response.completed` event.
+
+    Yields:
+        str: Text deltas as they arrive from the response event stream.
+    """
+    stream = await openai_client.responses.create(
+        model="gpt-4.1-mini",
+        instructions=plan.instructions,
+        input=plan.input,
         temperature=0.2,
+        stream=True,
     )
+    async for event in stream:
+        if event.type == "response.output_text.delta":
+            yield event.delta
+        elif event.type == "response.completed":
+            _record_usage(usage, event.response)
@@ -0,0 +1,122 @@
+import logging
+import math
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence
+
+from app.subagents.conversation_agent.prompt import CONTEXT_PROMPT, CONVERSATION_PROMPT
+from app.subagents.rag.bm25 import SearchHit
+from app.subagents.rag.retriever import format_context
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tokenizer opcional
+    tiktoken = None
+
+# Overhead aproximado por mensaje (rol + separadores) en los modelos de chat.
+MESSAGE_OVERHEAD = 4
+
+# Estimación sin tiktoken: el español con números, tildes o URLs baja de
+# ~4 a ~2.5-3 caracteres por token, así que se cuenta de más a propósito
+# para no pasarse del límite real de contexto.
+FALLBACK_CHARS_PER_TOKEN = 3.0
+FALLBACK_MARGIN = 1.1
+
+
+class TokenCounter:
+    """
+    Cuenta tokens con tiktoken (requirements.txt). Si no está instalado o no
+    puede cargar el encoding (lo descarga la primera vez), usa una estimación
+    conservadora por caracteres y lo avisa al arrancar.
+    """
+
+    def __init__(self, encoding: str = "o200k_base"):
+        self._enc = None
+        if tiktoken is None:
+            logging.warning("tiktoken no está instalado: el presupuesto del prompt se estima por caracteres")
+            return
+        try:
+            self._enc = tiktoken.get_encoding(encoding)
+        except Exception as e:
+            logging.warning(f"No se pudo cargar el encoding {encoding!r} de tiktoken ({e!r}): "
+                            "el presupuesto del prompt se estima por caracteres")
+
+    @property
+    def exact(self) -> bool:
+        return self._enc is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._enc is not None:
+            return len(self._enc.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / FALLBACK_CHARS_PER_TOKEN * FALLBACK_MARGIN)
+
+    def message(self, message: Dict[str, str]) -> int:
+        return self.count(message.get("content", "")) + MESSAGE_OVERHEAD
+
+
+@dataclass
+class PromptPlan:
+    instructions: str
+    input: List[Dict[str, str]]
+    tokens: int
+    tokens_saved: int = 0
+    chunk_ids: List[str] = field(default_factory=list)
+    dropped_chunks: int = 0
+    dropped_turns: int = 0
+
+
+class PromptBuilder:
+    """
+    Arma el prompt de conversational_llm con un presupuesto duro de tokens.
+
+    `instructions` es siempre CONVERSATION_PROMPT (prefijo cacheable). El
+    input va en orden historial → contexto → turno actual, de modo que
+    entre turnos de una misma sesión también se reutiliza el prefijo del
+    historial. Si no cabe, se descartan primero los chunks de menor ranking
+    y los turnos más viejos (del lado que más tokens ocupe).
+    """
+
+    def __init__(self, budget_tokens: int = 3000, counter: TokenCounter | None = None):
+        self.budget = budget_tokens
+        self.counter = counter or TokenCounter()
+        self._prefix_tokens = self.counter.count(CONVERSATION_PROMPT)
+
+    def _context_message(self, hits: Sequence[SearchHit]) -> Dict[str, str]:
+        return {"role": "developer", "content": CONTEXT_PROMPT.format(contexto=format_context(list(hits)))}
+
+    def build(self, user_turn: str, hits: Sequence[SearchHit], history: Sequence[Dict[str, str]] = ()) -> PromptPlan:
+        turn = {"role": "user", "content": user_turn}
+        fixed = self._prefix_tokens + self.counter.message(turn) + MESSAGE_OVERHEAD
+
+        # Los hits vienen ordenados por score: el último es el de menor ranking.
+        hits = list(hits)
+        chunk_tokens = [self.counter.count(format_context([h])) for h in hits]
+        history = list(history)
+        turn_tokens = [self.counter.message(m) for m in history]
+        full = fixed + sum(chunk_tokens) + sum(turn_tokens)
+
+        dropped_chunks = dropped_turns = 0
+        while fixed + sum(chunk_tokens) + sum(turn_tokens) > self.budget and (hits or history):
+            if history and (sum(turn_tokens) >= sum(chunk_tokens) or not hits):
+                history.pop(0)
+                turn_tokens.pop(0)
+                dropped_turns += 1
+            else:
+                hits.pop()
+                chunk_tokens.pop()
+                dropped_chunks += 1
+
+        messages = history + ([self._context_message(hits)] if hits else []) + [turn]
+        tokens = fixed + sum(chunk_tokens) + sum(turn_tokens)
+        if tokens > self.budget:
+            logging.warning(f"Prompt de {tokens} tokens excede el presupuesto ({self.budget}) sin nada que recortar")
+        return PromptPlan(
+            instructions=CONVERSATION_PROMPT,
+            input=messages,
+            tokens=tokens,
+            tokens_saved=full - tokens,
+            chunk_ids=[h.chunk.id for h in hits],
+            dropped_chunks=dropped_chunks,
+            dropped_turns=dropped_turns,
+        )
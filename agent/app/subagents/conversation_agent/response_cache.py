@@ -0,0 +1,103 @@
+import hashlib
+import re
+import time
+from typing import Dict, Iterable, Optional
+
+from redis.asyncio import Redis
+
+from app.subagents.rag.text import fold
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# KEYS: entry, lru, stats   ARGV: now_ms
+_GET_LUA = """
+local value = redis.call('GET', KEYS[1])
+if value then
+    redis.call('ZADD', KEYS[2], 'XX', ARGV[1], KEYS[1])
+    redis.call('HINCRBY', KEYS[3], 'hits', 1)
+else
+    redis.call('HINCRBY', KEYS[3], 'misses', 1)
+end
+return value
+"""
+
+# KEYS: entry, lru   ARGV: value, ttl_s, now_ms, max_entries
+# Desaloja los menos usados recientemente cuando se pasa de max_entries.
+_SET_LUA = """
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], KEYS[1])
+local over = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[4])
+if over > 0 then
+    local evicted = redis.call('ZPOPMIN', KEYS[2], over)
+    for i = 1, #evicted, 2 do redis.call('DEL', evicted[i]) end
+    return over
+end
+return 0
+"""
+
+
+def normalize_turn(text: str) -> str:
+    """Turno del usuario sin acentos, mayúsculas, puntuación ni espacios extra."""
+    return " ".join(_WORD_RE.findall(fold(text)))
+
+
+class ResponseCache:
+    """
+    Caché de respuestas del LLM en Redis para turnos repetidos (horarios,
+    precios, sucursales...).
+
+    La clave combina el turno normalizado, los IDs de los chunks recuperados
+    y la generación del KB: al publicarse una generación nueva las entradas
+    anteriores dejan de coincidir y `purge_generation` las borra. Cada
+    entrada tiene TTL y un sorted set por último acceso acota el total a
+    `max_entries` (desalojo estilo LRU). Hits/misses se cuentan en un hash.
+
+    La clave no incluye el historial: TurnHandler sólo consulta y guarda
+    turnos que abren una sesión (sin historial previo).
+    """
+
+    def __init__(self, r: Redis, ttl_s: int = 86400, max_entries: int = 10000, prefix: str = "llm:cache"):
+        self._r = r
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.prefix = prefix
+        self._lru = f"{prefix}:lru"
+        self._stats = f"{prefix}:stats"
+        self._get = r.register_script(_GET_LUA)
+        self._set = r.register_script(_SET_LUA)
+
+    def key(self, turn: str, chunk_ids: Iterable[str], generation: int) -> str:
+        raw = normalize_turn(turn) + "\x1f" + "\x1f".join(sorted(chunk_ids))
+        return f"{self.prefix}:{generation}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._get(keys=[key, self._lru, self._stats], args=[int(time.time() * 1000)])
+
+    async def set(self, key: str, value: str) -> int:
+        """Guarda la respuesta; devuelve cuántas entradas se desalojaron."""
+        return await self._set(
+            keys=[key, self._lru],
+            args=[value, self.ttl_s, int(time.time() * 1000), self.max_entries],
+        )
+
+    async def purge_generation(self, generation: int) -> int:
+        """Borra las entradas de una generación del KB que ya no está activa."""
+        pattern = f"{self.prefix}:{generation}:*"
+        purged = 0
+        async for member in self._r.zscan_iter(self._lru, match=pattern, count=500):
+            key = member[0]
+            await self._r.delete(key)
+            await self._r.zrem(self._lru, key)
+            purged += 1
+        return purged
+
+    async def stats(self) -> Dict[str, float]:
+        raw = await self._r.hgetall(self._stats)
+        hits, misses = int(raw.get("hits", 0)), int(raw.get("misses", 0))
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "entries": await self._r.zcard(self._lru),
+        }
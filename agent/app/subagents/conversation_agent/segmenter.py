@@ -0,0 +1,50 @@
+import re
+from typing import List, Optional
+
+# Fin de oración: . ! ? … (opcionalmente seguidos de comillas/paréntesis) y un espacio.
+_SENTENCE_END_RE = re.compile(r"[.!?…]+[\"')\]]*\s+")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_ABBREVIATIONS = ("dr.", "dra.", "sr.", "sra.", "srta.", "lic.", "ing.", "etc.", "aprox.", "tel.", "núm.", "no.")
+
+
+class SentenceSegmenter:
+    """
+    Acumula los deltas de texto del stream del LLM y entrega segmentos
+    completos (párrafo u oración) de al menos `min_chars` caracteres, para
+    enviarlos por WhatsApp en cuanto están listos.
+    """
+
+    def __init__(self, min_chars: int = 80):
+        self.min_chars = min_chars
+        self._buf = ""
+
+    def _cut(self) -> int:
+        """Posición de corte del último límite válido, o -1."""
+        cut = -1
+        for m in _PARAGRAPH_RE.finditer(self._buf):
+            if m.start() >= self.min_chars:
+                return m.end()
+        for m in _SENTENCE_END_RE.finditer(self._buf):
+            if m.start() + 1 < self.min_chars:
+                continue
+            word = self._buf[:m.start() + 1].rsplit(None, 1)[-1].lower()
+            if word in _ABBREVIATIONS:
+                continue
+            cut = m.end()
+            break
+        return cut
+
+    def feed(self, delta: str) -> List[str]:
+        self._buf += delta
+        out = []
+        while True:
+            cut = self._cut()
+            if cut < 0:
+                return out
+            segment, self._buf = self._buf[:cut].strip(), self._buf[cut:]
+            if segment:
+                out.append(segment)
+
+    def flush(self) -> Optional[str]:
+        segment, self._buf = self._buf.strip(), ""
+        return segment or None
@@ -0,0 +1,168 @@
+import heapq
+import json
+import math
+import mmap
+import os
+import struct
+from array import array
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence
+
+from app.subagents.rag.documents import Chunk
+from app.subagents.rag.text import tokenize
+
+MAGIC = b"BM25IDX1"
+# magic, n_terms, n_chunks, n_postings, y 7 offsets de sección (u64)
+_HEADER = struct.Struct("<8sIII7Q")
+
+
+@dataclass
+class SearchHit:
+    chunk: Chunk
+    score: float
+
+
+def _pad(buf: bytearray, align: int = 8):
+    buf.extend(b"\0" * (-len(buf) % align))
+
+
+def write_index(
+    path: str | Path,
+    chunks: Sequence[Chunk],
+    tokens: Sequence[Sequence[str]] | None = None,
+    k1: float = 1.2,
+    b: float = 0.75,
+) -> Path:
+    """
+    Construye el índice invertido con los pesos BM25 ya calculados por
+    posting y lo serializa en un archivo binario compacto:
+
+        header | term_offsets u32[T+1] | term_blob utf-8
+               | posting_offsets u32[T+1] | doc_ids u32[P] | weights f32[P]
+               | chunk_offsets u64[N+1] | chunk_blob (JSON por chunk)
+
+    Los términos van ordenados, así que `BM25Index` sólo necesita hacer
+    mmap y búsqueda binaria: cargar es O(1) sin importar el tamaño del KB.
+    `tokens` permite reutilizar tokenizaciones previas (reindex incremental).
+    """
+    if tokens is None:
+        tokens = [tokenize(c.index_text()) for c in chunks]
+    n = len(chunks)
+    lengths = [len(t) for t in tokens]
+    avgdl = (sum(lengths) / n) if n else 0.0
+
+    postings: Dict[str, List[tuple[int, int]]] = defaultdict(list)
+    for doc, toks in enumerate(tokens):
+        for term, tf in Counter(toks).items():
+            postings[term].append((doc, tf))
+
+    terms = sorted(postings)
+    term_offsets, term_blob = array("I", [0]), bytearray()
+    posting_offsets, doc_ids, weights = array("I", [0]), array("I"), array("f")
+    for term in terms:
+        term_blob.extend(term.encode("utf-8"))
+        term_offsets.append(len(term_blob))
+        plist = postings[term]
+        idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+        for doc, tf in plist:
+            norm = k1 * (1 - b + b * lengths[doc] / avgdl) if avgdl else k1
+            doc_ids.append(doc)
+            weights.append(idf * tf * (k1 + 1) / (tf + norm))
+        posting_offsets.append(len(doc_ids))
+
+    chunk_offsets, chunk_blob = array("Q", [0]), bytearray()
+    for c in chunks:
+        chunk_blob.extend(json.dumps(c.to_dict(), ensure_ascii=False).encode("utf-8"))
+        chunk_offsets.append(len(chunk_blob))
+
+    body = bytearray()
+    offsets = []
+    for section in (term_offsets.tobytes(), term_blob, posting_offsets.tobytes(),
+                    doc_ids.tobytes(), weights.tobytes(), chunk_offsets.tobytes(), chunk_blob):
+        _pad(body)
+        offsets.append(_HEADER.size + len(body))
+        body.extend(section)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(terms), n, len(doc_ids), *offsets))
+        f.write(body)
+    os.replace(tmp, path)
+    return path
+
+
+class BM25Index:
+    """
+    Índice BM25 de sólo lectura sobre un archivo generado por `write_index`.
+
+    El archivo se abre con mmap: todos los workers comparten las páginas y
+    los chunks se decodifican sólo cuando aparecen en un resultado.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = view = memoryview(self._mm)
+        magic, self.n_terms, self.n_chunks, n_postings, *off = _HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} no es un índice BM25")
+        t = self.n_terms
+        self._term_offsets = view[off[0]:off[0] + 4 * (t + 1)].cast("I")
+        self._term_blob = view[off[1]:off[2]]
+        self._posting_offsets = view[off[2]:off[2] + 4 * (t + 1)].cast("I")
+        self._doc_ids = view[off[3]:off[3] + 4 * n_postings].cast("I")
+        self._weights = view[off[4]:off[4] + 4 * n_postings].cast("f")
+        self._chunk_offsets = view[off[5]:off[5] + 8 * (self.n_chunks + 1)].cast("Q")
+        self._chunk_blob = view[off[6]:]
+
+    @classmethod
+    def build(cls, path: str | Path, chunks: Sequence[Chunk], **kwargs) -> "BM25Index":
+        return cls(write_index(path, chunks, **kwargs))
+
+    def close(self):
+        for mv in (self._term_offsets, self._term_blob, self._posting_offsets, self._doc_ids,
+                   self._weights, self._chunk_offsets, self._chunk_blob, self._view):
+            mv.release()
+        self._mm.close()
+
+    def _term(self, i: int) -> bytes:
+        return bytes(self._term_blob[self._term_offsets[i]:self._term_offsets[i + 1]])
+
+    def _find(self, term: str) -> int:
+        key = term.encode("utf-8")
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.n_terms and self._term(lo) == key else -1
+
+    def chunk(self, i: int) -> Chunk:
+        raw = self._chunk_blob[self._chunk_offsets[i]:self._chunk_offsets[i + 1]]
+        return Chunk.from_dict(json.loads(bytes(raw)))
+
+    def scores(self, query_tokens: Iterable[str]) -> Dict[int, float]:
+        acc: Dict[int, float] = defaultdict(float)
+        for term in set(query_tokens):
+            i = self._find(term)
+            if i < 0:
+                continue
+            start, end = self._posting_offsets[i], self._posting_offsets[i + 1]
+            for doc, w in zip(self._doc_ids[start:end], self._weights[start:end]):
+                acc[doc] += w
+        return acc
+
+    def scores_for(self, query: str) -> Dict[int, float]:
+        return self.scores(tokenize(query))
+
+    def search(self, query: str, k: int = 4) -> List[SearchHit]:
+        acc = self.scores_for(query)
+        top = heapq.nlargest(k, acc.items(), key=lambda kv: kv[1])
+        return [SearchHit(self.chunk(doc), score) for doc, score in top]
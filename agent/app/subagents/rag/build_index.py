@@ -0,0 +1,39 @@
+"""
+Reindexa el KB (BM25 + embeddings) de forma incremental y publica una
+generación nueva; los workers la recogen solos.
+
+Uso (desde agent/):
+    python -m app.subagents.rag.build_index [--full]
+"""
+import argparse
+import asyncio
+
+from openai import AsyncOpenAI
+
+from app.core.settings import settings
+from app.subagents.rag.embeddings import make_embedder
+from app.subagents.rag.indexer import reindex
+
+
+def get_embedder(openai_client: AsyncOpenAI):
+    kwargs = {"dim": settings.EMBEDDING_DIM}
+    if settings.EMBEDDER == "openai":
+        kwargs.update(model=settings.EMBEDDING_MODEL, batch_size=settings.EMBEDDING_BATCH)
+    return make_embedder(settings.EMBEDDER, openai_client, **kwargs)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full", action="store_true", help="re-embeber todo, ignorando la generación activa")
+    args = parser.parse_args()
+
+    embedder = get_embedder(AsyncOpenAI(api_key=settings.OPENAI_API_KEY))
+    res = await reindex(settings.KB_DOCS_DIR, settings.KB_INDEX_DIR, embedder, settings.EMBEDDING_BATCH,
+                        full=args.full, keep_generations=settings.KB_KEEP_GENERATIONS)
+    state = "publicada" if res.published else "sin cambios"
+    print(f"generación {res.generation} ({state}): {res.total} chunks, {res.added} nuevos/modificados, "
+          f"{res.reused} reutilizados, {res.removed} eliminados en {res.elapsed_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
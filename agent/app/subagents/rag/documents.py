@@ -0,0 +1,145 @@
+import hashlib
+import json
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import yaml
+
+from app.subagents.rag.text import fold
+
+_FRONT_MATTER_RE = re.compile(r"\A---\s*\n(.*?)\n---\s*\n", re.DOTALL)
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+_SLUG_RE = re.compile(r"[^a-z0-9]+")
+
+MAX_CHUNK_CHARS = 800
+
+
+@dataclass
+class Chunk:
+    id: str
+    doc_id: str
+    title: str
+    heading: str
+    text: str
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def content_hash(self) -> str:
+        return hashlib.sha256(f"{self.title}\n{self.heading}\n{self.text}".encode("utf-8")).hexdigest()
+
+    @property
+    def meta_hash(self) -> str:
+        """Hash del front matter completo: cambia aunque el texto del chunk no cambie."""
+        raw = json.dumps(self.meta, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def index_text(self) -> str:
+        """Texto que se indexa: título y encabezado pesan como parte del chunk."""
+        return f"{self.title}\n{self.heading}\n{self.text}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "doc_id": self.doc_id, "title": self.title,
+                "heading": self.heading, "text": self.text, "meta": self.meta}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Chunk":
+        return cls(**data)
+
+
+def parse_front_matter(raw: str) -> Tuple[Dict[str, Any], str]:
+    """Separa el front matter YAML (entre `---`) del cuerpo Markdown."""
+    match = _FRONT_MATTER_RE.match(raw)
+    if not match:
+        return {}, raw
+    meta = yaml.safe_load(match.group(1)) or {}
+    return {k: str(v) if not isinstance(v, (list, dict)) else v for k, v in meta.items()}, raw[match.end():]
+
+
+def _sections(body: str) -> List[Tuple[str, List[str]]]:
+    """Parte el cuerpo en (encabezado, bloques) por headings Markdown."""
+    sections: List[Tuple[str, List[str]]] = [("", [])]
+    block: List[str] = []
+
+    def close_block():
+        if block:
+            sections[-1][1].append("\n".join(block).strip())
+            block.clear()
+
+    for line in body.splitlines():
+        heading = _HEADING_RE.match(line)
+        if heading:
+            close_block()
+            sections.append((heading.group(2).strip(), []))
+        elif not line.strip():
+            close_block()
+        else:
+            block.append(line.rstrip())
+    close_block()
+    return [(h, [b for b in blocks if b]) for h, blocks in sections if any(blocks)]
+
+
+def _split_block(block: str, max_chars: int) -> List[str]:
+    """Divide un bloque largo por líneas; en tablas repite la cabecera."""
+    if len(block) <= max_chars:
+        return [block]
+    lines = block.splitlines()
+    header: List[str] = []
+    if lines[0].startswith("|") and len(lines) > 2 and set(lines[1].replace("|", "").strip()) <= set("-: "):
+        header, lines = lines[:2], lines[2:]
+    parts, current = [], list(header)
+    for line in lines:
+        if current != header and len("\n".join(current + [line])) > max_chars:
+            parts.append("\n".join(current))
+            current = list(header)
+        current.append(line)
+    if current != header:
+        parts.append("\n".join(current))
+    return parts
+
+
+def _slug(heading: str) -> str:
+    return _SLUG_RE.sub("-", fold(heading)).strip("-")
+
+
+def chunk_document(path: Path, max_chars: int = MAX_CHUNK_CHARS) -> List[Chunk]:
+    """
+    Chunks por sección: agrupa bloques de una misma sección hasta `max_chars`.
+
+    El id sale de la sección y del hash del contenido (`doc#seccion-hash8`),
+    no de la posición: agregar o borrar un chunk no renombra los siguientes,
+    así que las claves del caché de respuestas que los citan siguen valiendo.
+    """
+    meta, body = parse_front_matter(path.read_text(encoding="utf-8"))
+    doc_id = meta.get("doc_id") or path.stem
+    title = meta.get("title", path.stem)
+
+    chunks: List[Chunk] = []
+    seen: Dict[str, int] = {}
+
+    def emit(heading: str, text: str):
+        chunk = Chunk("", doc_id, title, heading, text, meta)
+        base = f"{doc_id}#{_slug(heading) or 'intro'}-{chunk.content_hash[:8]}"
+        seen[base] = seen.get(base, 0) + 1
+        chunk.id = base if seen[base] == 1 else f"{base}-{seen[base]}"  # mismo texto repetido en la sección
+        chunks.append(chunk)
+
+    for heading, blocks in _sections(body):
+        pieces = [p for b in blocks for p in _split_block(b, max_chars)]
+        current: List[str] = []
+        for piece in pieces:
+            if current and len("\n\n".join(current + [piece])) > max_chars:
+                emit(heading, "\n\n".join(current))
+                current = []
+            current.append(piece)
+        if current:
+            emit(heading, "\n\n".join(current))
+    return chunks
+
+
+def load_corpus(docs_dir: str | Path, max_chars: int = MAX_CHUNK_CHARS) -> List[Chunk]:
+    chunks: List[Chunk] = []
+    for path in sorted(Path(docs_dir).glob("*.md")):
+        chunks.extend(chunk_document(path, max_chars))
+    return chunks
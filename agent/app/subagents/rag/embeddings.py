@@ -0,0 +1,84 @@
+import hashlib
+from typing import List, Protocol, Sequence
+
+import numpy as np
+from openai import AsyncOpenAI
+
+from app.subagents.rag.text import fold, tokenize
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Normaliza por filas (L2) en float32; filas nulas quedan en cero."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class Embedder(Protocol):
+    dim: int
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Devuelve una matriz float32 (len(texts), dim) normalizada."""
+        ...
+
+
+class HashingEmbedder:
+    """
+    Embedder local y determinista (feature hashing de stems y trigramas de
+    caracteres). No necesita red, así que sirve para tests y desarrollo.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        stems = tokenize(text)
+        grams = [f"#{w[i:i + 3]}" for w in fold(text).split() for i in range(max(1, len(w) - 2))]
+        return stems + grams
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feat in self._features(text):
+                h = int.from_bytes(hashlib.blake2b(feat.encode("utf-8"), digest_size=8).digest(), "little")
+                out[row, h % self.dim] += 1.0 if (h >> 63) else -1.0
+        return normalize(out)
+
+
+class OpenAIEmbedder:
+    """Embeddings de OpenAI, pedidos en lotes de `batch_size` textos."""
+
+    def __init__(self, client: AsyncOpenAI, model: str = "text-embedding-3-small", dim: int = 1536,
+                 batch_size: int = 128):
+        self._client = client
+        self.model = model
+        self.dim = dim
+        self.batch_size = batch_size
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), self.batch_size):
+            batch = list(texts[start:start + self.batch_size])
+            resp = await self._client.embeddings.create(model=self.model, input=batch, dimensions=self.dim)
+            for i, item in enumerate(resp.data):
+                out[start + i] = item.embedding
+        return normalize(out)
+
+
+async def embed_in_batches(embedder: Embedder, texts: Sequence[str], batch_size: int = 256) -> np.ndarray:
+    """Embebe `texts` por lotes y los escribe en una única matriz contigua."""
+    out = np.empty((len(texts), embedder.dim), dtype=np.float32)
+    for start in range(0, len(texts), batch_size):
+        out[start:start + batch_size] = await embedder.embed(texts[start:start + batch_size])
+    return out
+
+
+def make_embedder(kind: str, openai_client: AsyncOpenAI | None = None, **kwargs) -> Embedder:
+    """`hashing` (local, determinista) u `openai`."""
+    if kind == "hashing":
+        return HashingEmbedder(**kwargs)
+    if kind == "openai":
+        if openai_client is None:
+            raise ValueError("OpenAIEmbedder necesita un AsyncOpenAI")
+        return OpenAIEmbedder(openai_client, **kwargs)
+    raise ValueError(f"Embedder desconocido: {kind!r}")
@@ -0,0 +1,146 @@
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from app.subagents.rag.bm25 import write_index
+from app.subagents.rag.documents import load_corpus
+from app.subagents.rag.embeddings import Embedder, embed_in_batches
+from app.subagents.rag.manifest import (
+    BM25_FILE, TRACKED_META, VECTORS_FILE, ChunkEntry, Manifest, Tombstone,
+    current_generation, generation_dir, index_lock, publish_generation, read_manifest, write_manifest,
+)
+from app.subagents.rag.text import tokenize
+from app.subagents.rag.vector_index import write_vectors
+
+
+@dataclass
+class ReindexResult:
+    generation: int
+    published: bool
+    total: int
+    added: int
+    reused: int
+    removed: int
+    elapsed_ms: float
+
+
+def embedder_id(embedder: Embedder) -> str:
+    return f"{type(embedder).__name__}:{getattr(embedder, 'model', '')}:{embedder.dim}"
+
+
+async def reindex(
+    docs_dir: str | Path,
+    index_dir: str | Path,
+    embedder: Embedder,
+    batch_size: int = 256,
+    full: bool = False,
+    keep_generations: int = 3,
+) -> ReindexResult:
+    """
+    Reindexa el KB de forma incremental.
+
+    Cada chunk se identifica por el hash de su contenido. Los chunks cuyo
+    hash ya estaba en la generación activa reutilizan sus tokens y su fila
+    de embeddings; sólo los nuevos/modificados se tokenizan y embeben, y los
+    que desaparecen quedan como tombstones en el manifest. Si sólo cambió el
+    front matter se publica igual una generación nueva (sin re-embeber). El resultado se
+    escribe en un directorio de generación nuevo y se publica cambiando el
+    puntero CURRENT, así los workers lo recogen sin reiniciar.
+
+    Corre bajo `index_lock`: dos procesos que reindexan a la vez se
+    serializan y el segundo parte de lo que publicó el primero. Los
+    tombstones viven `keep_generations` generaciones, lo mismo que los
+    directorios que todavía pueden citarlos.
+    """
+    async with index_lock(index_dir):
+        return await _reindex(docs_dir, index_dir, embedder, batch_size, full, keep_generations)
+
+
+async def _reindex(docs_dir, index_dir, embedder: Embedder, batch_size: int, full: bool,
+                   keep_generations: int) -> ReindexResult:
+    t0 = time.perf_counter()
+    chunks = load_corpus(docs_dir)
+    ident = embedder_id(embedder)
+
+    prev_dir = current_generation(index_dir)
+    prev = read_manifest(prev_dir) if prev_dir and not full else None
+    if prev is not None and prev.embedder != ident:
+        prev = None  # otro embedder: no se pueden reutilizar filas
+    prev_by_hash = prev.by_hash() if prev else {}
+    generation = (prev.generation if prev else _last_generation(index_dir)) + 1
+
+    entries: List[ChunkEntry] = []
+    reuse_rows: List[int] = []      # fila en la matriz previa, por chunk reutilizado
+    reuse_at: List[int] = []        # posición en la generación nueva
+    embed_at: List[int] = []
+    seen = set()
+    for row, chunk in enumerate(chunks):
+        h = chunk.content_hash
+        seen.add(h)
+        meta = {k: chunk.meta.get(k) for k in TRACKED_META}
+        old = prev_by_hash.get(h)
+        if old is not None:
+            entries.append(ChunkEntry(chunk.id, h, chunk.doc_id, row, old.tokens, added_in=old.added_in,
+                                      meta_hash=chunk.meta_hash, **meta))
+            reuse_rows.append(old.row)
+            reuse_at.append(row)
+        else:
+            entries.append(ChunkEntry(chunk.id, h, chunk.doc_id, row, tokenize(chunk.index_text()),
+                                      added_in=generation, meta_hash=chunk.meta_hash, **meta))
+            embed_at.append(row)
+
+    removed = [
+        Tombstone(c.id, c.hash, c.doc_id, generation)
+        for c in (prev.chunks if prev else []) if c.hash not in seen
+    ]
+    # Un cambio sólo de front matter (effective_from, last_reviewed_by, ...) no
+    # toca los hashes de contenido, pero sí el manifest y el blob del BM25
+    unchanged = prev is not None and not embed_at and not removed and \
+        [(c.id, c.meta_hash) for c in prev.chunks] == [(e.id, e.meta_hash) for e in entries]
+    if unchanged:
+        return ReindexResult(prev.generation, False, len(entries), 0, len(entries), 0,
+                             (time.perf_counter() - t0) * 1000)
+
+    vectors = np.empty((len(chunks), embedder.dim), dtype=np.float32)
+    if reuse_rows:
+        prev_vectors = np.load(prev_dir / VECTORS_FILE, mmap_mode="r")
+        vectors[reuse_at] = prev_vectors[reuse_rows]
+        del prev_vectors
+    if embed_at:
+        vectors[embed_at] = await embed_in_batches(embedder, [chunks[i].index_text() for i in embed_at], batch_size)
+
+    gen_dir = generation_dir(index_dir, generation)
+    gen_dir.mkdir(parents=True, exist_ok=True)
+    write_vectors(gen_dir / VECTORS_FILE, vectors)
+    write_index(gen_dir / BM25_FILE, chunks, tokens=[e.tokens for e in entries])
+    tombstones = [t for t in (prev.tombstones if prev else []) if t.removed_in > generation - keep_generations]
+    tombstones += removed
+    write_manifest(gen_dir, Manifest(generation, ident, entries, tombstones))
+    publish_generation(index_dir, gen_dir)
+    _prune(index_dir, keep_generations)
+
+    return ReindexResult(generation, True, len(entries), len(embed_at), len(reuse_rows), len(removed),
+                         (time.perf_counter() - t0) * 1000)
+
+
+def _generations(index_dir: str | Path) -> List[Path]:
+    root = Path(index_dir)
+    return sorted(p for p in root.glob("gen-*") if p.is_dir()) if root.is_dir() else []
+
+
+def _last_generation(index_dir: str | Path) -> int:
+    gens = _generations(index_dir)
+    return int(gens[-1].name.split("-")[1]) if gens else 0
+
+
+def _prune(index_dir: str | Path, keep: int):
+    """
+    Borra generaciones viejas. Los workers que aún tengan una mapeada la
+    siguen leyendo sin problema (el inode vive hasta que suelten el mmap).
+    """
+    for old in _generations(index_dir)[:-keep]:
+        shutil.rmtree(old, ignore_errors=True)
@@ -0,0 +1,109 @@
+import asyncio
+import fcntl
+import json
+import os
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+BM25_FILE = "kb.bm25"
+VECTORS_FILE = "kb.vec.npy"
+LOCK_FILE = ".reindex.lock"
+
+# Campos del front matter que se copian al manifest por chunk
+TRACKED_META = ("effective_from", "last_reviewed_by")
+
+
+@dataclass
+class ChunkEntry:
+    id: str
+    hash: str
+    doc_id: str
+    row: int
+    tokens: List[str]
+    effective_from: Optional[str] = None
+    last_reviewed_by: Optional[str] = None
+    added_in: int = 0
+    meta_hash: Optional[str] = None  # front matter completo (va en el blob del BM25)
+
+
+@dataclass
+class Tombstone:
+    id: str
+    hash: str
+    doc_id: str
+    removed_in: int
+
+
+@dataclass
+class Manifest:
+    generation: int
+    embedder: str
+    chunks: List[ChunkEntry] = field(default_factory=list)
+    tombstones: List[Tombstone] = field(default_factory=list)
+
+    def by_hash(self) -> Dict[str, ChunkEntry]:
+        return {c.hash: c for c in self.chunks}
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "Manifest":
+        data = json.loads(raw)
+        return cls(
+            generation=data["generation"],
+            embedder=data["embedder"],
+            chunks=[ChunkEntry(**c) for c in data.get("chunks", [])],
+            tombstones=[Tombstone(**t) for t in data.get("tombstones", [])],
+        )
+
+
+def generation_dir(index_dir: str | Path, generation: int) -> Path:
+    return Path(index_dir) / f"gen-{generation:06d}"
+
+
+def current_generation(index_dir: str | Path) -> Optional[Path]:
+    """Directorio de la generación activa según el puntero CURRENT."""
+    pointer = Path(index_dir) / CURRENT_FILE
+    try:
+        name = pointer.read_text().strip()
+    except FileNotFoundError:
+        return None
+    return Path(index_dir) / name if name else None
+
+
+def read_manifest(gen_dir: Path) -> Manifest:
+    return Manifest.from_json((gen_dir / MANIFEST_FILE).read_text(encoding="utf-8"))
+
+
+def write_manifest(gen_dir: Path, manifest: Manifest):
+    (gen_dir / MANIFEST_FILE).write_text(manifest.to_json(), encoding="utf-8")
+
+
+def publish_generation(index_dir: str | Path, gen_dir: Path):
+    """Cambia CURRENT a `gen_dir` de forma atómica (rename)."""
+    pointer = Path(index_dir) / CURRENT_FILE
+    tmp = pointer.with_name(CURRENT_FILE + ".tmp")
+    tmp.write_text(gen_dir.name)
+    os.replace(tmp, pointer)
+
+
+@asynccontextmanager
+async def index_lock(index_dir: str | Path):
+    """
+    Lock exclusivo (flock) sobre el directorio de índices: un solo reindex a
+    la vez entre procesos (workers arrancando, `build_index`). El kernel lo
+    suelta solo si el proceso muere.
+    """
+    root = Path(index_dir)
+    root.mkdir(parents=True, exist_ok=True)
+    fd = os.open(root / LOCK_FILE, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # cerrar el fd suelta el flock
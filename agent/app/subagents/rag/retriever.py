@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+
+from app.subagents.rag.bm25 import BM25Index, SearchHit
+from app.subagents.rag.embeddings import Embedder
+from app.subagents.rag.indexer import reindex
+from app.subagents.rag.manifest import BM25_FILE, VECTORS_FILE, current_generation
+from app.subagents.rag.vector_index import VectorIndex
+
+RRF_K = 60
+
+
+class Retriever:
+    """
+    Recuperación híbrida: BM25 (léxica) + coseno sobre embeddings (semántica),
+    fusionadas con Reciprocal Rank Fusion.
+    """
+
+    def __init__(self, bm25: BM25Index, vectors: VectorIndex, embedder: Embedder,
+                 min_dense_score: float = 0.25, generation: int = 0):
+        if bm25.n_chunks != len(vectors):
+            raise ValueError("El índice BM25 y la matriz de embeddings no son de la misma generación")
+        self.bm25 = bm25
+        self.vectors = vectors
+        self.embedder = embedder
+        self.min_dense_score = min_dense_score
+        self.generation = generation
+
+    @classmethod
+    def open_generation(cls, gen_dir: Path, embedder: Embedder, **kwargs) -> "Retriever":
+        """Abre (mmap) los índices de un directorio `gen-NNNNNN`."""
+        generation = int(gen_dir.name.split("-")[1])
+        return cls(BM25Index(gen_dir / BM25_FILE), VectorIndex(gen_dir / VECTORS_FILE), embedder,
+                   generation=generation, **kwargs)
+
+    def close(self):
+        self.bm25.close()
+
+    async def search(self, query: str, k: int = 4) -> List[SearchHit]:
+        depth = max(k * 4, 20)
+        fused: Dict[int, float] = {}
+        lexical = sorted(self.bm25.scores_for(query).items(), key=lambda kv: kv[1], reverse=True)[:depth]
+        qvec = (await self.embedder.embed([query]))[0]
+        dense = [(doc, score) for doc, score in self.vectors.search(qvec, depth) if score >= self.min_dense_score]
+        for ranking in ([doc for doc, _ in lexical], [doc for doc, _ in dense]):
+            for rank, doc in enumerate(ranking):
+                fused[doc] = fused.get(doc, 0.0) + 1.0 / (RRF_K + rank + 1)
+        top = sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:k]
+        return [SearchHit(self.bm25.chunk(doc), score) for doc, score in top]
+
+
+class LiveRetriever:
+    """
+    Retriever que sigue al puntero CURRENT del directorio de índices.
+
+    Un loop en segundo plano revisa CURRENT cada `reload_interval_s`; si
+    cambió, abre la generación nueva (sólo mmap, O(1)) y cambia la referencia
+    de un golpe. Las búsquedas en curso terminan sobre la generación anterior,
+    que se libera cuando deja de estar referenciada.
+    """
+
+    def __init__(self, index_dir: str | Path, embedder: Embedder, reload_interval_s: float = 5.0, **kwargs):
+        self.index_dir = Path(index_dir)
+        self.embedder = embedder
+        self._kwargs = kwargs
+        self._interval = reload_interval_s
+        self._current: Retriever | None = None
+        self._current_dir: Path | None = None
+        self._task: asyncio.Task | None = None
+        self._listeners: List[Callable[[int, int], Awaitable[None]]] = []
+
+    def on_reload(self, listener: Callable[[int, int], Awaitable[None]]):
+        """Registra `listener(old_generation, new_generation)` para cada cambio de generación."""
+        self._listeners.append(listener)
+
+    @classmethod
+    async def open(cls, docs_dir: str | Path, index_dir: str | Path, embedder: Embedder,
+                   batch_size: int = 256, **kwargs) -> "LiveRetriever":
+        """
+        Abre la generación activa; la construye si todavía no hay ninguna.
+        Si arrancan varios workers a la vez, `reindex` los serializa con un
+        lock de archivo: uno construye y el resto encuentra la generación
+        publicada sin cambios.
+        """
+        live = cls(index_dir, embedder, **kwargs)
+        if current_generation(index_dir) is None:
+            await reindex(docs_dir, index_dir, embedder, batch_size)
+        live.reload()
+        live._task = asyncio.create_task(live._watch())
+        return live
+
+    @property
+    def generation(self) -> int:
+        return self._current.generation if self._current else 0
+
+    def reload(self) -> bool:
+        gen_dir = current_generation(self.index_dir)
+        if gen_dir is None or gen_dir == self._current_dir:
+            return False
+        self._current = Retriever.open_generation(gen_dir, self.embedder, **self._kwargs)
+        self._current_dir = gen_dir
+        logging.info(f"KB generation {self._current.generation} cargada ({self._current.bm25.n_chunks} chunks)")
+        return True
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                old = self.generation
+                if self.reload():
+                    for listener in self._listeners:
+                        await listener(old, self.generation)
+            except Exception as e:
+                logging.exception(f"KB reload error: {e}")
+
+    async def search(self, query: str, k: int = 4) -> List[SearchHit]:
+        return await self._current.search(query, k)
+
+    def close(self):
+        if self._task:
+            self._task.cancel()
+
+
+def format_context(hits: List[SearchHit]) -> str:
+    """Une los chunks recuperados en el bloque "Contexto" del prompt (ver PromptBuilder)."""
+    parts = []
+    for hit in hits:
+        c = hit.chunk
+        header = f"### {c.title}" + (f" — {c.heading}" if c.heading else "")
+        parts.append(f"{header}\n{c.text}")
+    return "\n\n".join(parts)
@@ -0,0 +1,54 @@
+import re
+import unicodedata
+from typing import List
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aqui asi aun cada como con contra cual cuales
+cuando de del desde donde dos el ella ellas ellos en entre era eran es esa esas ese eso esos esta estan
+estas este esto estos fue fueron ha hay la las le les lo los mas me mi mis mucho muy nada ni no nos nosotros
+o os otra otras otro otros para pero poco por porque que quien se sea ser si sin sobre son su sus tambien
+te tengo ti tiene tienen todo todos tu tus un una unas uno unos usted ustedes y ya yo
+hola buenas buenos dias tardes noches gracias favor quisiera quiero saber puedo pueden podria
+""".split())
+
+# Sufijos derivacionales, del más largo al más corto (stemmer ligero estilo Savoy/Snowball).
+_SUFFIXES = (
+    "amientos", "imientos", "aciones", "uciones", "amiento", "imiento", "ivamente", "amente",
+    "adoras", "adores", "ancias", "encias", "idades", "logias", "mente", "acion", "ucion",
+    "adora", "ador", "ancia", "encia", "idad", "logia", "ables", "ibles", "istas",
+    "able", "ible", "ista", "osos", "osas", "ivos", "ivas", "oso", "osa", "ivo", "iva",
+)
+
+
+def fold(text: str) -> str:
+    """Minúsculas y sin acentos/diéresis (también ñ -> n)."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def stem(word: str) -> str:
+    """Stemmer ligero para español sobre palabras ya normalizadas con `fold`."""
+    if len(word) <= 4 or word.isdigit():
+        return word
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            word = word[: -len(suffix)]
+            break
+    # plurales
+    if word.endswith("ces") and len(word) > 5:
+        word = word[:-3] + "z"
+    elif word.endswith("es") and len(word) > 5:
+        word = word[:-2]
+    elif word.endswith("s") and len(word) > 4:
+        word = word[:-1]
+    # vocal final (género/número residual)
+    if word[-1] in "aeo" and len(word) > 4:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens normalizados (fold + stopwords + stem) para indexar y consultar."""
+    return [stem(t) for t in _TOKEN_RE.findall(fold(text)) if t not in STOPWORDS]
@@ -0,0 +1,54 @@
+import os
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+from app.subagents.rag.embeddings import normalize
+
+
+def write_vectors(path: str | Path, vectors: np.ndarray) -> Path:
+    """
+    Guarda la matriz de embeddings como un único `.npy` float32 contiguo y
+    normalizado. La fila i corresponde al chunk i del índice BM25 de la
+    misma generación.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, np.ascontiguousarray(normalize(vectors)))
+    os.replace(tmp, path)
+    return path
+
+
+class VectorIndex:
+    """
+    Índice denso de sólo lectura. La matriz se abre con `mmap_mode="r"`:
+    N workers de uvicorn comparten las mismas páginas del page cache en vez
+    de cargar N copias.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.matrix: np.ndarray = np.load(self.path, mmap_mode="r")
+        if self.matrix.dtype != np.float32 or self.matrix.ndim != 2:
+            raise ValueError(f"{self.path}: se esperaba una matriz float32 2D")
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def search(self, query: np.ndarray, k: int = 4) -> List[Tuple[int, float]]:
+        """Top-k por similitud coseno: un matmul + argpartition."""
+        n = len(self)
+        if n == 0:
+            return []
+        scores = self.matrix @ np.asarray(query, dtype=np.float32).reshape(-1)
+        k = min(k, n)
+        top = np.argpartition(scores, n - k)[n - k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(i), float(scores[i])) for i in top]
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import os
+import socket
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+Entry = Tuple[str, Dict[str, str]]
+Handler = Callable[[str, Dict[str, str]], Awaitable[None]]
+
+
+def default_consumer_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class StreamConsumer:
+    """
+    Consumidor de un Redis Stream dentro de un consumer group.
+
+    - Lee con XREADGROUP sólo tantas entradas como slots libres hay
+      (`concurrency`), así un LLM lento aplica backpressure en vez de
+      acumular corrutinas.
+    - Cada entrada se confirma con XACK sólo si el handler terminó bien;
+      si falla queda pendiente para este consumer.
+    - Periódicamente reclama con XAUTOCLAIM las entradas pendientes que
+      llevan más de `claim_idle_ms` sin ack (consumers caídos o errores).
+      XAUTOCLAIM también devuelve las que este consumer sigue procesando
+      (un turno lento): esas no se vuelven a despachar.
+    """
+
+    def __init__(
+        self,
+        r: Redis,
+        stream: str,
+        group: str,
+        handler: Handler,
+        consumer: str | None = None,
+        concurrency: int = 16,
+        block_ms: int = 5000,
+        claim_idle_ms: int = 60000,
+        claim_interval_ms: int = 15000,
+    ):
+        self._r = r
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer or default_consumer_name()
+        self._handler = handler
+        self._concurrency = concurrency
+        self._block_ms = block_ms
+        self._claim_idle_ms = claim_idle_ms
+        self._claim_interval = claim_interval_ms / 1000.0
+        self._slots = asyncio.Semaphore(concurrency)
+        self._inflight: set[asyncio.Task] = set()
+        self._active: set[str] = set()  # entry ids en curso
+        self._loops: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+
+    async def ensure_group(self):
+        try:
+            await self._r.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def start(self):
+        await self.ensure_group()
+        self._stopping.clear()
+        self._loops = [
+            asyncio.create_task(self._read_loop()),
+            asyncio.create_task(self._claim_loop()),
+        ]
+
+    async def stop(self):
+        """Deja de leer y espera a que terminen los handlers en curso."""
+        self._stopping.set()
+        for task in self._loops:
+            task.cancel()
+        await asyncio.gather(*self._loops, return_exceptions=True)
+        self._loops = []
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    async def _free_slots(self) -> int:
+        # Espera al menos un slot libre antes de leer.
+        await self._slots.acquire()
+        self._slots.release()
+        return max(1, self._concurrency - len(self._inflight))
+
+    async def _read_loop(self):
+        while not self._stopping.is_set():
+            try:
+                count = await self._free_slots()
+                resp = await self._r.xreadgroup(
+                    self.group, self.consumer, {self.stream: ">"},
+                    count=count, block=self._block_ms,
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.exception(f"xreadgroup error on {self.stream}: {e}")
+                await asyncio.sleep(1)
+                continue
+            for _, entries in resp or []:
+                await self._dispatch(entries)
+
+    async def _claim_loop(self):
+        while not self._stopping.is_set():
+            await asyncio.sleep(self._claim_interval)
+            try:
+                start = "0-0"
+                while True:
+                    count = await self._free_slots()
+                    start, entries, *_ = await self._r.xautoclaim(
+                        self.stream, self.group, self.consumer,
+                        min_idle_time=self._claim_idle_ms, start_id=start, count=count,
+                    )
+                    if entries:
+                        n = await self._dispatch(entries)
+                        if n:
+                            logging.warning(f"Reclamadas {n} entradas atascadas de {self.stream}")
+                    if start in ("0-0", b"0-0"):
+                        break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.exception(f"xautoclaim error on {self.stream}: {e}")
+
+    async def _dispatch(self, entries: List[Entry]) -> int:
+        dispatched = 0
+        for entry_id, fields in entries:
+            if fields is None:
+                # La entrada fue recortada (MAXLEN) mientras estaba pendiente.
+                await self._r.xack(self.stream, self.group, entry_id)
+                continue
+            if entry_id in self._active:
+                continue
+            self._active.add(entry_id)
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run(entry_id, fields))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+            dispatched += 1
+        return dispatched
+
+    async def _run(self, entry_id: str, fields: Dict[str, str]):
+        try:
+            await self._handler(entry_id, fields)
+            await self._r.xack(self.stream, self.group, entry_id)
+        except Exception as e:
+            logging.exception(f"handler error for {self.stream} {entry_id}: {e}")
+        finally:
+            self._active.discard(entry_id)
+            self._slots.release()
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Dict, Tuple
+
+Handler = Callable[[str, Dict[str, str]], Awaitable[None]]
+Heartbeat = Callable[[str, Dict[str, str]], Awaitable[None]]
+
+
+class Overloaded(Exception):
+    """No hubo slot de LLM dentro del SLO de espera: se responde con el texto de carga."""
+
+
+class LLMLimiter:
+    """
+    Tope de llamadas al LLM en curso en el worker, con cola FIFO.
+
+    `slot(timeout_s)` espera un slot hasta `timeout_s`; si no llega, lanza
+    Overloaded. Un slot liberado pasa directo al primero de la cola (sin
+    carrera con los que llegan después).
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.inflight = 0
+        self.shed = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, timeout_s: float):
+        if self.inflight < self.max_concurrency and not self._waiters:
+            self.inflight += 1
+            return
+        if timeout_s <= 0:
+            self.shed += 1
+            raise Overloaded()
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait((fut,), timeout=timeout_s)
+        except asyncio.CancelledError:
+            self._abandon(fut)
+            raise
+        if not fut.done():
+            self._abandon(fut)
+            self.shed += 1
+            raise Overloaded()
+
+    def _abandon(self, fut: asyncio.Future):
+        if fut.done() and not fut.cancelled():
+            # El slot llegó justo al cancelar: se pasa al siguiente
+            self.release()
+            return
+        fut.cancel()
+        try:
+            self._waiters.remove(fut)
+        except ValueError:
+            pass
+
+    def release(self):
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)  # el slot cambia de dueño, inflight no cambia
+                return
+        self.inflight -= 1
+
+    @asynccontextmanager
+    async def slot(self, timeout_s: float):
+        await self.acquire(timeout_s)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class KeyedLock:
+    """Un asyncio.Lock por clave, creado al vuelo y descartado cuando nadie lo usa."""
+
+    def __init__(self):
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        lock, users = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+
+class ReplyExecutor:
+    """
+    Handler del StreamConsumer que envuelve al TurnHandler:
+
+    - A lo sumo un turno en curso por wa_id en este worker; un segundo turno
+      del mismo usuario (p. ej. reclamado con XAUTOCLAIM) espera en orden.
+    - Mientras el turno está en el worker (esperando al usuario, al LLM o
+      generando) publica un heartbeat cada `heartbeat_ms`, con el que el
+      webhook renueva el lock del usuario. Si el worker muere, el lock vence
+      solo; si el lock se pierde, el fence hace que la respuesta se descarte.
+
+    El tope de llamadas al LLM en curso y el SLO de espera los aplica el
+    TurnHandler con un LLMLimiter (un acierto de caché no ocupa slot). Que
+    un turno reclamado no se responda dos veces lo resuelven el
+    StreamConsumer (no redespacha entradas en curso) y el TurnHandler
+    (dueño por turn_id).
+    """
+
+    def __init__(self, handler: Handler, heartbeat: Heartbeat, heartbeat_ms: int):
+        self._handler = handler
+        self._heartbeat = heartbeat
+        self._interval = heartbeat_ms / 1000.0
+        self._users = KeyedLock()
+
+    async def __call__(self, entry_id: str, fields: Dict[str, str]):
+        beat = asyncio.create_task(self._beat(entry_id, fields))
+        try:
+            async with self._users.hold(fields["wa_id"]):
+                await self._handler(entry_id, fields)
+        finally:
+            beat.cancel()
+            await asyncio.gather(beat, return_exceptions=True)
+
+    async def _beat(self, entry_id: str, fields: Dict[str, str]):
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                await self._heartbeat(entry_id, fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"heartbeat error for {fields['wa_id']} ({entry_id}): {e}")
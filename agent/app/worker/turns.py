@@ -0,0 +1,192 @@
+import json
+import logging
+import time
+from typing import Dict
+
+from openai import AsyncOpenAI
+from redis.asyncio import Redis
+
+from app.core.settings import settings
+from app.subagents.conversation_agent.llm_call import conversational_llm, conversational_llm_stream
+from app.subagents.conversation_agent.prompt_builder import PromptBuilder, PromptPlan, TokenCounter
+from app.subagents.conversation_agent.response_cache import ResponseCache
+from app.subagents.conversation_agent.segmenter import SentenceSegmenter
+from app.subagents.rag.retriever import LiveRetriever
+from app.worker.consumer import default_consumer_name
+from app.worker.executor import LLMLimiter, Overloaded
+
+
+def _k_reply(turn_id): return f"wa:turn:{turn_id}:reply"
+
+
+class TurnHandler:
+    """
+    Procesa un turno normalizado publicado por whatsapp_webhook en
+    TURNS_STREAM y publica la respuesta en OUTBOUND_STREAM, desde donde
+    el webhook la envía por WhatsApp.
+
+    La llamada al LLM pasa por `limiter`: si el turno lleva más de
+    `queue_slo_ms` esperando (desde que el webhook lo publicó), se responde
+    con OVERLOAD_REPLY en vez de encolarlo más.
+
+    Cada salida lleva el `trace_id` del turno; la final agrega lo medido
+    aquí (origen, espera por el limiter, latencia y tokens del LLM), que el
+    webhook expone en /metrics.
+
+    Antes de responder, el worker se adueña del turno (SET NX sobre el
+    turn_id, con lease de `lease_ms` que renueva el heartbeat). Si el turno
+    ya tiene otro dueño (otro worker lo reclamó con XAUTOCLAIM mientras el
+    primero seguía generando, o ya se respondió y el XACK se perdió), se
+    confirma sin publicar nada.
+    """
+
+    def __init__(self, r: Redis, openai_client: AsyncOpenAI, retriever: LiveRetriever,
+                 cache: ResponseCache | None = None, limiter: LLMLimiter | None = None,
+                 queue_slo_ms: int = 10000, owner: str | None = None, lease_ms: int = 12000,
+                 done_ttl_s: int = 24 * 60 * 60):
+        self._r = r
+        self._owner = owner or default_consumer_name()
+        self._lease_ms = lease_ms
+        self._done_ttl_s = done_ttl_s
+        self._openai = openai_client
+        self._retriever = retriever
+        self._cache = cache
+        self._limiter = limiter or LLMLimiter(settings.LLM_MAX_CONCURRENCY)
+        self._queue_slo_s = queue_slo_ms / 1000.0
+        self._prompts = PromptBuilder(settings.PROMPT_TOKEN_BUDGET, TokenCounter(settings.PROMPT_ENCODING))
+
+    async def __call__(self, entry_id: str, fields: Dict[str, str]):
+        wa_id = fields["wa_id"]
+        text = fields["text"]
+        trace = fields.get("trace_id") or "-"
+        logging.info(f"→ Turno {entry_id} de {wa_id} [trace {trace}]: {text}")
+        if not await self._own(entry_id):
+            logging.warning(f"Turno {entry_id} de {wa_id} [trace {trace}] ya respondido o en curso en otro worker")
+            return
+
+        generation = self._retriever.generation
+        hits = await self._retriever.search(text, settings.RAG_TOP_K)
+        # Historial de la sesión (sin la tanda actual) que adjunta el webhook
+        history = json.loads(fields.get("history") or "[]")
+
+        # Sólo turnos sin historial: la respuesta a "¿y el sábado?" o "sí"
+        # depende de la conversación, que no forma parte de la clave
+        cache_key = reply = None
+        if self._cache is not None and not history:
+            cache_key = self._cache.key(text, [h.chunk.id for h in hits], generation)
+            reply = await self._cache.get(cache_key)
+
+        if reply is not None:
+            logging.info(f"Respuesta de caché para {wa_id} ({cache_key}) [trace {trace}]")
+            await self._publish(entry_id, fields, reply, seq=0, final=True, stats={"source": "cache"})
+            return
+
+        plan = self._prompts.build(text, hits, history)
+        logging.info(
+            f"Prompt para {wa_id} [trace {trace}]: {plan.tokens} tokens, {plan.tokens_saved} ahorrados "
+            f"({plan.dropped_chunks} chunks, {plan.dropped_turns} turnos recortados)"
+        )
+        t_queue = time.perf_counter()
+        try:
+            async with self._limiter.slot(self._queue_slo_s - self._waited_s(entry_id)):
+                queue_s = time.perf_counter() - t_queue
+                if settings.LLM_STREAMING:
+                    reply = await self._stream_reply(entry_id, fields, plan, queue_s)
+                else:
+                    t0, usage = time.perf_counter(), {}
+                    reply = await conversational_llm(plan, openai_client=self._openai, usage=usage)
+                    stats = self._llm_stats(plan, usage, queue_s, time.perf_counter() - t0)
+                    await self._publish(entry_id, fields, reply, seq=0, final=True, stats=stats)
+        except Overloaded:
+            logging.warning(
+                f"Turno {entry_id} de {wa_id} [trace {trace}] descartado por carga: "
+                f"{self._waited_s(entry_id):.1f}s en cola, "
+                f"{self._limiter.inflight} LLM en curso, {self._limiter.queued} esperando"
+            )
+            stats = {"source": "overload", "queue_ms": f"{(time.perf_counter() - t_queue) * 1000:.0f}"}
+            await self._publish(entry_id, fields, settings.OVERLOAD_REPLY, seq=0, final=True, stats=stats)
+            return
+
+        logging.info(f"← Respuesta para {wa_id} [trace {trace}]: {reply}")
+        if cache_key is not None and reply:
+            await self._cache.set(cache_key, reply)
+
+    async def _stream_reply(self, entry_id: str, fields: Dict[str, str], plan: PromptPlan, queue_s: float) -> str:
+        """
+        Consume el stream del LLM y publica cada oración/párrafo en cuanto
+        está completo, precedido de un indicador de "escribiendo".
+        """
+        t0 = time.perf_counter()
+        await self._publish(entry_id, fields, kind="typing")
+
+        segmenter = SentenceSegmenter(settings.STREAM_MIN_SEGMENT_CHARS)
+        parts = []
+        usage: Dict[str, int] = {}
+        async for delta in conversational_llm_stream(plan, self._openai, usage=usage):
+            for segment in segmenter.feed(delta):
+                await self._publish(entry_id, fields, segment, seq=len(parts))
+                if not parts:
+                    logging.info(
+                        f"Primer segmento para {fields['wa_id']} [trace {fields.get('trace_id') or '-'}] "
+                        f"en {(time.perf_counter() - t0) * 1000:.0f} ms"
+                    )
+                parts.append(segment)
+
+        tail = segmenter.flush()
+        if tail:
+            await self._publish(entry_id, fields, tail, seq=len(parts))
+            parts.append(tail)
+        # Cierra el turno: el webhook suelta el lock del usuario
+        stats = self._llm_stats(plan, usage, queue_s, time.perf_counter() - t0)
+        await self._publish(entry_id, fields, seq=len(parts), final=True, kind="end", stats=stats)
+        return " ".join(parts)
+
+    @staticmethod
+    def _llm_stats(plan: PromptPlan, usage: Dict[str, int], queue_s: float, llm_s: float) -> Dict[str, str]:
+        return {
+            "source": "llm",
+            "queue_ms": f"{queue_s * 1000:.0f}",
+            "llm_ms": f"{llm_s * 1000:.0f}",
+            # Si la API no reporta usage, la entrada se estima con el conteo del PromptBuilder
+            "tokens_in": str(usage.get("input_tokens", plan.tokens)),
+            "tokens_out": str(usage["output_tokens"]) if "output_tokens" in usage else "",
+        }
+
+    @staticmethod
+    def _waited_s(entry_id: str) -> float:
+        # El ID de la entrada es el ms (reloj de Redis) en que el webhook la publicó
+        return max(0.0, time.time() - int(entry_id.split("-")[0]) / 1000.0)
+
+    async def _own(self, turn_id: str) -> bool:
+        """Toma el turno, o confirma que ya es de este worker (reintento tras un error)."""
+        if await self._r.set(_k_reply(turn_id), self._owner, nx=True, px=self._lease_ms):
+            return True
+        return await self._r.get(_k_reply(turn_id)) == self._owner
+
+    async def heartbeat(self, entry_id: str, fields: Dict[str, str]):
+        """El turno sigue en curso: el webhook renueva el lock del usuario y aquí se renueva el lease."""
+        await self._publish(entry_id, fields, kind="heartbeat")
+        if await self._r.get(_k_reply(entry_id)) == self._owner:
+            await self._r.pexpire(_k_reply(entry_id), self._lease_ms)
+
+    async def _publish(self, entry_id: str, fields: Dict[str, str], text: str = "", seq: int = 0,
+                       final: bool = False, kind: str = "text", stats: Dict[str, str] | None = None):
+        await self._r.xadd(
+            settings.OUTBOUND_STREAM,
+            {
+                "kind": kind,
+                "wa_id": fields["wa_id"],
+                "text": text,
+                "seq": str(seq),
+                "final": "1" if final else "0",
+                "turn_id": entry_id,
+                "msg_ids": fields.get("msg_ids", json.dumps([])),
+                "fence": fields.get("fence", ""),
+                "trace_id": fields.get("trace_id", ""),
+                **(stats or {}),
+            },
+            maxlen=settings.OUTBOUND_STREAM_MAXLEN,
+            approximate=True,
+        )
+        if final:
+            await self._r.set(_k_reply(entry_id), self._owner, ex=self._done_ttl_s)
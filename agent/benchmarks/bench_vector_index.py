@@ -0,0 +1,94 @@
+"""
+Latencia de consulta y memoria por worker de VectorIndex (mmap).
+
+Para cada tamaño genera una matriz aleatoria normalizada en disco, levanta
+WORKERS procesos que la abren con mmap y consultan, y reporta p50/p99 de
+un top-k y RSS/PSS de cada worker (PSS reparte las páginas compartidas,
+así que muestra lo que realmente cuesta cada worker extra).
+
+Uso (desde agent/):
+    python -m benchmarks.bench_vector_index [10000 100000 1000000]
+"""
+import multiprocessing as mp
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.subagents.rag.vector_index import VectorIndex, write_vectors
+
+DIM = 256
+K = 8
+QUERIES = 200
+WORKERS = 4
+
+
+def _mem_kb() -> tuple[int, int]:
+    rss = pss = 0
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Rss:"):
+                rss = int(line.split()[1])
+            elif line.startswith("Pss:"):
+                pss = int(line.split()[1])
+    return rss, pss
+
+
+def _worker(path: str, barrier, out):
+    index = VectorIndex(path)
+    rng = np.random.default_rng()
+    queries = rng.standard_normal((QUERIES, index.dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    index.search(queries[0], K)  # calienta el page cache
+    barrier.wait()  # todos los workers con la matriz mapeada a la vez
+    lat = []
+    for q in queries:
+        t0 = time.perf_counter()
+        index.search(q, K)
+        lat.append((time.perf_counter() - t0) * 1000)
+    rss, pss = _mem_kb()
+    barrier.wait()
+    out.put((statistics.median(lat), sorted(lat)[int(len(lat) * 0.99) - 1], rss, pss))
+
+
+def run(n: int, tmp: Path):
+    path = tmp / f"vec_{n}.npy"
+    rng = np.random.default_rng(0)
+    matrix = np.empty((n, DIM), dtype=np.float32)
+    for start in range(0, n, 100_000):
+        matrix[start:start + 100_000] = rng.standard_normal((min(100_000, n - start), DIM))
+    write_vectors(path, matrix)
+    del matrix
+
+    ctx = mp.get_context("spawn")
+    barrier, out = ctx.Barrier(WORKERS), ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(str(path), barrier, out)) for _ in range(WORKERS)]
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    path.unlink()
+
+    p50 = statistics.median(r[0] for r in results)
+    p99 = max(r[1] for r in results)
+    rss = statistics.mean(r[2] for r in results) / 1024
+    pss = statistics.mean(r[3] for r in results) / 1024
+    size = n * DIM * 4 / 2**20
+    print(f"{n:>9,} | {size:>8.0f} | {p50:>7.2f} {p99:>7.2f} | {rss:>8.0f} {pss:>8.0f}")
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    print(f"dim={DIM} k={K} workers={WORKERS}")
+    print(f"{'chunks':>9} | {'matrix MB':>8} | {'p50 ms':>7} {'p99 ms':>7} | {'RSS MB':>8} {'PSS MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            run(n, Path(tmp))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import signal
+
+from openai import AsyncOpenAI
+from redis.asyncio import Redis
+
+from app.core.settings import settings
+from app.subagents.conversation_agent.response_cache import ResponseCache
+from app.subagents.rag.build_index import get_embedder
+from app.subagents.rag.retriever import LiveRetriever
+from app.worker.consumer import StreamConsumer
+from app.worker.executor import LLMLimiter, ReplyExecutor
+from app.worker.turns import TurnHandler
+
+logging.basicConfig(level=logging.INFO)
+
+
+async def main():
+    r = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+    retriever = await LiveRetriever.open(
+        settings.KB_DOCS_DIR, settings.KB_INDEX_DIR, get_embedder(openai_client),
+        batch_size=settings.EMBEDDING_BATCH,
+        reload_interval_s=settings.KB_RELOAD_INTERVAL_S,
+        min_dense_score=settings.RAG_MIN_DENSE_SCORE,
+    )
+
+    cache = None
+    if settings.RESPONSE_CACHE_ENABLED:
+        cache = ResponseCache(r, ttl_s=settings.RESPONSE_CACHE_TTL_S, max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES)
+
+        async def purge_old_generation(old: int, new: int):
+            purged = await cache.purge_generation(old)
+            stats = await cache.stats()
+            logging.info(f"KB {old} → {new}: {purged} respuestas en caché invalidadas; stats={stats}")
+
+        retriever.on_reload(purge_old_generation)
+
+    turns = TurnHandler(
+        r, openai_client, retriever, cache,
+        limiter=LLMLimiter(settings.LLM_MAX_CONCURRENCY),
+        queue_slo_ms=settings.LLM_QUEUE_SLO_MS,
+        lease_ms=settings.REPLY_LEASE_MS,
+        done_ttl_s=settings.REPLY_DONE_TTL_S,
+    )
+    consumer = StreamConsumer(
+        r,
+        stream=settings.TURNS_STREAM,
+        group=settings.WORKER_GROUP,
+        handler=ReplyExecutor(turns, turns.heartbeat, settings.LOCK_HEARTBEAT_MS),
+        concurrency=settings.WORKER_CONCURRENCY,
+        block_ms=settings.WORKER_BLOCK_MS,
+        claim_idle_ms=settings.WORKER_CLAIM_IDLE_MS,
+        claim_interval_ms=settings.WORKER_CLAIM_INTERVAL_MS,
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await consumer.start()
+    logging.info(f"Agent worker {consumer.consumer} escuchando {consumer.stream} (group={consumer.group})")
+    try:
+        await stop.wait()
+    finally:
+        await consumer.stop()
+        retriever.close()
+        await openai_client.close()
+        await r.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
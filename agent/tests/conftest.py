@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Los tests corren desde agent/ (o desde la raíz del repo) e importan `app`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings exige estas variables aunque los tests no las usen
+for _name in ("OPENAI_API_KEY", "REDIS_URL"):
+    os.environ.setdefault(_name, "test")
@@ -0,0 +1,137 @@
+"""PromptBuilder (presupuesto de tokens) y el conteo de TokenCounter."""
+import logging
+import math
+
+import pytest
+
+from app.subagents.conversation_agent import prompt_builder
+from app.subagents.conversation_agent.prompt import CONVERSATION_PROMPT
+from app.subagents.conversation_agent.prompt_builder import (
+    FALLBACK_CHARS_PER_TOKEN, FALLBACK_MARGIN, MESSAGE_OVERHEAD, PromptBuilder, TokenCounter,
+)
+from app.subagents.rag.bm25 import SearchHit
+from app.subagents.rag.documents import Chunk
+
+
+class WordCounter(TokenCounter):
+    """Una palabra = un token: los tamaños de los tests se leen a ojo."""
+
+    def __init__(self):
+        self._enc = None
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+
+def _hit(n: int, words: int) -> SearchHit:
+    # format_context suma el encabezado "### Doc n": words + 3 tokens
+    return SearchHit(Chunk(f"doc#{n}", "doc", f"Doc {n}", "", " ".join(["palabra"] * words)), 1.0 / (n + 1))
+
+
+def _turn(role: str, words: int) -> dict:
+    return {"role": role, "content": " ".join(["hola"] * words)}
+
+
+def _builder(extra: int) -> PromptBuilder:
+    """Presupuesto = lo fijo (instrucciones + turno de 1 palabra) + `extra`."""
+    base = PromptBuilder(10 ** 6, WordCounter()).build("hola", []).tokens
+    return PromptBuilder(base + extra, WordCounter())
+
+
+def test_everything_fits_in_cache_friendly_order():
+    builder = _builder(1000)
+    history = [_turn("user", 3), _turn("assistant", 4)]
+
+    plan = builder.build("hola", [_hit(0, 5), _hit(1, 5)], history)
+
+    assert plan.instructions == CONVERSATION_PROMPT
+    assert [m["role"] for m in plan.input] == ["user", "assistant", "developer", "user"]
+    assert plan.input[-1] == {"role": "user", "content": "hola"}
+    assert plan.chunk_ids == ["doc#0", "doc#1"]
+    assert (plan.dropped_chunks, plan.dropped_turns, plan.tokens_saved) == (0, 0, 0)
+    assert plan.tokens <= builder.budget
+
+
+def test_trims_oldest_turns_when_history_is_the_larger_side():
+    builder = _builder(40)
+    history = [_turn("user", 30), _turn("assistant", 30), _turn("user", 5)]
+
+    plan = builder.build("hola", [_hit(0, 10)], history)
+
+    assert plan.dropped_turns == 2 and plan.dropped_chunks == 0
+    assert plan.input[0] == history[2]
+    assert plan.tokens <= builder.budget
+    assert plan.tokens_saved == 2 * (30 + MESSAGE_OVERHEAD)
+
+
+def test_trims_lowest_ranked_chunks_when_context_is_the_larger_side():
+    builder = _builder(40)
+    hits = [_hit(0, 20), _hit(1, 20), _hit(2, 20)]
+
+    plan = builder.build("hola", hits, [_turn("user", 5)])
+
+    assert plan.dropped_chunks == 2 and plan.dropped_turns == 0
+    assert plan.chunk_ids == ["doc#0"]
+    assert plan.tokens <= builder.budget
+
+
+def test_alternates_sides_until_it_fits():
+    builder = _builder(40)
+    history = [_turn("user", 25), _turn("assistant", 25)]
+    hits = [_hit(0, 20), _hit(1, 20)]
+
+    plan = builder.build("hola", hits, history)
+
+    assert plan.tokens <= builder.budget
+    assert plan.dropped_turns >= 1 and plan.dropped_chunks >= 1
+    assert plan.tokens + plan.tokens_saved == PromptBuilder(10 ** 6, WordCounter()).build("hola", hits, history).tokens
+
+
+def test_over_budget_with_nothing_to_trim_warns(caplog):
+    builder = _builder(0)
+
+    with caplog.at_level(logging.WARNING):
+        plan = builder.build("hola " * 50, [])
+
+    assert plan.tokens > builder.budget
+    assert "excede el presupuesto" in caplog.text
+
+
+def test_fallback_counts_conservatively_and_warns(monkeypatch, caplog):
+    monkeypatch.setattr(prompt_builder, "tiktoken", None)
+
+    with caplog.at_level(logging.WARNING):
+        counter = TokenCounter()
+
+    text = "¿Cuál es el horario del 24/12? https://example.com/horarios"
+    assert not counter.exact
+    assert "tiktoken" in caplog.text
+    assert counter.count("") == 0
+    assert counter.count(text) == math.ceil(len(text) / FALLBACK_CHARS_PER_TOKEN * FALLBACK_MARGIN)
+    assert counter.count(text) > len(text) / 4
+    assert counter.message({"role": "user", "content": text}) == counter.count(text) + MESSAGE_OVERHEAD
+
+
+def test_fallback_when_encoding_cannot_load(monkeypatch, caplog):
+    class Broken:
+        @staticmethod
+        def get_encoding(name):
+            raise OSError("sin red para bajar el encoding")
+
+    monkeypatch.setattr(prompt_builder, "tiktoken", Broken)
+
+    with caplog.at_level(logging.WARNING):
+        counter = TokenCounter("o200k_base")
+
+    assert not counter.exact
+    assert "o200k_base" in caplog.text
+    assert counter.count("abc") == math.ceil(3 / FALLBACK_CHARS_PER_TOKEN * FALLBACK_MARGIN)
+
+
+def test_exact_count_with_tiktoken():
+    pytest.importorskip("tiktoken")
+    counter = TokenCounter("o200k_base")
+    if not counter.exact:
+        pytest.skip("encoding no disponible (sin red)")
+
+    assert 0 < counter.count("hola, ¿cómo estás?") < 10
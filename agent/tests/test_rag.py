@@ -0,0 +1,230 @@
+"""Índice BM25, índice vectorial, ids de chunks y reindex incremental del KB."""
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from app.subagents.rag.bm25 import BM25Index, write_index
+from app.subagents.rag.documents import Chunk, chunk_document
+from app.subagents.rag.embeddings import HashingEmbedder
+from app.subagents.rag.indexer import reindex
+from app.subagents.rag.manifest import VECTORS_FILE, current_generation, read_manifest
+from app.subagents.rag.retriever import LiveRetriever
+from app.subagents.rag.vector_index import VectorIndex, write_vectors
+
+HORARIOS = """---
+doc_id: horarios
+title: Horarios
+effective_from: 2026-01-01
+---
+# Horarios de atención
+
+Abrimos de lunes a viernes de 9 a 18 horas.
+
+# Feriados
+
+Los feriados nacionales la sucursal permanece cerrada.
+"""
+
+ENVIOS = """---
+doc_id: envios
+title: Envíos
+---
+# Costos
+
+El envío a domicilio cuesta 500 pesos y demora tres días hábiles.
+"""
+
+
+def _chunk(n: int, text: str) -> Chunk:
+    return Chunk(f"doc#{n}", "doc", "Doc", "", text)
+
+
+def _kb(tmp_path, **docs):
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir(exist_ok=True)
+    for name in list(docs_dir.glob("*.md")):
+        name.unlink()
+    for name, text in docs.items():
+        (docs_dir / f"{name}.md").write_text(text, encoding="utf-8")
+    return docs_dir
+
+
+def test_bm25_ranks_matching_chunk_and_round_trips_chunks(tmp_path):
+    chunks = [
+        _chunk(0, "El envío a domicilio demora tres días."),
+        _chunk(1, "Horario de atención: lunes a viernes."),
+        _chunk(2, "Aceptamos tarjetas de crédito y débito."),
+    ]
+    index = BM25Index.build(tmp_path / "kb.bm25", chunks)
+
+    hits = index.search("¿cuánto demora el envío?", k=2)
+
+    assert index.n_chunks == 3
+    assert hits[0].chunk == chunks[0]
+    assert index.scores_for("inexistentísimo") == {}
+    assert [index.chunk(i) for i in range(3)] == chunks
+    index.close()
+
+
+def test_bm25_rarer_terms_weigh_more(tmp_path):
+    chunks = [_chunk(0, "tarjeta efectivo"), _chunk(1, "tarjeta"), _chunk(2, "tarjeta transferencia")]
+    index = BM25Index.build(tmp_path / "kb.bm25", chunks)
+
+    scores = index.scores_for("efectivo tarjeta")
+
+    assert set(scores) == {0, 1, 2}
+    assert max(scores, key=scores.get) == 0  # "efectivo" aparece en un solo chunk
+    index.close()
+
+
+def test_bm25_uses_given_tokens_instead_of_retokenizing(tmp_path):
+    chunks = [_chunk(0, "texto viejo"), _chunk(1, "otro texto")]
+    index = BM25Index(write_index(tmp_path / "kb.bm25", chunks, tokens=[["zeta"], ["omega"]]))
+
+    assert list(index.scores_for("zeta")) == [0]
+    assert index.scores_for("viejo") == {}
+    assert index.chunk(0).text == "texto viejo"
+    index.close()
+
+
+def test_vector_index_normalizes_and_returns_top_k_by_cosine(tmp_path):
+    matrix = np.array([[3, 0, 0], [0, 2, 0], [1, 1, 0], [0, 0, -5]], dtype=np.float32)
+    index = VectorIndex(write_vectors(tmp_path / "v.npy", matrix))
+
+    top = index.search(np.array([1, 0.2, 0], dtype=np.float32), k=2)
+
+    assert (len(index), index.dim) == (4, 3)
+    assert np.allclose(np.linalg.norm(index.matrix, axis=1), 1.0)
+    assert [doc for doc, _ in top] == [0, 2]
+    assert top[0][1] > top[1][1]
+    assert len(index.search(np.ones(3, dtype=np.float32), k=10)) == 4
+
+
+def test_vector_index_rejects_wrong_dtype(tmp_path):
+    np.save(tmp_path / "v.npy", np.zeros((2, 3), dtype=np.float64))
+
+    with pytest.raises(ValueError):
+        VectorIndex(tmp_path / "v.npy")
+
+
+def test_chunk_ids_do_not_depend_on_position(tmp_path):
+    path = tmp_path / "horarios.md"
+    path.write_text(HORARIOS, encoding="utf-8")
+    before = {c.text: c.id for c in chunk_document(path)}
+    path.write_text(HORARIOS.replace("---\n# Horarios", "---\n# Novedades\n\nNueva sucursal.\n\n# Horarios"),
+                    encoding="utf-8")
+    after = {c.text: c.id for c in chunk_document(path)}
+
+    assert len(after) == len(before) + 1
+    assert all(after[text] == cid for text, cid in before.items())
+    assert before["Los feriados nacionales la sucursal permanece cerrada."].startswith("horarios#feriados-")
+
+
+def test_chunk_ids_are_unique_for_repeated_text(tmp_path):
+    path = tmp_path / "faq.md"
+    path.write_text("# FAQ\n\n" + "Sí.\n\n" + "x" * 800 + "\n\nSí.\n", encoding="utf-8")
+
+    ids = [c.id for c in chunk_document(path, max_chars=100)]
+
+    assert len(ids) == len(set(ids)) == 3
+
+
+def test_incremental_reindex_reuses_unchanged_chunks(tmp_path):
+    index_dir = tmp_path / "kb"
+    embedder = HashingEmbedder(32)
+
+    async def scenario():
+        docs = _kb(tmp_path, horarios=HORARIOS, envios=ENVIOS)
+        first = await reindex(docs, index_dir, embedder)
+        gen1 = current_generation(index_dir)
+        same = await reindex(docs, index_dir, embedder)
+        _kb(tmp_path, horarios=HORARIOS.replace("18 horas", "19 horas"), envios=ENVIOS)
+        second = await reindex(docs, index_dir, embedder)
+        return first, gen1, same, second
+
+    first, gen1, same, second = asyncio.run(scenario())
+    gen2 = current_generation(index_dir)
+    old, new = read_manifest(gen1), read_manifest(gen2)
+    old_vectors, new_vectors = np.load(gen1 / VECTORS_FILE), np.load(gen2 / VECTORS_FILE)
+
+    assert (first.generation, first.added, first.reused) == (1, 3, 0)
+    assert (same.published, same.generation) == (False, 1)
+    assert (second.generation, second.added, second.reused, second.removed) == (2, 1, 2, 1)
+    assert [t.removed_in for t in new.tombstones] == [2]
+    old_rows = {c.id: c.row for c in old.chunks}
+    for entry in new.chunks:
+        if entry.id in old_rows:
+            assert entry.added_in == 1
+            assert np.array_equal(new_vectors[entry.row], old_vectors[old_rows[entry.id]])
+        else:
+            assert entry.added_in == 2
+
+
+def test_front_matter_change_publishes_without_reembedding(tmp_path):
+    index_dir = tmp_path / "kb"
+
+    async def scenario():
+        docs = _kb(tmp_path, horarios=HORARIOS)
+        await reindex(docs, index_dir, HashingEmbedder(32))
+        _kb(tmp_path, horarios=HORARIOS.replace("2026-01-01", "2026-03-01"))
+        return await reindex(docs, index_dir, HashingEmbedder(32))
+
+    res = asyncio.run(scenario())
+    manifest = read_manifest(current_generation(index_dir))
+
+    assert res.published and res.added == 0
+    assert {c.effective_from for c in manifest.chunks} == {"2026-03-01"}
+    bm25 = BM25Index(current_generation(index_dir) / "kb.bm25")
+    assert bm25.chunk(0).meta["effective_from"] == "2026-03-01"
+    bm25.close()
+
+
+def test_tombstones_and_generations_expire_after_keep_generations(tmp_path):
+    index_dir = tmp_path / "kb"
+    versions = [HORARIOS.replace("18 horas", f"{h} horas") for h in (18, 19, 20, 21, 22)]
+
+    async def scenario():
+        tombstones = []
+        for text in versions:
+            docs = _kb(tmp_path, horarios=text)
+            await reindex(docs, index_dir, HashingEmbedder(32), keep_generations=2)
+            tombstones.append([t.removed_in for t in read_manifest(current_generation(index_dir)).tombstones])
+        return tombstones
+
+    tombstones = asyncio.run(scenario())
+
+    assert tombstones == [[], [2], [2, 3], [3, 4], [4, 5]]
+    assert sorted(p.name for p in index_dir.glob("gen-*")) == ["gen-000004", "gen-000005"]
+
+
+def test_concurrent_reindex_builds_a_single_generation(tmp_path):
+    index_dir = tmp_path / "kb"
+    docs = _kb(tmp_path, horarios=HORARIOS, envios=ENVIOS)
+
+    async def scenario():
+        return await asyncio.gather(*(reindex(docs, index_dir, HashingEmbedder(32)) for _ in range(3)))
+
+    results = asyncio.run(scenario())
+
+    assert sorted(r.published for r in results) == [False, False, True]
+    assert {r.generation for r in results} == {1}
+    assert [p.name for p in index_dir.glob("gen-*")] == ["gen-000001"]
+
+
+def test_live_retriever_builds_first_generation_and_searches(tmp_path):
+    docs = _kb(tmp_path, horarios=HORARIOS, envios=ENVIOS)
+
+    async def scenario():
+        live = await LiveRetriever.open(docs, tmp_path / "kb", HashingEmbedder(64), reload_interval_s=3600)
+        try:
+            return live.generation, await live.search("¿cuánto cuesta el envío a domicilio?", k=1)
+        finally:
+            live.close()
+
+    generation, hits = asyncio.run(scenario())
+
+    assert generation == 1
+    assert hits[0].chunk.doc_id == "envios"
+    assert json.loads(json.dumps(hits[0].chunk.to_dict()))["id"].startswith("envios#costos-")
@@ -0,0 +1,109 @@
+"""ResponseCache: scripts Lua de GET/SET, desalojo LRU y purge_generation sobre fakeredis[lua]."""
+import asyncio
+
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from app.subagents.conversation_agent import response_cache
+from app.subagents.conversation_agent.response_cache import ResponseCache, normalize_turn
+
+
+class Clock:
+    """Reemplaza al módulo `time` de response_cache: cada lectura avanza 1 ms."""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self) -> float:
+        self.now += 0.001
+        return self.now
+
+
+@pytest.fixture
+def run(monkeypatch):
+    """run(fn, **kw) corre `fn(r, cache)` con un ResponseCache sobre un Redis en memoria nuevo."""
+    monkeypatch.setattr(response_cache, "time", Clock())
+
+    def go(fn, **kw):
+        async def main():
+            r = FakeRedis(server=FakeServer(), decode_responses=True)
+            try:
+                return await fn(r, ResponseCache(r, **kw))
+            finally:
+                await r.aclose()
+        return asyncio.run(main())
+    return go
+
+
+def test_key_ignores_accents_punctuation_and_chunk_order():
+    cache = ResponseCache(FakeRedis(server=FakeServer()))
+
+    same = cache.key("¿A qué HORA abren?", ["b#x", "a#y"], 3) == cache.key("a que hora   abren", ["a#y", "b#x"], 3)
+
+    assert normalize_turn("¿Dónde   queda la sucursal?!") == "donde queda la sucursal"
+    assert same
+    assert cache.key("hola", ["a"], 3) != cache.key("hola", ["a"], 4)
+    assert cache.key("hola", ["a"], 3).startswith("llm:cache:3:")
+
+
+def test_get_and_set_round_trip_and_count_hits_and_misses(run):
+    async def scenario(r, cache):
+        key = cache.key("horario", ["h#1"], 1)
+        miss = await cache.get(key)
+        evicted = await cache.set(key, "De 9 a 18.")
+        hit = await cache.get(key)
+        return miss, evicted, hit, await r.ttl(key), await cache.stats()
+
+    miss, evicted, hit, ttl, stats = run(scenario, ttl_s=600)
+
+    assert miss is None and evicted == 0 and hit == "De 9 a 18."
+    assert 0 < ttl <= 600
+    assert stats == {"hits": 1, "misses": 1, "hit_rate": 0.5, "entries": 1}
+
+
+def test_set_evicts_least_recently_used(run):
+    async def scenario(r, cache):
+        keys = [cache.key(f"pregunta {i}", [], 1) for i in range(3)]
+        await cache.set(keys[0], "r0")
+        await cache.set(keys[1], "r1")
+        await cache.get(keys[0])  # el acceso lo vuelve el más reciente
+        evicted = await cache.set(keys[2], "r2")
+        return keys, evicted, [await r.get(k) for k in keys], await r.zrange(cache._lru, 0, -1)
+
+    keys, evicted, values, lru = run(scenario, max_entries=2)
+
+    assert evicted == 1
+    assert values == ["r0", None, "r2"]
+    assert lru == [keys[0], keys[2]]
+
+
+def test_get_of_expired_entry_is_a_miss_and_does_not_touch_lru(run):
+    async def scenario(r, cache):
+        key = cache.key("precio", [], 1)
+        await cache.set(key, "100")
+        score = await r.zscore(cache._lru, key)
+        await r.delete(key)  # venció el TTL
+        return await cache.get(key), await r.zscore(cache._lru, key) == score, await cache.stats()
+
+    value, same_score, stats = run(scenario)
+
+    assert value is None and same_score
+    assert (stats["hits"], stats["misses"]) == (0, 1)
+
+
+def test_purge_generation_only_removes_that_generation(run):
+    async def scenario(r, cache):
+        old = [cache.key(f"q{i}", [], 1) for i in range(700)]  # más que el COUNT del ZSCAN
+        new = cache.key("q0", [], 2)
+        for key in old + [new]:
+            await cache.set(key, "x")
+        purged = await cache.purge_generation(1)
+        left = await r.keys("llm:cache:1:*")
+        return purged, left, await r.get(new), await r.zrange(cache._lru, 0, -1)
+
+    purged, left, new_value, lru = run(scenario)
+
+    assert purged == 700
+    assert left == []
+    assert new_value == "x" and len(lru) == 1 and lru[0].startswith("llm:cache:2:")
@@ -0,0 +1,115 @@
+"""resolve_session function
+
+Revision ID: 3b8f1c2d7a41
+Revises: e42c5f6a9e58
+Create Date: 2025-11-03 10:12:44.218530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8f1c2d7a41'
+down_revision: Union[str, Sequence[str], None] = 'e42c5f6a9e58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Resuelve (y crea si falta) usuario → conversación → sesión activa de 24h
+# en una sola llamada. El camino común (sesión vigente) es un SELECT sin
+# locks; si hay que crear o rotar algo, un advisory lock por teléfono
+# serializa los webhooks concurrentes del mismo usuario hasta el commit.
+RESOLVE_SESSION_SQL = """
+CREATE OR REPLACE FUNCTION resolve_session(
+    p_phone varchar,
+    p_name varchar DEFAULT NULL,
+    p_channel varchar DEFAULT 'whatsapp',
+    p_ttl interval DEFAULT interval '24 hours'
+)
+RETURNS TABLE (user_id uuid, conversation_id uuid, session_id uuid, expires_at timestamptz, created boolean)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_user uuid;
+    v_conv uuid;
+    v_sess uuid;
+    v_exp timestamptz;
+BEGIN
+    SELECT u.id, c.id, s.id, s.expires_at INTO v_user, v_conv, v_sess, v_exp
+    FROM users u
+    JOIN conversations c ON c.user_id = u.id AND c.channel = p_channel
+    JOIN sessions s ON s.conversation_id = c.id AND s.is_active
+    WHERE u.phone_number = p_phone AND (s.expires_at IS NULL OR s.expires_at > now())
+    ORDER BY c.created_at, s.started_at DESC
+    LIMIT 1;
+    IF FOUND THEN
+        RETURN QUERY SELECT v_user, v_conv, v_sess, v_exp, false;
+        RETURN;
+    END IF;
+
+    PERFORM pg_advisory_xact_lock(hashtext('resolve_session:' || p_phone));
+
+    INSERT INTO users (id, phone_number, name)
+    VALUES (gen_random_uuid(), p_phone, p_name)
+    ON CONFLICT (phone_number) DO NOTHING;
+    SELECT id INTO v_user FROM users WHERE phone_number = p_phone;
+
+    SELECT id INTO v_conv FROM conversations
+    WHERE user_id = v_user AND channel = p_channel
+    ORDER BY created_at LIMIT 1;
+    IF v_conv IS NULL THEN
+        INSERT INTO conversations (id, user_id, channel)
+        VALUES (gen_random_uuid(), v_user, p_channel)
+        RETURNING id INTO v_conv;
+    END IF;
+
+    -- Otro webhook pudo crearla mientras esperábamos el lock
+    SELECT id, expires_at INTO v_sess, v_exp FROM sessions
+    WHERE conversation_id = v_conv AND is_active AND (expires_at IS NULL OR expires_at > now())
+    ORDER BY started_at DESC LIMIT 1;
+    IF FOUND THEN
+        RETURN QUERY SELECT v_user, v_conv, v_sess, v_exp, false;
+        RETURN;
+    END IF;
+
+    -- Rota las sesiones vencidas
+    UPDATE sessions
+    SET is_active = false, ended_at = COALESCE(expires_at, now()), updated_at = now()
+    WHERE conversation_id = v_conv AND is_active;
+
+    INSERT INTO sessions (id, conversation_id, expires_at)
+    VALUES (gen_random_uuid(), v_conv, now() + p_ttl)
+    RETURNING id, expires_at INTO v_sess, v_exp;
+    RETURN QUERY SELECT v_user, v_conv, v_sess, v_exp, true;
+END;
+$$;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Deja una sola sesión activa por conversación (la más reciente) antes del índice único
+    op.execute("""
+        UPDATE sessions s
+        SET is_active = false, ended_at = COALESCE(s.ended_at, now()), updated_at = now()
+        WHERE s.is_active AND EXISTS (
+            SELECT 1 FROM sessions n
+            WHERE n.conversation_id = s.conversation_id AND n.is_active
+              AND (n.started_at, n.id) > (s.started_at, s.id)
+        )
+    """)
+    op.create_index(
+        'ux_sessions_conversation_active', 'sessions', ['conversation_id'],
+        unique=True, postgresql_where=sa.text('is_active'),
+    )
+    op.execute(RESOLVE_SESSION_SQL)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP FUNCTION IF EXISTS resolve_session(varchar, varchar, varchar, interval)")
+    op.drop_index('ux_sessions_conversation_active', table_name='sessions')
@@ -0,0 +1,124 @@
+"""partition messages by month
+
+Revision ID: 5e2a9d4c1b07
+Revises: 3b8f1c2d7a41
+Create Date: 2025-11-10 16:40:02.913377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e2a9d4c1b07'
+down_revision: Union[str, Sequence[str], None] = '3b8f1c2d7a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Particiones mensuales messages_pYYYYMM. Crea desde el mes de `p_from`
+# hasta `p_months_ahead` meses después del actual; es idempotente y la
+# llama el job de mantenimiento (app/db/partitions.py en el webhook).
+ENSURE_PARTITIONS_SQL = """
+CREATE OR REPLACE FUNCTION ensure_messages_partitions(
+    p_months_ahead int DEFAULT 3,
+    p_from timestamptz DEFAULT now()
+)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_month date := date_trunc('month', LEAST(p_from, now()) AT TIME ZONE 'UTC')::date;
+    v_last date := (date_trunc('month', now() AT TIME ZONE 'UTC') + make_interval(months => p_months_ahead))::date;
+    v_name text;
+    v_created int := 0;
+BEGIN
+    WHILE v_month <= v_last LOOP
+        v_name := 'messages_p' || to_char(v_month, 'YYYYMM');
+        IF to_regclass(v_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+                v_name,
+                (v_month::timestamp AT TIME ZONE 'UTC'),
+                ((v_month + interval '1 month')::timestamp AT TIME ZONE 'UTC')
+            );
+            v_created := v_created + 1;
+        END IF;
+        v_month := (v_month + interval '1 month')::date;
+    END LOOP;
+    RETURN v_created;
+END;
+$$;
+"""
+
+COLUMNS = """
+    id UUID NOT NULL,
+    session_id UUID NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    channel_id VARCHAR(255),
+    role message_role NOT NULL,
+    message_type VARCHAR(32) NOT NULL DEFAULT 'text',
+    content TEXT,
+    status delivery_status NOT NULL DEFAULT 'queued',
+    status_updated_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Los nombres de índices/constraints son globales al schema: se liberan
+    op.execute("ALTER TABLE messages RENAME TO messages_legacy")
+    op.execute("ALTER INDEX ix_messages_session_created RENAME TO ix_messages_legacy_session_created")
+    op.execute("ALTER INDEX ix_messages_status RENAME TO ix_messages_legacy_status")
+    op.execute("ALTER TABLE messages_legacy RENAME CONSTRAINT messages_pkey TO messages_legacy_pkey")
+    op.execute("ALTER TABLE messages_legacy RENAME CONSTRAINT messages_channel_id_key TO messages_legacy_channel_id_key")
+
+    # En una tabla particionada toda clave única debe incluir created_at:
+    # channel_id deja de ser único globalmente. Los reintentos de Meta traen
+    # el mismo timestamp, así que (channel_id, created_at) sigue deduplicando.
+    op.execute(f"""
+        CREATE TABLE messages ({COLUMNS},
+            CONSTRAINT messages_pkey PRIMARY KEY (id, created_at),
+            CONSTRAINT uq_messages_channel_created UNIQUE (channel_id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute(ENSURE_PARTITIONS_SQL)
+    op.execute("""
+        SELECT ensure_messages_partitions(3, COALESCE((SELECT min(created_at) FROM messages_legacy), now()))
+    """)
+
+    op.create_index('ix_messages_session_created', 'messages', ['session_id', 'created_at'], unique=False)
+    op.create_index('ix_messages_channel_id', 'messages', ['channel_id'], unique=False)
+    # Sólo los status que todavía pueden cambiar: el índice queda chico
+    op.create_index(
+        'ix_messages_status_pending', 'messages', ['status'], unique=False,
+        postgresql_where=sa.text("status IN ('queued', 'sent', 'delivered')"),
+    )
+
+    # Copia en una sola sentencia: en tablas grandes, correr en ventana de mantenimiento
+    op.execute("INSERT INTO messages SELECT * FROM messages_legacy")
+    op.execute("DROP TABLE messages_legacy")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE messages RENAME TO messages_partitioned")
+    op.execute("ALTER INDEX ix_messages_session_created RENAME TO ix_messages_partitioned_session_created")
+    op.execute("ALTER TABLE messages_partitioned RENAME CONSTRAINT messages_pkey TO messages_partitioned_pkey")
+    op.execute(f"""
+        CREATE TABLE messages ({COLUMNS},
+            CONSTRAINT messages_pkey PRIMARY KEY (id),
+            CONSTRAINT messages_channel_id_key UNIQUE (channel_id)
+        )
+    """)
+    op.execute("""
+        INSERT INTO messages
+        SELECT DISTINCT ON (COALESCE(channel_id, id::text)) * FROM messages_partitioned
+        ORDER BY COALESCE(channel_id, id::text), created_at
+    """)
+    op.execute("DROP TABLE messages_partitioned")
+    op.execute("DROP FUNCTION IF EXISTS ensure_messages_partitions(int, timestamptz)")
+    op.create_index('ix_messages_session_created', 'messages', ['session_id', 'created_at'], unique=False)
+    op.create_index('ix_messages_status', 'messages', ['status'], unique=False)
@@ -0,0 +1,53 @@
+"""messages media columns
+
+Revision ID: 8c4d2f1a6b93
+Revises: 5e2a9d4c1b07
+Create Date: 2025-11-24 11:05:37.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4d2f1a6b93'
+down_revision: Union[str, Sequence[str], None] = '5e2a9d4c1b07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Metadatos de la media entrante (image/audio/video/document/sticker).
+    # Columnas nulas sin default: en Postgres 11+ agregarlas no reescribe
+    # las particiones. El archivo vive en MEDIA_DIR/<sha256[:2]>/<sha256[2:4]>/<sha256>.
+    op.execute("""
+        ALTER TABLE messages
+            ADD COLUMN media_id varchar(128),
+            ADD COLUMN media_mime_type varchar(128),
+            ADD COLUMN media_sha256 char(64),
+            ADD COLUMN media_size bigint,
+            ADD COLUMN media_filename varchar(255),
+            ADD COLUMN media_status varchar(16)
+    """)
+    # Mensajes con el mismo archivo (dedup por contenido)
+    op.execute("""
+        CREATE INDEX ix_messages_media_sha256 ON messages (media_sha256)
+        WHERE media_sha256 IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS ix_messages_media_sha256")
+    op.execute("""
+        ALTER TABLE messages
+            DROP COLUMN media_status,
+            DROP COLUMN media_filename,
+            DROP COLUMN media_size,
+            DROP COLUMN media_sha256,
+            DROP COLUMN media_mime_type,
+            DROP COLUMN media_id
+    """)
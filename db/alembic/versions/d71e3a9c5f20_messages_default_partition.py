@@ -0,0 +1,131 @@
+"""messages default partition
+
+Revision ID: d71e3a9c5f20
+Revises: 8c4d2f1a6b93
+Create Date: 2025-12-01 09:48:15.630274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd71e3a9c5f20'
+down_revision: Union[str, Sequence[str], None] = '8c4d2f1a6b93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Una fila cuyo created_at no cae en ninguna messages_pYYYYMM (el job de
+# mantenimiento no corrió, reloj corrido, timestamp viejo de un reintento de
+# Meta) iba a fallar el INSERT de todo el lote. Ahora cae en messages_default
+# y ensure_messages_partitions crea también los meses de esas filas: como
+# Postgres no deja crear una partición si la DEFAULT tiene filas de su rango,
+# las saca a una tabla temporal y las reinserta después de crearla.
+ENSURE_PARTITIONS_SQL = """
+CREATE OR REPLACE FUNCTION ensure_messages_partitions(
+    p_months_ahead int DEFAULT 3,
+    p_from timestamptz DEFAULT now()
+)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_min timestamptz;
+    v_max timestamptz;
+    v_month date;
+    v_last date;
+    v_from timestamptz;
+    v_to timestamptz;
+    v_name text;
+    v_moved bigint;
+    v_created int := 0;
+BEGIN
+    IF to_regclass('messages_default') IS NOT NULL THEN
+        SELECT min(created_at), max(created_at) INTO v_min, v_max FROM messages_default;
+    END IF;
+    -- LEAST/GREATEST ignoran los NULL (DEFAULT vacía)
+    v_month := date_trunc('month', LEAST(p_from, now(), v_min) AT TIME ZONE 'UTC')::date;
+    v_last := GREATEST(
+        date_trunc('month', now() AT TIME ZONE 'UTC') + make_interval(months => p_months_ahead),
+        date_trunc('month', v_max AT TIME ZONE 'UTC')
+    )::date;
+    WHILE v_month <= v_last LOOP
+        v_name := 'messages_p' || to_char(v_month, 'YYYYMM');
+        IF to_regclass(v_name) IS NULL THEN
+            v_from := v_month::timestamp AT TIME ZONE 'UTC';
+            v_to := (v_month + interval '1 month')::timestamp AT TIME ZONE 'UTC';
+            v_moved := 0;
+            IF v_min < v_to AND v_max >= v_from THEN
+                CREATE TEMP TABLE IF NOT EXISTS messages_default_moved (LIKE messages) ON COMMIT DROP;
+                WITH moved AS (
+                    DELETE FROM messages_default WHERE created_at >= v_from AND created_at < v_to RETURNING *
+                )
+                INSERT INTO messages_default_moved SELECT * FROM moved;
+                GET DIAGNOSTICS v_moved = ROW_COUNT;
+            END IF;
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+                v_name, v_from, v_to
+            );
+            IF v_moved > 0 THEN
+                INSERT INTO messages SELECT * FROM messages_default_moved;
+                TRUNCATE messages_default_moved;
+                RAISE WARNING '% rows moved from messages_default to %', v_moved, v_name;
+            END IF;
+            v_created := v_created + 1;
+        END IF;
+        v_month := (v_month + interval '1 month')::date;
+    END LOOP;
+    RETURN v_created;
+END;
+$$;
+"""
+
+# Versión de 5e2a9d4c1b07, sin messages_default
+PREVIOUS_ENSURE_PARTITIONS_SQL = """
+CREATE OR REPLACE FUNCTION ensure_messages_partitions(
+    p_months_ahead int DEFAULT 3,
+    p_from timestamptz DEFAULT now()
+)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_month date := date_trunc('month', LEAST(p_from, now()) AT TIME ZONE 'UTC')::date;
+    v_last date := (date_trunc('month', now() AT TIME ZONE 'UTC') + make_interval(months => p_months_ahead))::date;
+    v_name text;
+    v_created int := 0;
+BEGIN
+    WHILE v_month <= v_last LOOP
+        v_name := 'messages_p' || to_char(v_month, 'YYYYMM');
+        IF to_regclass(v_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+                v_name,
+                (v_month::timestamp AT TIME ZONE 'UTC'),
+                ((v_month + interval '1 month')::timestamp AT TIME ZONE 'UTC')
+            );
+            v_created := v_created + 1;
+        END IF;
+        v_month := (v_month + interval '1 month')::date;
+    END LOOP;
+    RETURN v_created;
+END;
+$$;
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(ENSURE_PARTITIONS_SQL)
+    op.execute("CREATE TABLE messages_default PARTITION OF messages DEFAULT")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Lo que haya en la DEFAULT pasa a su partición mensual antes de borrarla
+    op.execute("SELECT ensure_messages_partitions(0)")
+    op.execute("DROP TABLE messages_default")
+    op.execute(PREVIOUS_ENSURE_PARTITIONS_SQL)
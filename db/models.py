@@ -1,5 +1,6 @@
 from sqlalchemy import (
-    Table, Column, MetaData, Integer, String, Text, DateTime, Boolean, ForeignKey, Enum, Index
+    Table, Column, MetaData, Integer, BigInteger, CHAR, String, Text, DateTime, Boolean, ForeignKey, Enum, Index,
+    UniqueConstraint, text
 )
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.sql import func
@@ -41,8 +42,11 @@ sessions = Table(
     Column("updated_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
 )
 Index("ix_sessions_conversation_active", sessions.c.conversation_id, sessions.c.is_active)
+# Una sola sesión activa por conversación (ver función resolve_session)
+Index("ux_sessions_conversation_active", sessions.c.conversation_id, unique=True, postgresql_where=sessions.c.is_active)
 
-# MESSAGES
+# MESSAGES (particionada por mes en created_at: messages_pYYYYMM; lo que no cae
+# en ninguna va a messages_default hasta que el job de particiones lo mueve)
 message_role = Enum("user", "assistant", "system", name="message_role")
 delivery_status = Enum("queued", "sent", "delivered", "read", "failed", name="delivery_status")
 
@@ -50,15 +54,28 @@ messages = Table(
     "messages", metadata,
     Column("id", UUID(as_uuid=False), primary_key=True),
     Column("session_id", UUID(as_uuid=False), ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False),
-    Column("channel_id", String(255), unique=True, nullable=True),  # ID del mensaje en canal externo
+    Column("channel_id", String(255), nullable=True),  # ID del mensaje en canal externo
     Column("role", message_role, nullable=False),
     Column("message_type", String(32), nullable=False, server_default="text"),  # text|image|...
     Column("content", Text, nullable=True),  
+    # Media entrante: la descarga es asíncrona, se completan al guardarse el archivo
+    Column("media_id", String(128), nullable=True),         # id de Graph API
+    Column("media_mime_type", String(128), nullable=True),
+    Column("media_sha256", CHAR(64), nullable=True),        # nombre del archivo en MEDIA_DIR
+    Column("media_size", BigInteger, nullable=True),
+    Column("media_filename", String(255), nullable=True),   # sólo documentos
+    Column("media_status", String(16), nullable=True),      # stored|failed
     Column("status", delivery_status, nullable=False, server_default="queued"), # queued|sent|delivered|read|failed
     Column("status_updated_at", DateTime(timezone=True), nullable=True),
-    Column("created_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now(), primary_key=True),
     Column("updated_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+    # Las claves únicas de una tabla particionada deben incluir created_at
+    UniqueConstraint("channel_id", "created_at", name="uq_messages_channel_created"),
+    postgresql_partition_by="RANGE (created_at)",
 )
 Index("ix_messages_session_created", messages.c.session_id, messages.c.created_at)
-Index("ix_messages_status", messages.c.status)
+Index("ix_messages_channel_id", messages.c.channel_id)
+Index("ix_messages_media_sha256", messages.c.media_sha256, postgresql_where=messages.c.media_sha256.isnot(None))
+# Sólo status que todavía pueden cambiar (read/failed son terminales)
+Index("ix_messages_status_pending", messages.c.status, postgresql_where=text("status IN ('queued', 'sent', 'delivered')"))
 
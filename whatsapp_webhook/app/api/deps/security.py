@@ -2,9 +2,12 @@
 import logging
 import hashlib
 import hmac
+import msgspec
 from fastapi import Request, HTTPException, status
 
+from app.core import metrics
 from app.core.settings import settings
+from app.whatsapp.schemas import decode_webhook
 
 
 def validate_signature(payload: bytes, signature: str) -> bool:
@@ -30,15 +33,32 @@ async def signature_required(request: Request):
     """
     Dependency to ensure that the incoming requests to our webhook are valid
     and signed with the correct signature.
+
+    The raw body is read once, verified, and decoded into a typed
+    WebhookPayload that the handler reads from `request.state.payload`.
     """
     header = request.headers.get("X-Hub-Signature-256", "")
     signature = header[7:] if header.startswith("sha256=") else header  # remove 'sha256='
 
     body = await request.body()  # raw bytes
 
-    if not validate_signature(body, signature):
+    with metrics.SIGNATURE_SECONDS.time():
+        valid = validate_signature(body, signature)
+    if not valid:
         logging.info("Signature verification failed!")
+        metrics.DROPPED.labels("invalid_signature").inc()
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Invalid signature",
         )
+
+    try:
+        with metrics.DECODE_SECONDS.time():
+            request.state.payload = decode_webhook(body)
+    except msgspec.DecodeError:
+        logging.error("Failed to decode JSON")
+        metrics.DROPPED.labels("invalid_json").inc()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid JSON provided",
+        )
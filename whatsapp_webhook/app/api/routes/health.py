@@ -0,0 +1,22 @@
+# app/api/routes/health.py
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from starlette import status
+
+from app.redis_utils import health_check
+from app.whatsapp.utils import get_window_policy
+
+health_router = APIRouter()
+
+@health_router.get("/health")
+async def health():
+    redis_health = await health_check()
+    code = status.HTTP_200_OK if redis_health["ok"] else status.HTTP_503_SERVICE_UNAVAILABLE
+    return JSONResponse(
+        {
+            "status": "ok" if redis_health["ok"] else "degraded",
+            "redis": redis_health,
+            "debounce_window": get_window_policy().stats(),
+        },
+        status_code=code,
+    )
@@ -0,0 +1,11 @@
+# app/api/routes/metrics.py
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from app.core import metrics
+
+metrics_router = APIRouter()
+
+@metrics_router.get("/metrics")
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
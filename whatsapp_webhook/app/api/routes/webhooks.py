@@ -1,5 +1,5 @@
 # app/api/routes/whatsapp_webhook.py
-from fastapi import APIRouter, Request, Depends, BackgroundTasks
+from fastapi import APIRouter, Request, Depends
 from app.whatsapp.utils import handle_message, verify
 from app.api.deps.security import signature_required
 
@@ -10,5 +10,5 @@ async def webhook_get(request: Request):
     return await verify(request)
 
 @whatsapp_webhook_router.post("/webhook")
-async def webhook_post(request: Request, background: BackgroundTasks, _=Depends(signature_required)):
-    return await handle_message(request, background)
+async def webhook_post(request: Request, _=Depends(signature_required)):
+    return await handle_message(request)
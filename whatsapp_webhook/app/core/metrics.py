@@ -0,0 +1,282 @@
+# app/core/metrics.py
+"""
+Métricas en proceso con salida en el formato de texto de Prometheus (0.0.4),
+servidas en GET /metrics.
+
+Sin dependencias y pensadas para quedar encendidas en producción: observar
+es un bisect sobre los buckets y dos sumas (sin locks: todo corre en el
+event loop). Cada proceso de uvicorn tiene sus propios contadores; con
+varios workers, Prometheus debe scrapear cada uno (o usar un solo worker
+por contenedor).
+
+Los histogramas de segundos usan los buckets de Prometheus; los de tiempos
+de usuario/LLM (segundos a minutos) usan SLOW_BUCKETS. Las métricas del
+LLM las mide el agent worker y viajan en la salida final de cada turno
+(ver deliver_reply).
+"""
+import math
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 8.0, 10.0, 15.0, 20.0, 30.0, 60.0, 120.0)
+COUNT_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+_registry: List["_Metric"] = []
+
+
+def _fmt(v: float) -> str:
+    if math.isnan(v):
+        return "NaN"
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Timer:
+    """`with hist.time():` observa la duración del bloque (sirve alrededor de awaits)."""
+
+    __slots__ = ("_hist", "_t0")
+
+    def __init__(self, hist: "_HistogramChild"):
+        self._hist = hist
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._hist.observe(time.perf_counter() - self._t0)
+        return False
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value", "_fn")
+
+    def __init__(self):
+        self.value = 0.0
+        self._fn: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, fn: Callable[[], float]):
+        """El valor se lee al scrapear (p. ej. el largo de una cola)."""
+        self._fn = fn
+
+    def get(self) -> float:
+        if self._fn is not None:
+            try:
+                return float(self._fn())
+            except Exception:
+                return math.nan
+        return self.value
+
+
+class _HistogramChild:
+    __slots__ = ("_buckets", "counts", "sum")
+
+    def __init__(self, buckets: Sequence[float]):
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # el último es +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self._buckets, value)] += 1
+        self.sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.label_names:
+            self._default = self._children[()] = self._new_child()
+        _registry.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Hijo para esos valores de label (se crea la primera vez y se reutiliza)."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.label_names):
+                raise ValueError(f"{self.name} espera labels {self.label_names}, recibió {values!r}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _label_str(self, key: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{n}="{_escape(v)}"' for n, v in zip(self.label_names, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._label_str(k)} {_fmt(c.value)}" for k, c in self._children.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def set_function(self, fn: Callable[[], float]):
+        self._default.set_function(fn)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._label_str(k)} {_fmt(c.get())}" for k, c in self._children.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self) -> _Timer:
+        return _Timer(self._default)
+
+    def _samples(self) -> List[str]:
+        out = []
+        for key, child in self._children.items():
+            acc = 0
+            for le, n in zip((*self.buckets, math.inf), child.counts):
+                acc += n
+                le_label = f'le="{_fmt(le)}"'
+                out.append(f"{self.name}_bucket{self._label_str(key, le_label)} {acc}")
+            labels = self._label_str(key)
+            out.append(f"{self.name}_sum{labels} {_fmt(child.sum)}")
+            out.append(f"{self.name}_count{labels} {acc}")
+        return out
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ====== Catálogo ======
+# Entrada del webhook
+SIGNATURE_SECONDS = Histogram(
+    "wa_webhook_signature_seconds", "Verificación HMAC de X-Hub-Signature-256.", buckets=FAST_BUCKETS)
+DECODE_SECONDS = Histogram(
+    "wa_webhook_decode_seconds", "Decodificación del body del webhook (msgspec).", buckets=FAST_BUCKETS)
+DEDUP_HITS = Counter(
+    "wa_dedup_hits_total", "Mensajes entrantes ya vistos (reintentos de Meta), descartados por dedup.")
+DROPPED = Counter(
+    "wa_dropped_total",
+    "Webhooks, mensajes o respuestas descartados: invalid_signature, invalid_json, buffer_overflow, "
+    "publish_failed, stale_reply, delivery_failed, write_overflow, dead_letter.",
+    labels=("reason",))
+
+# Estado de debounce (Redis o en memoria) y streams
+REDIS_OP_SECONDS = Histogram(
+    "wa_redis_op_seconds", "Operaciones del hot path: ingest/claim/flush/renew/release/is_current "
+    "del backend de debounce y XADD del turno.", labels=("backend", "op"))
+DEBOUNCE_WAIT_SECONDS = Histogram(
+    "wa_debounce_wait_seconds", "Del primer mensaje de la tanda (recibido por el webhook) al flush.",
+    buckets=SLOW_BUCKETS)
+FLUSH_MESSAGES = Histogram(
+    "wa_debounce_flush_messages", "Mensajes por tanda (tamaño del buffer al hacer flush).", buckets=COUNT_BUCKETS)
+LOCK_CONTENTION = Counter(
+    "wa_lock_contention_total", "Flushes pospuestos porque el usuario tenía una respuesta en curso.")
+LOCK_LOST = Counter(
+    "wa_lock_lost_total", "Heartbeats rechazados: el lock del usuario ya lo tiene otro turno.")
+DEBOUNCE_INFLIGHT = Gauge("wa_debounce_inflight", "try_process en curso en el DebounceScheduler.")
+
+# Postgres
+DB_QUERY_SECONDS = Histogram("wa_db_query_seconds", "Duración por método de AsyncPGORM.", labels=("method",))
+ORM_CACHE_LOOKUPS = Counter(
+    "wa_orm_cache_lookups_total",
+    "Lecturas por clave de AsyncPGORM en el ReadThroughCache según dónde se resolvieron: local (L1), "
+    "redis (L2) o miss (Postgres).", labels=("table", "result"))
+MESSAGES_DEFAULT_ROWS = Gauge(
+    "wa_messages_default_partition_rows",
+    "Filas de messages en messages_default (sin partición mensual) en la última corrida del job de "
+    "particiones, antes de moverlas. Distinto de 0: el job no corrió a tiempo o llegó un created_at fuera de rango.")
+
+# Agent worker (llegan en la salida final del turno)
+LLM_SECONDS = Histogram("wa_llm_seconds", "Llamada al LLM (hasta el último token).", buckets=SLOW_BUCKETS)
+LLM_QUEUE_SECONDS = Histogram(
+    "wa_llm_queue_seconds", "Espera por un slot del LLMLimiter en el agent.", buckets=SLOW_BUCKETS)
+LLM_TOKENS = Histogram("wa_llm_tokens", "Tokens por llamada al LLM.", labels=("direction",), buckets=TOKEN_BUCKETS)
+TURN_RESULTS = Counter(
+    "wa_turns_total", "Turnos respondidos por el agent según origen: llm, cache u overload.", labels=("source",))
+
+# Salida
+SEND_SECONDS = Histogram(
+    "wa_outbound_send_seconds", "Envío a Graph API (cola + rate limit + reintentos).", labels=("kind",))
+TURN_SECONDS = Histogram(
+    "wa_turn_seconds", "Del turno publicado en TURNS_STREAM a la respuesta final entregada.", buckets=SLOW_BUCKETS)
+SEND_QUEUE = Gauge("wa_whatsapp_send_queue", "Envíos encolados en el WhatsAppClient.")
+
+# Media entrante
+MEDIA_DOWNLOAD_SECONDS = Histogram(
+    "wa_media_download_seconds", "Descarga de un archivo de Graph API (metadatos + contenido).",
+    buckets=SLOW_BUCKETS)
+MEDIA_BYTES = Counter("wa_media_bytes_total", "Bytes de media descargados.")
+MEDIA_DEDUP = Counter(
+    "wa_media_dedup_total", "Descargas evitadas o archivos ya presentes: media_id o content (mismo sha256).",
+    labels=("kind",))
+MEDIA_FAILED = Counter(
+    "wa_media_failed_total", "Media que no se pudo guardar o encolar: too_large, http, checksum, error, enqueue.", labels=("reason",))
+MEDIA_INFLIGHT = Gauge("wa_media_downloads_inflight", "Descargas de media en curso en este proceso.")
@@ -1,3 +1,5 @@
+from typing import Dict, List
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -15,6 +17,13 @@ class Settings(BaseSettings):
     
     APP_SECRET: str
 
+    # Cliente saliente de Cloud API
+    GRAPH_API_URL: str = "https://graph.facebook.com"
+    WHATSAPP_SEND_RATE: float = 80        # mensajes/seg por PHONE_NUMBER_ID
+    WHATSAPP_MAX_INFLIGHT: int = 32
+    WHATSAPP_SEND_QUEUE: int = 1000
+    WHATSAPP_MAX_RETRIES: int = 5
+
     VERIFY_TOKEN: str
     
     OPENAI_API_KEY: str
@@ -22,6 +31,87 @@ class Settings(BaseSettings):
     OPENAI_ASSISTANT_ID: str
     
     REDIS_URL: str
+    REDIS_BACKEND: str = "redis"          # redis | memory (fakeredis[lua], un solo proceso)
+    REDIS_MAX_CONNECTIONS: int = 64
+    REDIS_POOL_TIMEOUT_S: float = 5.0
+    REDIS_SOCKET_TIMEOUT_S: float | None = None
+    REDIS_HEALTH_CHECK_INTERVAL_S: int = 30
+
+    # Scheduler de debounce (sorted set en Redis)
+    DEBOUNCE_POLLERS: int = 2
+    DEBOUNCE_POLL_INTERVAL_MS: int = 100
+    DEBOUNCE_CLAIM_BATCH: int = 100
+    DEBOUNCE_MAX_INFLIGHT: int = 256
+    DEBOUNCE_LEASE_MS: int = 30000
+    # redis: compartido entre workers | local: en memoria, un solo contenedor
+    DEBOUNCE_BACKEND: str = "redis"
+    DEBOUNCE_LOCAL_TICK_MS: int = 10
+    DEBOUNCE_LOCAL_MAX_USERS: int = 100000
+    DEBOUNCE_LOCAL_MAX_BUFFER: int = 50
+    DEBOUNCE_JOURNAL_PATH: str = ""       # vacío = sin journal
+    DEBOUNCE_JOURNAL_FSYNC: bool = False
+    # Ventana: fixed (WINDOW_MS) | adaptive (por usuario, según las pausas entre sus mensajes)
+    DEBOUNCE_WINDOW_MODE: str = "fixed"
+    DEBOUNCE_WINDOW_MIN_MS: int = 800
+    DEBOUNCE_WINDOW_MAX_MS: int = 8000
+    DEBOUNCE_WINDOW_PERCENTILE: float = 0.95
+    DEBOUNCE_WINDOW_TERMINAL_MS: int = 800   # si el último mensaje cierra con . ? !
+    DEBOUNCE_WINDOW_MIN_SAMPLES: int = 5
+
+    # Streams hacia/desde el agent worker
+    TURNS_STREAM: str = "wa:turns"
+    TURNS_STREAM_MAXLEN: int = 100000
+    OUTBOUND_STREAM: str = "wa:out"
+    OUTBOUND_GROUP: str = "webhook"
+    OUTBOUND_CLAIM_IDLE_MS: int = 30000
+    OUTBOUND_RETRY_S: float = 10.0        # errores antes del envío (Redis); < OUTBOUND_CLAIM_IDLE_MS
+
+    # Descarga de media entrante (imagen/audio/video/documento) fuera del request
+    MEDIA_ENABLED: bool = True
+    MEDIA_STREAM: str = "wa:media"
+    MEDIA_STREAM_MAXLEN: int = 100000
+    MEDIA_GROUP: str = "media"
+    MEDIA_DIR: str = "media"                 # almacenamiento por sha256
+    MEDIA_MAX_CONCURRENT_DOWNLOADS: int = 4  # por proceso
+    MEDIA_CHUNK_BYTES: int = 64 * 1024       # memoria por descarga
+    MEDIA_MAX_BYTES: int = 100 * 1024 * 1024 # límite de Cloud API para documentos
+    MEDIA_MAX_RETRIES: int = 3
+    MEDIA_ID_TTL_S: int = 30 * 24 * 60 * 60  # media_id -> sha256 ya descargado
+    MEDIA_CLAIM_IDLE_MS: int = 5 * 60 * 1000
+
+    # Historial reciente por usuario (lista acotada en Redis + Postgres)
+    HISTORY_MAX_MESSAGES: int = 20
+    HISTORY_MAX_CHARS: int = 1000
+    HISTORY_TTL_S: int = 24 * 60 * 60
+    SESSION_TTL_S: int = 24 * 60 * 60
+
+    # Write-behind de messages (inserts + status callbacks)
+    WRITE_BEHIND_FLUSH_MS: int = 200
+    WRITE_BEHIND_MAX_ROWS: int = 500
+    WRITE_BEHIND_STATUS_RETRY_S: float = 60.0
+    WRITE_BEHIND_MAX_BUFFER: int = 50000      # entradas en memoria; lo que exceda se descarta
+    WRITE_BEHIND_BACKOFF_MAX_S: float = 30.0  # con Postgres caído
+    WRITE_BEHIND_DEAD_LETTER_PATH: str = "dead_letter/messages.jsonl"  # vacío = sólo log
+
+    # Particiones mensuales de messages (retención + archivado a disco)
+    PARTITION_MONTHS_AHEAD: int = 3
+    MESSAGES_RETENTION_MONTHS: int = 12   # 0 = no archivar
+    MESSAGES_ARCHIVE_DIR: str = "archive/messages"
+    PARTITION_MAINTENANCE_INTERVAL_S: float = 6 * 60 * 60
+
+    # Caché de lecturas del ORM (LRU en proceso + Redis); tabla -> campos clave.
+    # Apagado por defecto: desde resolve_session() (un solo round trip) el hot
+    # path no lee por clave con orm.get/exists, así que sólo agregaría el
+    # listener de pub/sub. Encenderlo si se suman lecturas por id/phone_number.
+    ORM_CACHE_ENABLED: bool = False
+    ORM_CACHE_TABLES: Dict[str, List[str]] = {
+        "users": ["id", "phone_number"],
+        "conversations": ["id", "user_id"],
+        "sessions": ["id"],
+    }
+    ORM_CACHE_LOCAL_ENTRIES: int = 10000
+    ORM_CACHE_LOCAL_TTL_S: float = 30.0
+    ORM_CACHE_TTL_S: int = 300
     
     DB_HOST: str
     DB_PORT: int
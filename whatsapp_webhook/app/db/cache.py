@@ -0,0 +1,247 @@
+import asyncio
+import datetime
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from redis.asyncio import Redis
+
+from app.core import metrics
+
+Row = Dict[str, Any]
+Loader = Callable[[], Awaitable[Optional[Row]]]
+
+# KEYS: versión de la clave leída, claves de la fila...   ARGV: versión vista ('' si no había), fila, ttl_s
+# Sólo llena si nadie invalidó la clave mientras se cargaba de Postgres.
+_FILL_LUA = """
+local v = redis.call('GET', KEYS[1]) or ''
+if v ~= ARGV[1] then return 0 end
+for i = 2, #KEYS do redis.call('SET', KEYS[i], ARGV[2], 'EX', ARGV[3]) end
+return 1
+"""
+
+
+def _encode(value: Any):
+    if isinstance(value, datetime.datetime):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"$d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"$dec": str(value)}
+    raise TypeError(f"No serializable: {type(value).__name__}")
+
+
+def _decode(obj: Dict[str, Any]):
+    if len(obj) == 1:
+        if "$dt" in obj:
+            return datetime.datetime.fromisoformat(obj["$dt"])
+        if "$d" in obj:
+            return datetime.date.fromisoformat(obj["$d"])
+        if "$dec" in obj:
+            return Decimal(obj["$dec"])
+    return obj
+
+
+def normalize_row(row: Row) -> Row:
+    """UUID → str, igual que declaran los modelos (UUID(as_uuid=False))."""
+    return {k: str(v) if isinstance(v, uuid.UUID) else v for k, v in row.items()}
+
+
+class LRUCache:
+    """LRU acotado en memoria con expiración por entrada."""
+
+    def __init__(self, max_entries: int = 10000, ttl_s: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._data: "OrderedDict[Tuple, Tuple[float, Row]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Tuple) -> Optional[Row]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, row = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return row
+
+    def set(self, key: Tuple, row: Row):
+        self._data[key] = (time.monotonic() + self.ttl_s, row)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Tuple):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+class ReadThroughCache:
+    """
+    Caché de dos niveles para las lecturas por clave de AsyncPGORM.
+
+    - L1: LRU en el proceso (acotado, TTL corto).
+    - L2: Redis compartido entre workers (`orm:{tabla}:{campo}:{valor}`, TTL).
+    - Sólo se cachean las combinaciones tabla/campo de `tables`; los misses
+      (fila inexistente) no se cachean para no ocultar un insert posterior.
+    - `invalidate` borra la clave de Redis, incrementa su versión
+      (`orm:v:...`) y publica en `channel`; cada worker escucha y la saca
+      de su L1.
+    - Un miss lee la versión junto con la clave y sólo llena L2 si no
+      cambió mientras cargaba de Postgres (y L1 si además no llegó ninguna
+      invalidación local), así una invalidación concurrente no queda pisada
+      por el valor viejo.
+    """
+
+    def __init__(
+        self,
+        r: Redis,
+        tables: Dict[str, Iterable[str]],
+        local_entries: int = 10000,
+        local_ttl_s: float = 30.0,
+        ttl_s: int = 300,
+        channel: str = "orm:invalidate",
+        prefix: str = "orm",
+    ):
+        self._r = r
+        self.tables = {t: tuple(fields) for t, fields in tables.items()}
+        self.ttl_s = ttl_s
+        self.channel = channel
+        self.prefix = prefix
+        self._local = LRUCache(local_entries, local_ttl_s)
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"local": 0, "redis": 0, "miss": 0})
+        self._listener: Optional[asyncio.Task] = None
+        self._invalidations = 0  # invalidaciones vistas en L1 (locales o por pub/sub)
+        self._fill = r.register_script(_FILL_LUA)
+
+    def enabled(self, table: str, field: str) -> bool:
+        return field in self.tables.get(table, ())
+
+    def fields(self, table: str) -> Tuple[str, ...]:
+        return self.tables.get(table, ())
+
+    def _key(self, table: str, field: str, value) -> str:
+        return f"{self.prefix}:{table}:{field}:{value}"
+
+    def _version_key(self, table: str, field: str, value) -> str:
+        return f"{self.prefix}:v:{table}:{field}:{value}"
+
+    def _count(self, table: str, result: str):
+        self._stats[table][result] += 1
+        metrics.ORM_CACHE_LOOKUPS.labels(table, result).inc()
+
+    async def get(self, table: str, field: str, value, loader: Loader) -> Optional[Row]:
+        lkey = (table, field, str(value))
+        row = self._local.get(lkey)
+        if row is not None:
+            self._count(table, "local")
+            return row
+
+        raw = version = None
+        try:
+            raw, version = await self._r.mget(self._key(table, field, value), self._version_key(table, field, value))
+        except Exception as e:
+            logging.warning(f"orm cache read failed ({table}.{field}): {e}")
+        if raw is not None:
+            row = json.loads(raw, object_hook=_decode)
+            self._local.set(lkey, row)
+            self._count(table, "redis")
+            return row
+
+        self._count(table, "miss")
+        seen = self._invalidations
+        row = await loader()
+        if row is not None:
+            row = normalize_row(row)
+            await self._store(table, field, value, version, row, seen)
+        return row
+
+    async def _store(self, table: str, field: str, value, version: Optional[str], row: Row, seen: int):
+        """Cachea la fila bajo todos los campos configurados, si no se invalidó mientras se cargaba."""
+        fields = [f for f in self.fields(table) if row.get(f) is not None]
+        try:
+            stored = await self._fill(
+                keys=[self._version_key(table, field, value), *(self._key(table, f, row[f]) for f in fields)],
+                args=[version or "", json.dumps(row, default=_encode), self.ttl_s],
+            )
+        except Exception as e:
+            logging.warning(f"orm cache write failed ({table}): {e}")
+            return
+        if stored and seen == self._invalidations:
+            for f in fields:
+                self._local.set((table, f, str(row[f])), row)
+
+    async def invalidate(self, table: str, rows: Iterable[Row]):
+        """Invalida las claves de `rows` (dicts con los campos cacheados) en L1, Redis y el resto de workers."""
+        keys = []
+        for row in rows:
+            for f in self.fields(table):
+                if row.get(f) is not None:
+                    keys.append((table, f, str(row[f])))
+        if not keys:
+            return
+        self._invalidations += 1
+        for k in keys:
+            self._local.pop(k)
+        try:
+            async with self._r.pipeline(transaction=False) as pipe:
+                pipe.delete(*(self._key(*k) for k in keys))
+                for k in keys:
+                    # Sobrevive a cualquier carga en curso; luego expira sola
+                    pipe.incr(self._version_key(*k))
+                    pipe.expire(self._version_key(*k), self.ttl_s)
+                pipe.publish(self.channel, json.dumps(keys))
+                await pipe.execute()
+        except Exception as e:
+            logging.warning(f"orm cache invalidation failed ({table}): {e}")
+
+    async def start(self):
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    async def _listen(self):
+        while True:
+            pubsub = self._r.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                # Lo que haya cambiado mientras no escuchábamos
+                self._invalidations += 1
+                self._local.clear()
+                async for msg in pubsub.listen():
+                    self._invalidations += 1
+                    for k in json.loads(msg["data"]):
+                        self._local.pop(tuple(k))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"orm cache listener error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Hits L1/L2, misses y hit rate por tabla de esta instancia. Los mismos
+        conteos se exportan en /metrics como `wa_orm_cache_lookups_total`.
+        """
+        out = {}
+        for table, s in self._stats.items():
+            total = s["local"] + s["redis"] + s["miss"]
+            out[table] = {**s, "hit_rate": (s["local"] + s["redis"]) / total if total else 0.0}
+        return out
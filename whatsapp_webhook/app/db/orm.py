@@ -1,9 +1,14 @@
+import functools
 import re
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 import time
+import uuid
 import asyncpg
 import datetime
 
+from app.core import metrics
+from app.db.cache import ReadThroughCache
+
 IDENT_RE = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_\.]*$")  # opcional: permite schema.table
 
 def _ident(name: str) -> str:
@@ -19,6 +24,31 @@ def _order(order: str) -> str:
         raise ValueError("ORDER inválido")
     return order
 
+def _split_table(name: str) -> Tuple[Optional[str], str]:
+    schema, _, table = _ident(name).rpartition(".")
+    return schema or None, table
+
+# ===== Caché de SQL por forma (tabla, columnas, ...) =====
+# Generar siempre el mismo string para la misma forma hace que asyncpg
+# reutilice su statement preparado (el caché del driver es por texto SQL).
+_sql_cache: Dict[tuple, str] = {}
+
+def _cached_sql(shape: tuple, build: Callable[[], str]) -> str:
+    sql = _sql_cache.get(shape)
+    if sql is None:
+        sql = _sql_cache[shape] = build()
+    return sql
+
+def _columns(rows: Sequence[Dict[str, Any]]) -> List[str]:
+    """Columnas comunes a todas las filas (todas deben tener la misma forma)."""
+    cols = list(rows[0].keys())
+    for c in cols: _ident(c)
+    keyset = set(cols)
+    for row in rows:
+        if row.keys() != keyset:
+            raise ValueError("Todas las filas deben tener las mismas columnas")
+    return cols
+
 # ===== Pool global opcional (inícialo en startup de tu app) =====
 _pool: Optional[asyncpg.Pool] = None
 
@@ -37,28 +67,62 @@ def get_pool() -> asyncpg.Pool:
     assert _pool is not None, "Pool no inicializado: llama init_db_pool() primero"
     return _pool
 
+def _timed(fn):
+    """Observa la duración de cada llamada en wa_db_query_seconds{method}."""
+    hist = metrics.DB_QUERY_SECONDS.labels(fn.__name__)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        with hist.time():
+            return await fn(*args, **kwargs)
+    return wrapper
+
 class AsyncPGORM:
-    
+    """
+    Si se pasa `cache`, `get`/`exists` sobre las tablas/campos configurados
+    leen primero del caché y `update`/`delete`/`upsert_many` lo invalidan.
+    Cada método público se mide con `_timed` (incluye aciertos de caché);
+    entre ellos se llaman sólo vía helpers sin medir, para no contar dos veces.
+    """
+
+    def __init__(self, cache: Optional[ReadThroughCache] = None):
+        self.cache = cache
+
+    @_timed
     async def exists(self, table: str, field: str, value) -> bool:
         """
         Verifica si un registro existe en la tabla dada.
         """
+        if self.cache is not None and self.cache.enabled(table, field):
+            return await self._get(table, field, value) is not None
         tbl, fld = _ident(table), _ident(field)
         query = f'SELECT 1 FROM {tbl} WHERE {fld} = $1 LIMIT 1'
         async with get_pool().acquire() as conn:
             row = await conn.fetchrow(query, value)
             return row is not None
     
+    @_timed
     async def get(self, table_name: str, field: str, value) -> Optional[Dict[str, Any]]:
         """
         Obtiene un registro de la tabla dada.
         """
+        return await self._get(table_name, field, value)
+
+    async def _get(self, table_name: str, field: str, value) -> Optional[Dict[str, Any]]:
+        # Sin _timed: `exists` lo usa y cada llamada se mide una sola vez
         tbl, fld = _ident(table_name), _ident(field)
         sql = f'SELECT * FROM {tbl} WHERE {fld} = $1 LIMIT 1'
-        async with get_pool().acquire() as conn:
-            row = await conn.fetchrow(sql, value)
-            return dict(row) if row else None
+
+        async def load():
+            async with get_pool().acquire() as conn:
+                row = await conn.fetchrow(sql, value)
+                return dict(row) if row else None
+
+        if self.cache is not None and self.cache.enabled(table_name, field):
+            return await self.cache.get(table_name, field, value, load)
+        return await load()
     
+    @_timed
     async def get_one_specific_values(self, table_name: str, field: str, value, specific_fields: List[str]) -> Optional[Dict[str, Any]]:
         """
         Obtiene un registro de la tabla dada con campos específicos.
@@ -80,6 +144,7 @@ class AsyncPGORM:
             row = await conn.fetchrow(sql, value)
             return dict(row) if row else None
     
+    @_timed
     async def create(self, table_name: str, data: Dict[str, Any]) -> Optional[int]:
         """
         Crea un nuevo registro en la tabla dada.
@@ -88,29 +153,167 @@ class AsyncPGORM:
         tbl = _ident(table_name)
         keys = list(data.keys())
         for k in keys: _ident(k)
-        cols = ", ".join(keys)
-        placeholders = ", ".join(f"${i+1}" for i in range(len(keys)))
-        sql = f'INSERT INTO {tbl} ({cols}) VALUES ({placeholders}) RETURNING id'
+        sql = _cached_sql(("insert", tbl, tuple(keys), "id"), lambda: (
+            f'INSERT INTO {tbl} ({", ".join(keys)}) '
+            f'VALUES ({", ".join(f"${i+1}" for i in range(len(keys)))}) RETURNING id'
+        ))
         async with get_pool().acquire() as conn:
             row = await conn.fetchrow(sql, *[data[k] for k in keys])
             return row["id"] if row else None
     
+    @_timed
     async def update(self, table_name: str, field: str, value, data: Dict[str, Any]) -> bool:
         tbl, fld = _ident(table_name), _ident(field)
         keys = list(data.keys())
         for k in keys: _ident(k)
-        set_clause = ", ".join(f"{k} = ${i+1}" for i, k in enumerate(keys))
-        sql = f'UPDATE {tbl} SET {set_clause} WHERE {fld} = ${len(keys)+1}'
+        sql = _cached_sql(("update", tbl, tuple(keys), fld), lambda: (
+            f'UPDATE {tbl} SET {", ".join(f"{k} = ${i+1}" for i, k in enumerate(keys))} '
+            f'WHERE {fld} = ${len(keys)+1}'
+        ))
         params = [data[k] for k in keys] + [value]
+        cached = self.cache.fields(table_name) if self.cache is not None else ()
+        if not cached:
+            async with get_pool().acquire() as conn:
+                await conn.execute(sql, *params)
+            return True
+
+        # Invalida tanto las claves viejas como las nuevas (p. ej. si cambia phone_number)
+        ret = ", ".join(_ident(c) for c in cached)
         async with get_pool().acquire() as conn:
-            await conn.execute(sql, *params)
+            async with conn.transaction():
+                old = await conn.fetch(f'SELECT {ret} FROM {tbl} WHERE {fld} = $1 FOR UPDATE', value)
+                new = await conn.fetch(f'{sql} RETURNING {ret}', *params)
+        await self.cache.invalidate(table_name, [dict(r) for r in (*old, *new)])
         return True
 
+    @_timed
     async def delete(self, table_name: str, field: str, value) -> bool:
         tbl, fld = _ident(table_name), _ident(field)
         sql = f'UPDATE {tbl} SET is_deleted = TRUE WHERE {fld} = $1'
+        cached = self.cache.fields(table_name) if self.cache is not None else ()
+        if cached:
+            sql += f' RETURNING {", ".join(_ident(c) for c in cached)}'
         async with get_pool().acquire() as conn:
-            await conn.execute(sql, value)
+            rows = await conn.fetch(sql, value)
+        if cached:
+            await self.cache.invalidate(table_name, [dict(r) for r in rows])
         return True
-    
-    
\ No newline at end of file
+
+    @_timed
+    async def create_many(
+        self,
+        table_name: str,
+        rows: Sequence[Dict[str, Any]],
+        copy: bool = True,
+        gen_ids: bool = False,
+        conn: Optional[asyncpg.Connection] = None,
+    ) -> int:
+        """
+        Inserta muchas filas en una sola operación y retorna cuántas se enviaron.
+
+        - copy=True: COPY binario (`copy_records_to_table`), lo más rápido;
+          falla completo si alguna fila viola una restricción.
+        - copy=False: `executemany` de un INSERT preparado una sola vez.
+        - gen_ids=True: completa `id` con uuid4 en las filas que no lo traen
+          (p. ej. `messages.id` no tiene default en el servidor).
+
+        Si se pasa `conn` se usa esa conexión (útil dentro de una transacción).
+        """
+        if not rows:
+            return 0
+        if gen_ids:
+            rows = [row if row.get("id") else {**row, "id": str(uuid.uuid4())} for row in rows]
+        cols = _columns(rows)
+        records = [tuple(row[c] for c in cols) for row in rows]
+
+        async def run(c: asyncpg.Connection):
+            if copy:
+                schema, table = _split_table(table_name)
+                await c.copy_records_to_table(table, records=records, columns=cols, schema_name=schema)
+            else:
+                tbl = _ident(table_name)
+                sql = _cached_sql(("insert", tbl, tuple(cols), None), lambda: (
+                    f'INSERT INTO {tbl} ({", ".join(cols)}) '
+                    f'VALUES ({", ".join(f"${i+1}" for i in range(len(cols)))})'
+                ))
+                await c.executemany(sql, records)
+
+        if conn is not None:
+            await run(conn)
+        else:
+            async with get_pool().acquire() as c:
+                await run(c)
+        return len(records)
+
+    @_timed
+    async def upsert_many(
+        self,
+        table_name: str,
+        rows: Sequence[Dict[str, Any]],
+        conflict: Iterable[str],
+        update: Optional[Iterable[str]] = None,
+        gen_ids: bool = False,
+        conn: Optional[asyncpg.Connection] = None,
+    ) -> int:
+        """
+        INSERT ... ON CONFLICT (conflict) para muchas filas vía `executemany`.
+
+        `update` son las columnas a pisar con EXCLUDED cuando ya existe la fila
+        (si se omite, DO NOTHING). Si la tabla tiene `updated_at`, inclúyelo en
+        las filas para que se actualice.
+
+        Ejemplo:
+            await orm.upsert_many(
+                "users",
+                [{"id": ..., "phone_number": "521...", "name": "Ana"}],
+                conflict=["phone_number"],
+                update=["name"],
+            )
+        """
+        if not rows:
+            return 0
+        if gen_ids:
+            rows = [row if row.get("id") else {**row, "id": str(uuid.uuid4())} for row in rows]
+        tbl = _ident(table_name)
+        cols = _columns(rows)
+        target = tuple(_ident(c) for c in conflict)
+        upd = tuple(_ident(c) for c in (update or ()))
+
+        def build() -> str:
+            sql = (
+                f'INSERT INTO {tbl} ({", ".join(cols)}) '
+                f'VALUES ({", ".join(f"${i+1}" for i in range(len(cols)))}) '
+                f'ON CONFLICT ({", ".join(target)}) '
+            )
+            if upd:
+                return sql + "DO UPDATE SET " + ", ".join(f"{c} = EXCLUDED.{c}" for c in upd)
+            return sql + "DO NOTHING"
+
+        sql = _cached_sql(("upsert", tbl, tuple(cols), target, upd), build)
+        records = [tuple(row[c] for c in cols) for row in rows]
+        cached = self.cache.fields(table_name) if upd and self.cache is not None else ()
+
+        async def run(c: asyncpg.Connection):
+            if not cached:
+                await c.executemany(sql, records)
+                return
+            # Las filas pisadas pueden cambiar campos cacheados que no vienen
+            # en `rows`: se invalidan las claves de antes y de después
+            ret = ", ".join(_ident(col) for col in cached)
+            keys = [[None if row.get(col) is None else str(row[col]) for row in rows] for col in conflict]
+            match = (
+                f'SELECT {ret} FROM {tbl} WHERE ({", ".join(f"{t}::text" for t in target)}) IN '
+                f'(SELECT * FROM unnest({", ".join(f"${i+1}::text[]" for i in range(len(target)))}))'
+            )
+            async with c.transaction():
+                old = await c.fetch(match + " FOR UPDATE", *keys)
+                await c.executemany(sql, records)
+                new = await c.fetch(match, *keys)
+            await self.cache.invalidate(table_name, [*rows, *(dict(r) for r in (*old, *new))])
+
+        if conn is not None:
+            await run(conn)
+        else:
+            async with get_pool().acquire() as c:
+                await run(c)
+        return len(records)
@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import datetime
+import gzip
+import logging
+import os
+import re
+from pathlib import Path
+from typing import List
+
+import asyncpg
+
+from app.core import metrics
+from app.db.orm import get_pool
+
+PARTITION_RE = re.compile(r"^messages_p(\d{4})(\d{2})$")
+
+# Particiones mensuales existentes (adjuntas o ya separadas por un archivado a medias)
+LIST_PARTITIONS_SQL = """
+SELECT c.relname, EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid) AS attached
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind = 'r' AND n.nspname = current_schema() AND c.relname ~ '^messages_p[0-9]{6}$'
+ORDER BY c.relname
+"""
+
+
+def _month_of(name: str) -> datetime.date:
+    m = PARTITION_RE.match(name)
+    return datetime.date(int(m.group(1)), int(m.group(2)), 1)
+
+
+def _months_before(today: datetime.date, months: int) -> datetime.date:
+    """Primer día del mes `months` meses antes del mes de `today`."""
+    idx = today.year * 12 + today.month - 1 - months
+    return datetime.date(idx // 12, idx % 12 + 1, 1)
+
+
+async def ensure_partitions(conn: asyncpg.Connection, months_ahead: int = 3) -> int:
+    """
+    Crea las particiones de messages que falten hasta `months_ahead` meses
+    adelante, más las de los meses con filas en messages_default (que la
+    función mueve a su partición). Esas filas indican que el job no corrió
+    a tiempo o que llegó un created_at fuera de rango: se avisa.
+    """
+    stray = await conn.fetchval("SELECT count(*) FROM messages_default")
+    # Gauge y no counter: si el move falla, la próxima corrida vuelve a ver las mismas filas
+    metrics.MESSAGES_DEFAULT_ROWS.set(stray)
+    if stray:
+        logging.warning(f"{stray} messages row(s) in messages_default, moving them to monthly partitions")
+    return await conn.fetchval("SELECT ensure_messages_partitions($1)", months_ahead)
+
+
+async def archive_partition(conn: asyncpg.Connection, name: str, archive_dir: Path) -> Path:
+    """
+    Separa la partición (si sigue adjunta), la vuelca a `archive_dir/name.csv.gz`
+    y la borra. Si el proceso muere a la mitad, la tabla separada queda y el
+    siguiente run la vuelve a archivar.
+    """
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    attached = await conn.fetchval(
+        "SELECT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass($1))", name
+    )
+    if attached:
+        await conn.execute(f'ALTER TABLE messages DETACH PARTITION "{name}"')
+
+    # El mes pudo volver a crearse (filas atrasadas en messages_default) y
+    # archivarse otra vez: no pisar el archivo anterior
+    final = archive_dir / f"{name}.csv.gz"
+    n = 1
+    while final.exists():
+        final = archive_dir / f"{name}.{n}.csv.gz"
+        n += 1
+    tmp = final.with_suffix(final.suffix + ".tmp")
+    with gzip.open(tmp, "wb") as gz:
+        async def write(chunk: bytes):
+            await asyncio.to_thread(gz.write, chunk)
+
+        await conn.copy_from_table(name, output=write, format="csv", header=True)
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, final)
+
+    await conn.execute(f'DROP TABLE "{name}"')
+    return final
+
+
+async def archive_old_partitions(
+    conn: asyncpg.Connection,
+    retain_months: int,
+    archive_dir: str | Path,
+    today: datetime.date | None = None,
+) -> List[Path]:
+    """Archiva las particiones completamente anteriores a los últimos `retain_months` meses."""
+    cutoff = _months_before(today or datetime.date.today(), retain_months)
+    archived = []
+    for row in await conn.fetch(LIST_PARTITIONS_SQL):
+        if _month_of(row["relname"]) < cutoff:
+            path = await archive_partition(conn, row["relname"], Path(archive_dir))
+            logging.info(f"Archived partition {row['relname']} -> {path}")
+            archived.append(path)
+    return archived
+
+
+class PartitionMaintainer:
+    """
+    Job periódico: crea las particiones futuras de messages y archiva las
+    que salieron de la retención. Con varios workers, un advisory lock evita
+    que dos corran a la vez.
+    """
+
+    LOCK_KEY = 0x6D736770  # "msgp"
+
+    def __init__(self, months_ahead: int, retain_months: int, archive_dir: str, interval_s: float):
+        self.months_ahead = months_ahead
+        self.retain_months = retain_months
+        self.archive_dir = archive_dir
+        self.interval_s = interval_s
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self):
+        async with get_pool().acquire() as conn:
+            if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", self.LOCK_KEY):
+                return
+            try:
+                created = await ensure_partitions(conn, self.months_ahead)
+                if created:
+                    logging.info(f"Created {created} messages partition(s)")
+                if self.retain_months > 0:
+                    await archive_old_partitions(conn, self.retain_months, self.archive_dir)
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", self.LOCK_KEY)
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.exception(f"partition maintenance failed: {e}")
+            await asyncio.sleep(self.interval_s)
+
+
+async def _main():
+    from app.core.settings import settings
+    from app.db.orm import close_db_pool, init_db_pool
+
+    parser = argparse.ArgumentParser(description="Crea particiones futuras de messages y archiva las viejas.")
+    parser.add_argument("--months-ahead", type=int, default=settings.PARTITION_MONTHS_AHEAD)
+    parser.add_argument("--retain-months", type=int, default=settings.MESSAGES_RETENTION_MONTHS)
+    parser.add_argument("--archive-dir", default=settings.MESSAGES_ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    dsn = f"postgresql://{settings.DB_USER}:{settings.DB_PASSWORD}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
+    await init_db_pool(dsn)
+    try:
+        await PartitionMaintainer(args.months_ahead, args.retain_months, args.archive_dir, 0).run_once()
+    finally:
+        await close_db_pool()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,349 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import asyncpg
+
+from app.core import metrics
+from app.db.orm import AsyncPGORM, get_pool
+
+MESSAGE_COLUMNS = (
+    "id", "session_id", "channel_id", "role", "message_type", "content", "status", "created_at", "updated_at",
+)
+# Metadatos de media que llegan después (ver app/whatsapp/media.py)
+MEDIA_COLUMNS = ("media_id", "media_mime_type", "media_sha256", "media_size", "media_filename", "media_status")
+
+# Orden de `delivery_status` (el enum de Postgres compara en este orden):
+# un status sólo avanza, nunca vuelve de read a delivered.
+STATUS_ORDER = ("queued", "sent", "delivered", "read", "failed")
+STATUS_RANK = {s: i for i, s in enumerate(STATUS_ORDER)}
+
+# messages está particionada por mes: acotar created_at hace que el UPDATE
+# sólo toque las particiones recientes (los status llegan en horas/días).
+STATUS_WINDOW = "interval '30 days'"
+
+UPDATE_STATUSES_SQL = f"""
+UPDATE messages AS m
+SET status = u.status, status_updated_at = u.ts, updated_at = now()
+FROM unnest($1::varchar[], $2::delivery_status[], $3::timestamptz[]) AS u(channel_id, status, ts)
+WHERE m.channel_id = u.channel_id AND m.status < u.status
+  AND m.created_at > now() - {STATUS_WINDOW}
+RETURNING m.channel_id
+"""
+
+UPDATE_MEDIA_SQL = f"""
+UPDATE messages AS m
+SET media_id = u.media_id, media_mime_type = u.mime_type, media_sha256 = u.sha256,
+    media_size = u.size, media_filename = u.filename, media_status = u.status, updated_at = now()
+FROM unnest($1::varchar[], $2::varchar[], $3::varchar[], $4::varchar[], $5::bigint[], $6::varchar[], $7::varchar[])
+    AS u(channel_id, media_id, mime_type, sha256, size, filename, status)
+WHERE m.channel_id = u.channel_id
+  AND m.created_at > now() - {STATUS_WINDOW}
+RETURNING m.channel_id
+"""
+
+# Errores de una fila en particular (FK, NOT NULL, CHECK, valor inválido o
+# demasiado largo): reintentar el lote no sirve. Un created_at sin partición
+# mensual no falla: cae en messages_default (ver app/db/partitions.py).
+# Los UniqueViolation de los inserts se resuelven antes con el upsert.
+ROW_ERRORS = (asyncpg.IntegrityConstraintViolationError, asyncpg.DataError)
+
+# Para distinguir "no existe aún" de "ya estaba en un status igual o mayor"
+EXISTING_SQL = f"""
+SELECT channel_id FROM messages
+WHERE channel_id = ANY($1::varchar[]) AND created_at > now() - {STATUS_WINDOW}
+"""
+
+
+class MessageWriter:
+    """
+    Write-behind de `messages`: acumula en memoria los inserts (entrantes y
+    salientes) y las transiciones de status de los callbacks de WhatsApp, y
+    los escribe cada `flush_ms` o al juntar `max_rows`:
+
+    - un COPY con todas las filas nuevas (si choca un (channel_id, created_at)
+      repetido, cae a un upsert con ON CONFLICT DO NOTHING);
+    - un único `UPDATE ... FROM unnest(...)` por channel_id con los status;
+    - otro igual con los metadatos de media ya descargada.
+
+    Los status se coalescen por channel_id quedándose con el más avanzado y
+    el UPDATE tampoco deja retroceder. Un status de un mensaje que todavía
+    no está en la tabla (lo mismo para la media, que puede bajarse antes de
+    que venza la ventana de debounce del mensaje) se reintenta hasta
+    `status_retry_s`.
+
+    Si un lote falla por una fila inválida (ROW_ERRORS) se biseca hasta
+    aislarla: esa fila va a `dead_letter_path` (JSONL) y el resto se
+    escribe. Si falla todo el flush (Postgres caído), el lote vuelve al
+    buffer y el loop reintenta con backoff exponencial hasta `backoff_max_s`.
+    El buffer se acota en `max_buffer` entradas: lo que llega con el buffer
+    lleno se descarta (wa_dropped_total{reason="write_overflow"}).
+    `stop()` drena el buffer y manda a dead letter lo que no pueda escribir.
+    """
+
+    def __init__(
+        self,
+        orm: AsyncPGORM,
+        flush_ms: int = 200,
+        max_rows: int = 500,
+        status_retry_s: float = 60.0,
+        max_buffer: int = 50000,
+        backoff_max_s: float = 30.0,
+        dead_letter_path: Optional[str] = None,
+    ):
+        self._orm = orm
+        self._flush_s = flush_ms / 1000.0
+        self._max_rows = max_rows
+        self._status_retry_s = status_retry_s
+        self._max_buffer = max_buffer
+        self._backoff_max_s = backoff_max_s
+        self._dead_letter_path = dead_letter_path
+        self._messages: List[Dict[str, Any]] = []
+        # channel_id -> (status, ts, primera vez visto)
+        self._statuses: Dict[str, Tuple[str, datetime.datetime, float]] = {}
+        # channel_id -> (fila de MEDIA_COLUMNS, primera vez visto)
+        self._media: Dict[str, Tuple[Dict[str, Any], float]] = {}
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self.failures = 0  # flushes fallidos seguidos
+        self.written_messages = 0
+        self.written_statuses = 0
+        self.written_media = 0
+        self.dead_lettered = 0
+        self.dropped = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._messages) + len(self._statuses) + len(self._media)
+
+    def _full(self) -> bool:
+        if self.pending < self._max_buffer:
+            return False
+        self._drop(1)
+        return True
+
+    def _drop(self, n: int):
+        self.dropped += n
+        metrics.DROPPED.labels("write_overflow").inc(n)
+        # Un aviso por cada 1000 descartes: con Postgres caído llegan sin parar
+        if self.dropped // 1000 != (self.dropped - n) // 1000 or self.dropped == n:
+            logging.error(f"write-behind buffer full (max_buffer={self._max_buffer}), {self.dropped} entries dropped so far")
+
+    def add_messages(self, rows: List[Dict[str, Any]]):
+        """Encola filas completas de `messages` (ver MESSAGE_COLUMNS)."""
+        room = max(0, self._max_buffer - self.pending)
+        if len(rows) > room:
+            self._drop(len(rows) - room)
+            rows = rows[:room]
+        self._messages.extend(rows)
+        if self.pending >= self._max_rows:
+            self._wake.set()
+
+    def add_status(self, channel_id: str, status: str, ts_s: int | None = None):
+        if status not in STATUS_RANK:
+            logging.warning(f"Unknown WhatsApp status {status!r} for {channel_id}")
+            return
+        ts = datetime.datetime.fromtimestamp(ts_s or time.time(), tz=datetime.timezone.utc)
+        prev = self._statuses.get(channel_id)
+        if prev is None:
+            if self._full():
+                return
+            self._statuses[channel_id] = (status, ts, time.monotonic())
+        elif STATUS_RANK[status] > STATUS_RANK[prev[0]]:
+            self._statuses[channel_id] = (status, ts, prev[2])
+        if self.pending >= self._max_rows:
+            self._wake.set()
+
+    def add_media(self, channel_id: str, meta: Dict[str, Any]):
+        """Encola los metadatos (MEDIA_COLUMNS) de la media del mensaje `channel_id`."""
+        prev = self._media.get(channel_id)
+        if prev is None and self._full():
+            return
+        self._media[channel_id] = ({c: meta.get(c) for c in MEDIA_COLUMNS}, prev[1] if prev else time.monotonic())
+        if self.pending >= self._max_rows:
+            self._wake.set()
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Detiene el loop y escribe lo que quede en el buffer (o lo manda a dead letter)."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush(final=True)
+        except Exception as e:
+            logging.exception(f"write-behind final flush failed: {e}")
+            messages, self._messages = self._messages, []
+            statuses, self._statuses = self._statuses, {}
+            media, self._media = self._media, {}
+            await self._dead_letter("message", messages, e)
+            await self._dead_letter("status", [(c, st[0], st[1]) for c, st in statuses.items()], e)
+            await self._dead_letter("media", [(c, md[0]) for c, md in media.items()], e)
+
+    def _backoff_s(self) -> float:
+        return min(self._backoff_max_s, self._flush_s * 2 ** self.failures)
+
+    async def _loop(self):
+        while True:
+            if self.failures:
+                # Postgres no responde: no insistir en cada flush_ms ni con cada max_rows
+                await asyncio.sleep(self._backoff_s())
+            else:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self._flush_s)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+            try:
+                await self.flush()
+                self.failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logging.exception(
+                    f"write-behind flush failed ({self.failures} in a row, {self.pending} pending), "
+                    f"retrying in {self._backoff_s():.1f}s: {e}"
+                )
+
+    async def flush(self, final: bool = False):
+        async with self._flush_lock:
+            messages, self._messages = self._messages, []
+            statuses, self._statuses = self._statuses, {}
+            media, self._media = self._media, {}
+            if not messages and not statuses and not media:
+                return
+            try:
+                async with get_pool().acquire() as conn:
+                    if messages:
+                        await self._isolating(conn, "message", messages, self._insert)
+                    messages = []
+                    if statuses:
+                        retry = await self._isolating(
+                            conn, "status", list(statuses.items()),
+                            lambda c, items: self._update_statuses(c, items, final),
+                        )
+                        statuses = dict(retry)
+                    if media:
+                        retry = await self._isolating(
+                            conn, "media", list(media.items()),
+                            lambda c, items: self._update_media(c, items, final),
+                        )
+                        media = dict(retry)
+            finally:
+                # Lo no escrito vuelve al buffer (delante de lo que llegó mientras tanto)
+                self._messages[:0] = messages
+                for cid, st in statuses.items():
+                    cur = self._statuses.get(cid)
+                    if cur is None or STATUS_RANK[st[0]] > STATUS_RANK[cur[0]]:
+                        self._statuses[cid] = st
+                for cid, md in media.items():
+                    self._media.setdefault(cid, md)
+
+    async def _isolating(self, conn: asyncpg.Connection, kind: str, items: List,
+                         write: Callable[[asyncpg.Connection, List], Awaitable[List]]) -> List:
+        """
+        Corre `write(conn, items)` (devuelve lo que hay que reintentar). Si
+        falla por una fila inválida, parte el lote en mitades hasta aislarla
+        y la manda a dead letter: una fila mala no frena al resto.
+        """
+        try:
+            return await write(conn, items)
+        except ROW_ERRORS as e:
+            if len(items) == 1:
+                await self._dead_letter(kind, items, e)
+                return []
+            mid = len(items) // 2
+            return (await self._isolating(conn, kind, items[:mid], write)
+                    + await self._isolating(conn, kind, items[mid:], write))
+
+    async def _dead_letter(self, kind: str, items: List, error: Exception):
+        if not items:
+            return
+        self.dead_lettered += len(items)
+        metrics.DROPPED.labels("dead_letter").inc(len(items))
+        logging.error(f"write-behind: {len(items)} {kind} entries dead-lettered: {error!r}")
+        if not self._dead_letter_path:
+            return
+        lines = "".join(
+            json.dumps({"kind": kind, "error": repr(error), "item": item}, default=str, ensure_ascii=False) + "\n"
+            for item in items
+        )
+        try:
+            await asyncio.to_thread(_append, self._dead_letter_path, lines)
+        except OSError as e:
+            logging.error(f"dead letter write failed ({self._dead_letter_path}): {e}")
+
+    async def _insert(self, conn: asyncpg.Connection, rows: List[Dict[str, Any]]) -> List:
+        rows = [{c: row.get(c) for c in MESSAGE_COLUMNS} for row in rows]
+        for row in rows:
+            row["message_type"] = row["message_type"] or "text"
+        try:
+            async with conn.transaction():
+                await self._orm.create_many("messages", rows, conn=conn)
+        except asyncpg.UniqueViolationError:
+            await self._orm.upsert_many("messages", rows, conflict=["channel_id", "created_at"], conn=conn)
+        self.written_messages += len(rows)
+        return []
+
+    async def _update_statuses(self, conn: asyncpg.Connection, items: List[Tuple[str, Tuple]], final: bool) -> List:
+        """Aplica los status y devuelve los que hay que reintentar."""
+        statuses = dict(items)
+        ids = list(statuses)
+        updated = await conn.fetch(
+            UPDATE_STATUSES_SQL,
+            ids,
+            [statuses[c][0] for c in ids],
+            [statuses[c][1] for c in ids],
+        )
+        self.written_statuses += len(updated)
+        done = {r["channel_id"] for r in updated}
+        rest = [c for c in ids if c not in done]
+        if not rest:
+            return []
+        # Los que existen ya tenían un status igual o más avanzado: nada que hacer
+        existing = {r["channel_id"] for r in await conn.fetch(EXISTING_SQL, rest)}
+        now = time.monotonic()
+        retry = []
+        for c in rest:
+            if c in existing:
+                continue
+            if final or now - statuses[c][2] > self._status_retry_s:
+                logging.warning(f"Dropping status {statuses[c][0]} for unknown message {c}")
+                continue
+            retry.append((c, statuses[c]))
+        return retry
+
+    async def _update_media(self, conn: asyncpg.Connection, items: List[Tuple[str, Tuple]], final: bool) -> List:
+        """Aplica los metadatos de media y devuelve los de mensajes que aún no están en la tabla."""
+        media = dict(items)
+        ids = list(media)
+        cols = [[media[c][0][col] for c in ids] for col in MEDIA_COLUMNS]
+        updated = await conn.fetch(UPDATE_MEDIA_SQL, ids, *cols)
+        self.written_media += len(updated)
+        done = {r["channel_id"] for r in updated}
+        now = time.monotonic()
+        retry = []
+        for c in ids:
+            if c in done:
+                continue
+            if final or now - media[c][1] > self._status_retry_s:
+                logging.warning(f"Dropping media {media[c][0]['media_id']} for unknown message {c}")
+                continue
+            retry.append((c, media[c]))
+        return retry
+
+
+def _append(path: str, data: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(data)
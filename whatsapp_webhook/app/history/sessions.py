@@ -0,0 +1,44 @@
+# app/history/sessions.py
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+import asyncpg
+from redis.asyncio import Redis
+
+# Función creada en la migración 3b8f1c2d7a41 (db/alembic/versions)
+RESOLVE_SQL = "SELECT * FROM resolve_session($1, $2, $3, make_interval(secs => $4))"
+
+
+def _k_session(uid): return f"wa:{uid}:session"
+
+
+class SessionResolver:
+    """
+    Resuelve la sesión activa (users → conversations → sessions) de un wa_id,
+    creando lo que falte o rotando la sesión vencida, en un solo round trip
+    a la función `resolve_session`. El id queda cacheado en Redis hasta que
+    la sesión expira, así que sólo el primer mensaje de cada ventana toca
+    Postgres.
+    """
+
+    def __init__(self, r: Redis, pool: asyncpg.Pool, session_ttl_s: int = 24 * 60 * 60, channel: str = "whatsapp"):
+        self._r = r
+        self._pool = pool
+        self.session_ttl_s = session_ttl_s
+        self.channel = channel
+
+    async def resolve(self, wa_id: str, name: Optional[str] = None) -> Tuple[str, bool]:
+        """Devuelve (session_id, creada). `creada` indica que el historial está vacío."""
+        cached = await self._r.get(_k_session(wa_id))
+        if cached:
+            return cached, False
+
+        async with self._pool.acquire() as conn:
+            row = await conn.fetchrow(RESOLVE_SQL, wa_id, name, self.channel, float(self.session_ttl_s))
+
+        session_id = str(row["session_id"])
+        expires_at = row["expires_at"]
+        ttl = int((expires_at - datetime.now(timezone.utc)).total_seconds()) if expires_at else self.session_ttl_s
+        if ttl > 0:
+            await self._r.set(_k_session(wa_id), session_id, ex=ttl)
+        return session_id, row["created"]
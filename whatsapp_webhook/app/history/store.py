@@ -0,0 +1,159 @@
+# app/history/store.py
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import asyncpg
+from redis.asyncio import Redis
+
+from app.db.write_behind import MessageWriter
+
+# ====== Lua: append ======
+# KEYS: hist
+# ARGV: max_len, ttl_s, item_1..item_n
+# Write-through sólo si la lista ya está cargada: si no existe, la próxima
+# lectura la llena desde Postgres (que ya tiene estas filas).
+APPEND_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 3, #ARGV do
+    redis.call('RPUSH', KEYS[1], ARGV[i])
+end
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[1]), -1)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# ====== Lua: fill ======
+# KEYS: hist
+# ARGV: max_len, ttl_s, replace (0|1), item_1..item_n
+# Llena la lista tras un miss. Con replace=0 no pisa una lista que otro
+# proceso haya llenado mientras tanto.
+FILL_LUA = """
+if ARGV[3] == '1' then
+    redis.call('DEL', KEYS[1])
+elseif redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+for i = 4, #ARGV do
+    redis.call('RPUSH', KEYS[1], ARGV[i])
+end
+redis.call('LTRIM', KEYS[1], -tonumber(ARGV[1]), -1)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# Marca de "inicio de sesión": si la lista la contiene, no hay mensajes más
+# viejos en Postgres. Permite cachear historiales vacíos o cortos.
+START = ""
+
+HISTORY_ROLES = ("user", "assistant")
+
+
+def _k_hist(uid): return f"wa:{uid}:hist"
+
+
+class HistoryStore:
+    """
+    Historial reciente por wa_id para dar contexto al LLM.
+
+    - Redis guarda los últimos `max_messages` mensajes de la sesión activa en
+      una lista acotada (LTRIM) y con TTL; cada contenido se corta a
+      `max_chars`, así la memoria por usuario es fija.
+    - En un miss se carga con UNA query keyset sobre ix_messages_session_created.
+    - `record` agrega a la lista y encola la fila en el MessageWriter
+      (write-behind a Postgres), por lo que en régimen estable leer el
+      historial no toca Postgres. Un miss justo tras un mensaje puede no ver
+      las filas aún no escritas (a lo sumo un intervalo de flush).
+    """
+
+    def __init__(self, r: Redis, pool: asyncpg.Pool, writer: MessageWriter, max_messages: int = 20,
+                 max_chars: int = 1000, ttl_s: int = 24 * 60 * 60):
+        self._r = r
+        self._pool = pool
+        self._writer = writer
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self.ttl_s = ttl_s
+        self._append = r.register_script(APPEND_LUA)
+        self._fill = r.register_script(FILL_LUA)
+
+    async def preload(self) -> None:
+        for script in (self._append, self._fill):
+            await self._r.script_load(script.script)
+
+    def _item(self, role: str, content: str, ts_ms: int) -> str:
+        return json.dumps({"role": role, "content": (content or "")[:self.max_chars], "ts": ts_ms},
+                          ensure_ascii=False)
+
+    async def recent(self, wa_id: str, session_id: str) -> List[Dict[str, Any]]:
+        """Últimos mensajes de la sesión (más viejo primero)."""
+        raw = await self._r.lrange(_k_hist(wa_id), 0, -1)
+        if not raw:
+            rows = await self.page(session_id, limit=self.max_messages)
+            rows.reverse()
+            items = [self._item(r["role"], r["content"], int(r["created_at"].timestamp() * 1000)) for r in rows]
+            if len(rows) < self.max_messages:
+                items.insert(0, START)
+            await self._fill(keys=[_k_hist(wa_id)], args=[self.max_messages, self.ttl_s, 0, *items])
+            raw = items
+        return [json.loads(x) for x in raw if x != START]
+
+    async def reset(self, wa_id: str) -> None:
+        """Sesión nueva: el historial queda vacío y cacheado, sin consultar Postgres."""
+        await self._fill(keys=[_k_hist(wa_id)], args=[self.max_messages, self.ttl_s, 1, START])
+
+    async def page(self, session_id: str, before: Optional[Tuple[datetime, str]] = None,
+                   limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Página de mensajes de la sesión, del más nuevo al más viejo.
+        `before` es el cursor (created_at, id) del último mensaje de la página anterior.
+        """
+        sql = (
+            "SELECT id, role, content, created_at FROM messages "
+            "WHERE session_id = $1 AND role = ANY($2::message_role[]) "
+        )
+        params: list = [session_id, list(HISTORY_ROLES)]
+        if before is not None:
+            sql += "AND (created_at, id) < ($3, $4) "
+            params += [before[0], before[1]]
+        sql += f"ORDER BY created_at DESC, id DESC LIMIT ${len(params) + 1}"
+        params.append(limit)
+        async with self._pool.acquire() as conn:
+            rows = await conn.fetch(sql, *params)
+        return [dict(r) for r in rows]
+
+    async def record(self, wa_id: str, session_id: str, entries: Sequence[Dict[str, Any]]) -> None:
+        """
+        Persiste mensajes ({role, content, channel_id?, ts?, status?, message_type?}) y los agrega
+        al historial cacheado.
+        """
+        if not entries:
+            return
+        now_ms = int(time.time() * 1000)
+        rows = []
+        for e in entries:
+            created = datetime.fromtimestamp(e.get("ts", now_ms) / 1000, tz=timezone.utc)
+            rows.append({
+                "id": str(uuid.uuid4()),
+                "session_id": session_id,
+                "channel_id": e.get("channel_id"),
+                "role": e["role"],
+                "message_type": e.get("message_type", "text"),
+                "content": e.get("content"),
+                "status": e.get("status", "queued"),
+                "created_at": created,
+                "updated_at": created,
+            })
+        self._writer.add_messages(rows)
+        items = [self._item(e["role"], e.get("content"), e.get("ts", now_ms)) for e in entries]
+        try:
+            await self._append(keys=[_k_hist(wa_id)], args=[self.max_messages, self.ttl_s, *items])
+        except Exception as e:
+            # Postgres ya tiene las filas: basta con invalidar para recargar
+            logging.warning(f"history append failed for {wa_id}: {e}")
+            await self._r.delete(_k_hist(wa_id))
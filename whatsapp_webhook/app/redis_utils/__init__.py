@@ -1,15 +1,13 @@
-from .redis_utils import (
-    push_message_to_buffer,
-    pop_all_messages_from_buffer,
-    try_start_debounce,
-    clear_debounce,
-    DEBOUNCE_SEC
+from .client import (
+    create_redis,
+    get_redis,
+    close_redis,
+    health_check,
 )
 
 __all__ = [
-    "push_message_to_buffer",
-    "pop_all_messages_from_buffer",
-    "try_start_debounce",
-    "clear_debounce",
-    "DEBOUNCE_SEC"
-]
\ No newline at end of file
+    "create_redis",
+    "get_redis",
+    "close_redis",
+    "health_check",
+]
@@ -0,0 +1,96 @@
+# app/redis_utils/client.py
+import logging
+import time
+from typing import Any, Dict
+
+from redis.asyncio import BlockingConnectionPool, Redis
+
+from app.core.settings import settings
+
+redis: Redis | None = None
+
+
+def create_redis(
+    url: str,
+    backend: str = "redis",
+    max_connections: int = 64,
+    pool_timeout_s: float = 5.0,
+    socket_timeout_s: float | None = None,
+    health_check_interval_s: int = 30,
+) -> Redis:
+    """
+    Crea el cliente async compartido.
+
+    - backend="redis": pool de tamaño fijo (BlockingConnectionPool): si se
+      agotan las conexiones se espera hasta `pool_timeout_s` en vez de abrir
+      sockets sin límite. Las conexiones ociosas se verifican con PING cada
+      `health_check_interval_s`.
+    - backend="memory": Redis en memoria del proceso (fakeredis, con Lua vía
+      lupa) para correr un solo nodo o pruebas sin servidor. No se comparte
+      con otros procesos, así que el agent worker debe correr en el mismo
+      proceso o contra un Redis real.
+    """
+    if backend == "memory":
+        try:
+            from fakeredis import FakeServer
+            from fakeredis.aioredis import FakeRedis
+        except ImportError as e:  # pragma: no cover - dependencia opcional
+            raise RuntimeError("REDIS_BACKEND=memory requiere `pip install fakeredis[lua]`") from e
+        return FakeRedis(server=FakeServer(), decode_responses=True)
+    if backend != "redis":
+        raise ValueError(f"REDIS_BACKEND inválido: {backend!r}")
+
+    pool = BlockingConnectionPool.from_url(
+        url,
+        max_connections=max_connections,
+        timeout=pool_timeout_s,
+        socket_timeout=socket_timeout_s,
+        socket_keepalive=True,
+        health_check_interval=health_check_interval_s,
+        decode_responses=True,
+    )
+    return Redis(connection_pool=pool)
+
+
+async def get_redis() -> Redis:
+    global redis
+    if not redis:
+        redis = create_redis(
+            settings.REDIS_URL,
+            backend=settings.REDIS_BACKEND,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            pool_timeout_s=settings.REDIS_POOL_TIMEOUT_S,
+            socket_timeout_s=settings.REDIS_SOCKET_TIMEOUT_S,
+            health_check_interval_s=settings.REDIS_HEALTH_CHECK_INTERVAL_S,
+        )
+    return redis
+
+
+async def close_redis():
+    global redis
+    if redis:
+        await redis.aclose()
+        redis = None
+
+
+async def health_check() -> Dict[str, Any]:
+    """PING con latencia y uso del pool, para /health y el arranque."""
+    r = await get_redis()
+    out: Dict[str, Any] = {"backend": settings.REDIS_BACKEND}
+    t0 = time.perf_counter()
+    try:
+        out["ok"] = bool(await r.ping())
+    except Exception as e:
+        logging.warning(f"Redis health check failed: {e}")
+        out["ok"] = False
+        out["error"] = str(e)
+    out["latency_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+
+    pool = r.connection_pool
+    if isinstance(pool, BlockingConnectionPool):
+        out["pool"] = {
+            "max": pool.max_connections,
+            "in_use": len(pool._in_use_connections),
+            "idle": len(pool._available_connections),
+        }
+    return out
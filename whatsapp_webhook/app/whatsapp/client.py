@@ -0,0 +1,186 @@
+# app/whatsapp/client.py
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class WhatsAppSendError(Exception):
+    """Error definitivo al enviar (4xx no reintentable o reintentos agotados)."""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(f"WhatsApp API {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+class TokenBucket:
+    """Token bucket asíncrono: `rate` tokens/seg con ráfagas de hasta `burst`."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class WhatsAppClient:
+    """
+    Cliente saliente de WhatsApp Cloud API.
+
+    - Un solo httpx.AsyncClient (HTTP/2, keep-alive) por proceso.
+    - Token bucket por PHONE_NUMBER_ID para respetar el throughput de Meta.
+    - Reintentos con backoff exponencial + full jitter en 429/5xx y errores
+      de red (respeta Retry-After si viene).
+    - Cola de envíos acotada: `send_*` espera si hay `queue_size` envíos
+      encolados, y sólo `max_inflight` workers hablan con la API a la vez,
+      así una ráfaga no abre sockets sin límite.
+    """
+
+    def __init__(
+        self,
+        access_token: str,
+        phone_number_id: str,
+        version: str,
+        base_url: str = "https://graph.facebook.com",
+        rate_per_s: float = 80,
+        max_inflight: int = 32,
+        queue_size: int = 1000,
+        max_retries: int = 5,
+        backoff_base_s: float = 0.25,
+        backoff_max_s: float = 8.0,
+        timeout_s: float = 10.0,
+        http2: bool = True,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.phone_number_id = phone_number_id
+        self.version = version
+        self._rate = rate_per_s
+        self._max_inflight = max_inflight
+        self._max_retries = max_retries
+        self._backoff_base = backoff_base_s
+        self._backoff_max = backoff_max_s
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._workers: list[asyncio.Task] = []
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {access_token}"},
+            http2=http2,
+            timeout=timeout_s,
+            limits=httpx.Limits(max_connections=max_inflight, max_keepalive_connections=max_inflight),
+            transport=transport,
+        )
+
+    async def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self._max_inflight)]
+
+    async def close(self):
+        """Espera a que se vacíe la cola, detiene los workers y cierra el pool."""
+        if self._workers:
+            await self._queue.join()
+            for task in self._workers:
+                task.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._workers = []
+        await self._http.aclose()
+
+    async def send_text(self, to: str, text: str, phone_number_id: str | None = None) -> Dict[str, Any]:
+        payload = {
+            "messaging_product": "whatsapp",
+            "recipient_type": "individual",
+            "to": to,
+            "type": "text",
+            "text": {"preview_url": False, "body": text},
+        }
+        return await self.send(payload, phone_number_id)
+
+    async def send_typing_indicator(self, message_id: str, phone_number_id: str | None = None) -> Dict[str, Any]:
+        """Marca el mensaje como leído y muestra "escribiendo..." al usuario."""
+        payload = {
+            "messaging_product": "whatsapp",
+            "status": "read",
+            "message_id": message_id,
+            "typing_indicator": {"type": "text"},
+        }
+        return await self.send(payload, phone_number_id)
+
+    async def send(self, payload: Dict[str, Any], phone_number_id: str | None = None) -> Dict[str, Any]:
+        """Encola un envío a /{phone_number_id}/messages y espera su respuesta."""
+        await self.start()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((phone_number_id or self.phone_number_id, payload, fut))
+        return await fut
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def _bucket(self, phone_number_id: str) -> TokenBucket:
+        bucket = self._buckets.get(phone_number_id)
+        if bucket is None:
+            bucket = self._buckets[phone_number_id] = TokenBucket(self._rate)
+        return bucket
+
+    async def _worker(self):
+        while True:
+            phone_number_id, payload, fut = await self._queue.get()
+            try:
+                if not fut.cancelled():
+                    result = await self._post(phone_number_id, payload)
+                    if not fut.done():
+                        fut.set_result(result)
+            except Exception as e:
+                if not fut.done():
+                    fut.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def _backoff(self, attempt: int, retry_after: str | None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self._backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self._backoff_max, self._backoff_base * 2 ** attempt))
+
+    async def _post(self, phone_number_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        url = f"/{self.version}/{phone_number_id}/messages"
+        bucket = self._bucket(phone_number_id)
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            try:
+                resp = await self._http.post(url, json=payload)
+            except httpx.TransportError as e:
+                if attempt >= self._max_retries:
+                    raise WhatsAppSendError(0, repr(e)) from e
+                delay = self._backoff(attempt, None)
+            else:
+                if resp.status_code < 400:
+                    return resp.json()
+                if resp.status_code not in RETRY_STATUS or attempt >= self._max_retries:
+                    raise WhatsAppSendError(resp.status_code, resp.text)
+                delay = self._backoff(attempt, resp.headers.get("Retry-After"))
+
+            attempt += 1
+            logging.warning(f"WhatsApp send retry {attempt}/{self._max_retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
@@ -0,0 +1,125 @@
+# app/whatsapp/debounce.py
+import json
+import time
+from typing import Dict, List, Optional, Protocol, Tuple
+
+from redis.asyncio import Redis
+
+from app.core import metrics
+from app.whatsapp.scripts import BufferScripts
+from app.whatsapp.window import WindowPolicy
+
+
+class DebounceBackend(Protocol):
+    """
+    Buffer + ventana de debounce por wa_id. Lo usan `_buffer_messages`,
+    `claim_due`, `try_process` y `deliver_reply` sin saber dónde vive el estado.
+
+    - ingest: dedup por msg id, agrega al buffer (con `rx` = `now_ms`, cuándo
+      lo recibió el webhook) y (re)programa el fireAt a `now_ms` + la
+      ventana que da su WindowPolicy para ese usuario.
+    - claim: hasta `limit` usuarios vencidos como (wa_id, score).
+    - flush: si el score sigue vigente y no hay respuesta en curso, toma el
+      lock con un fencing token nuevo y devuelve (token, tanda ordenada por
+      ts); si no, None. Cuando se pospone por una respuesta en curso suma a
+      metrics.LOCK_CONTENTION.
+    - renew: extiende el lock mientras el agent trabaja (heartbeats); False
+      si el token ya no es el vigente.
+    - is_current: si el token sigue siendo el último emitido para el usuario;
+      se chequea justo antes de enviar, así un turno viejo no responde.
+    - release: suelta el lock si lo tiene `fence` (sin token, incondicional).
+    """
+
+    async def start(self) -> None: ...
+    async def stop(self) -> None: ...
+    async def ingest(self, by_user: Dict[str, List[dict]], now_ms: int) -> int: ...
+    async def claim(self, limit: int) -> List[Tuple[str, int]]: ...
+    async def flush(self, wa_id: str, claimed_score: int) -> Optional[Tuple[int, List[dict]]]: ...
+    async def renew(self, wa_id: str, fence: int) -> bool: ...
+    async def is_current(self, wa_id: str, fence: int) -> bool: ...
+    async def release(self, wa_id: str, fence: int | None = None) -> None: ...
+
+
+def _k_buf(uid):   return f"wa:{uid}:buf"
+def _k_lock(uid):  return f"wa:{uid}:lock"
+def _k_fence(uid): return f"wa:{uid}:fence"
+def _k_gaps(uid):  return f"wa:{uid}:gaps"
+def _k_dedup(mid): return f"wa:dedup:{mid}"
+def _k_sched():    return "wa:sched"
+
+
+class RedisDebounce:
+    """Estado en Redis (scripts Lua de app/whatsapp/scripts.py); compartido entre workers."""
+
+    # El contador de fencing sobrevive a cualquier turno en curso
+    FENCE_TTL_S = 24 * 60 * 60
+
+    def __init__(self, r: Redis, dedup_ttl_s: int, lease_ms: int, lock_ttl_ms: int, lock_retry_ms: int,
+                 window: WindowPolicy):
+        self._r = r
+        self.scripts = BufferScripts(r)
+        self.window = window
+        self._window_params = window.params_json()
+        self.dedup_ttl_s = dedup_ttl_s
+        self.lease_ms = lease_ms
+        self.lock_ttl_ms = lock_ttl_ms
+        self.lock_retry_ms = lock_retry_ms
+
+    async def start(self):
+        await self.scripts.preload()
+
+    async def stop(self):
+        pass
+
+    async def ingest(self, by_user: Dict[str, List[dict]], now_ms: int) -> int:
+        # Un EVALSHA por usuario, todos en un único pipeline (un round trip por webhook)
+        terminal = {}
+        async with self._r.pipeline(transaction=False) as pipe:
+            for wa_id, group in by_user.items():
+                items = [json.dumps({"id": m["id"], "ts": m["ts"], "text": m["text"], "name": m["name"], "rx": now_ms,
+                                     "type": m.get("type", "text")}) for m in group]
+                terminal[wa_id] = self.window.adaptive and self.window.is_terminal(max(group, key=lambda m: m["ts"])["text"])
+                await self.scripts.ingest(
+                    keys=[_k_buf(wa_id), _k_sched(), _k_gaps(wa_id), *(_k_dedup(m["id"]) for m in group)],
+                    args=[self.dedup_ttl_s, self.dedup_ttl_s, now_ms, wa_id, self._window_params,
+                          "1" if terminal[wa_id] else "0", *items],
+                    client=pipe,
+                )
+            results = await pipe.execute()
+        for wa_id, (accepted, window_ms) in zip(by_user, results):
+            if accepted:
+                self.window.record(int(window_ms), terminal[wa_id])
+        return sum(accepted for accepted, _ in results)
+
+    async def claim(self, limit: int) -> List[Tuple[str, int]]:
+        flat = await self.scripts.claim(
+            keys=[_k_sched()],
+            args=[int(time.time() * 1000), limit, self.lease_ms],
+        )
+        return [(flat[i], int(flat[i + 1])) for i in range(0, len(flat), 2)]
+
+    async def flush(self, wa_id: str, claimed_score: int) -> Optional[Tuple[int, List[dict]]]:
+        raw = await self.scripts.flush(
+            keys=[_k_sched(), _k_lock(wa_id), _k_buf(wa_id), _k_fence(wa_id)],
+            args=[wa_id, claimed_score, int(time.time() * 1000), self.lock_ttl_ms, self.lock_retry_ms,
+                  self.FENCE_TTL_S],
+        )
+        if raw == -1:
+            metrics.LOCK_CONTENTION.inc()
+            return None
+        if not raw:
+            return None
+        return int(raw[0]), [json.loads(x) for x in raw[1:]]
+
+    async def renew(self, wa_id: str, fence: int) -> bool:
+        return bool(await self.scripts.renew(keys=[_k_lock(wa_id), _k_fence(wa_id)], args=[fence, self.lock_ttl_ms]))
+
+    async def is_current(self, wa_id: str, fence: int) -> bool:
+        current = await self._r.get(_k_fence(wa_id))
+        return current is None or int(current) == fence
+
+    async def release(self, wa_id: str, fence: int | None = None):
+        if fence is None:
+            await self._r.delete(_k_lock(wa_id))
+        else:
+            await self.scripts.release(keys=[_k_lock(wa_id)], args=[fence])
@@ -0,0 +1,203 @@
+# app/whatsapp/dispatcher.py
+import asyncio
+import logging
+import os
+import socket
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Set, Tuple
+
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+from app.core import metrics
+from app.whatsapp.client import WhatsAppSendError
+
+DeliverFn = Callable[[Dict[str, str]], Awaitable[None]]
+
+
+def _permanent(e: Exception) -> bool:
+    """
+    Un WhatsAppSendError ya agotó los reintentos del WhatsAppClient (o es un
+    4xx que no tiene arreglo): reintentar aquí anidaría un segundo backoff.
+    """
+    return isinstance(e, WhatsAppSendError)
+
+
+class OutboundDispatcher:
+    """
+    Consume las respuestas que publica el agent worker en OUTBOUND_STREAM
+    (consumer group propio del webhook) y las entrega con `deliver`.
+
+    Cada usuario tiene su cola en memoria y una tarea que la entrega en
+    orden del stream (los segmentos de una respuesta en streaming deben
+    llegar en orden); usuarios distintos van en paralelo.
+
+    El envío a Graph API se reintenta sólo en el WhatsAppClient (backoff,
+    Retry-After, `max_retries`): si `deliver` lanza WhatsAppSendError, la
+    entrada se descarta (wa_dropped_total{reason="delivery_failed"}) y se
+    sigue con la próxima; si era la final del turno, el lock del usuario
+    vence por su TTL. Otros errores (Redis antes de enviar) se reintentan
+    en el lugar con backoff durante `retry_s` y los segmentos siguientes de
+    ese usuario esperan detrás. `deliver` no debe lanzar después de un
+    envío exitoso (ver deliver_reply), así un reintento nunca duplica.
+
+    Cada entrada se confirma con XACK sólo tras entregarse (o descartarse).
+    Las que quedan pendientes más de `claim_idle_ms` (proceso caído) se
+    reclaman con XAUTOCLAIM; las que este proceso ya tiene en cola no se
+    vuelven a encolar. `retry_s` debe ser menor que `claim_idle_ms` para
+    que otra réplica no reclame una entrada que aquí se sigue reintentando.
+    Se leen entradas nuevas sólo mientras haya menos de `max_pending` en
+    cola o en curso.
+    """
+
+    def __init__(
+        self,
+        r: Redis,
+        stream: str,
+        group: str,
+        deliver: DeliverFn,
+        consumer: str | None = None,
+        batch: int = 50,
+        block_ms: int = 5000,
+        claim_idle_ms: int = 30000,
+        retry_s: float = 10.0,
+        retry_base_s: float = 0.5,
+        retry_max_s: float = 4.0,
+        max_pending: int = 1000,
+    ):
+        self._r = r
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self._deliver = deliver
+        self._batch = batch
+        self._block_ms = block_ms
+        self._claim_idle_ms = claim_idle_ms
+        self._retry_s = retry_s
+        self._retry_base = retry_base_s
+        self._retry_max = retry_max_s
+        self._max_pending = max_pending
+        self._queues: Dict[str, Deque[Tuple[str, Dict[str, str]]]] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._known: Set[str] = set()  # entry ids en cola o en curso
+        self._room = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._known)
+
+    async def start(self):
+        try:
+            await self._r.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Corta las entregas en curso: lo no confirmado se reclama en el próximo arranque."""
+        tasks = [t for t in (self._task, *self._workers.values()) if t]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._workers.clear()
+        self._queues.clear()
+        self._known.clear()
+
+    async def _loop(self):
+        last_claim = 0.0
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                if len(self._known) >= self._max_pending:
+                    self._room.clear()
+                    await self._room.wait()
+                    continue
+
+                if loop.time() - last_claim > self._claim_idle_ms / 1000.0:
+                    last_claim = loop.time()
+                    _, stalled, *_ = await self._r.xautoclaim(
+                        self.stream, self.group, self.consumer,
+                        min_idle_time=self._claim_idle_ms, count=self._batch,
+                    )
+                    await self._handle(stalled)
+
+                resp = await self._r.xreadgroup(
+                    self.group, self.consumer, {self.stream: ">"},
+                    count=self._batch, block=self._block_ms,
+                )
+                for _, entries in resp or []:
+                    await self._handle(entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.exception(f"outbound dispatcher error: {e}")
+                await asyncio.sleep(1)
+
+    async def _handle(self, entries: List):
+        """Encola cada entrada detrás de las anteriores del mismo wa_id."""
+        trimmed = []
+        for entry_id, fields in entries:
+            if entry_id in self._known:
+                continue  # ya está en cola aquí (la reclamó XAUTOCLAIM mientras se reintentaba)
+            if fields is None:
+                # Recortada por MAXLEN mientras estaba pendiente
+                trimmed.append(entry_id)
+                continue
+            wa_id = fields.get("wa_id", "")
+            self._known.add(entry_id)
+            self._queues.setdefault(wa_id, deque()).append((entry_id, fields))
+            if wa_id not in self._workers:
+                self._workers[wa_id] = asyncio.create_task(self._drain(wa_id))
+        if trimmed:
+            await self._r.xack(self.stream, self.group, *trimmed)
+
+    async def _drain(self, wa_id: str):
+        queue = self._queues[wa_id]
+        try:
+            while queue:
+                entry_id, fields = queue[0]
+                await self._deliver_with_retry(entry_id, fields)
+                await self._r.xack(self.stream, self.group, entry_id)
+                queue.popleft()
+                self._known.discard(entry_id)
+                self._room.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # XACK falló: las entradas quedan pendientes y vuelven por XAUTOCLAIM
+            logging.exception(f"outbound ack failed for {wa_id}: {e}")
+            for entry_id, _ in queue:
+                self._known.discard(entry_id)
+            queue.clear()
+            self._room.set()
+        finally:
+            self._workers.pop(wa_id, None)
+            if not queue:
+                self._queues.pop(wa_id, None)
+
+    async def _deliver_with_retry(self, entry_id: str, fields: Dict[str, str]):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._retry_s
+        attempt = 0
+        while True:
+            try:
+                await self._deliver(fields)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                remaining = deadline - loop.time()
+                if _permanent(e) or remaining <= 0:
+                    metrics.DROPPED.labels("delivery_failed").inc()
+                    logging.error(
+                        f"deliver failed for {entry_id} ({fields.get('wa_id')}, turno {fields.get('turn_id')}, "
+                        f"seq {fields.get('seq')}), descartada tras {attempt + 1} intentos: {e!r}"
+                    )
+                    return
+                delay = min(self._retry_max, self._retry_base * 2 ** attempt, remaining)
+                attempt += 1
+                logging.warning(f"deliver error for {entry_id}, retry {attempt} in {delay:.2f}s: {e!r}")
+                await asyncio.sleep(delay)
@@ -0,0 +1,366 @@
+# app/whatsapp/local_debounce.py
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from itertools import count, islice
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core import metrics
+from app.whatsapp.window import WindowPolicy
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class TimerWheel:
+    """
+    Timer wheel jerárquico: `levels` ruedas de `slots` ranuras; la ranura
+    del nivel i cubre tick_ms * slots**i ms. Programar es O(1) y avanzar
+    cuesta O(ranuras recorridas + timers vencidos), sin una corrutina ni
+    un heap por usuario.
+
+    Reprogramar una clave no busca la entrada vieja: la deadline vigente
+    vive en `_deadline` y las entradas obsoletas se descartan al vencer.
+    """
+
+    def __init__(self, tick_ms: int = 10, slots: int = 256, levels: int = 3, now_ms: int | None = None):
+        self.tick = tick_ms
+        self.slots = slots
+        self.levels = levels
+        self._spans = [tick_ms * slots ** i for i in range(levels)]
+        self._wheels: List[List[list]] = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._deadline: Dict[str, int] = {}
+        self._current = ((now_ms if now_ms is not None else _now_ms()) // tick_ms) * tick_ms
+
+    def __len__(self) -> int:
+        return len(self._deadline)
+
+    def deadline(self, key: str) -> Optional[int]:
+        return self._deadline.get(key)
+
+    def schedule(self, key: str, deadline_ms: int):
+        self._deadline[key] = deadline_ms
+        self._insert(key, deadline_ms)
+
+    def cancel(self, key: str):
+        self._deadline.pop(key, None)
+
+    def _insert(self, key: str, deadline_ms: int):
+        # Ranura del primer tick >= deadline (nunca la actual, que ya se procesó)
+        at = max(-(-deadline_ms // self.tick) * self.tick, self._current + self.tick)
+        delta = at - self._current
+        for level, span in enumerate(self._spans):
+            if delta < span * self.slots or level == self.levels - 1:
+                # Más allá del último nivel: se reinserta al pasar por la ranura
+                at = min(at, self._current + span * (self.slots - 1))
+                self._wheels[level][(at // span) % self.slots].append((key, deadline_ms))
+                return
+
+    def advance(self, now_ms: int) -> List[Tuple[str, int]]:
+        """Avanza hasta `now_ms` y devuelve los (clave, deadline) vencidos."""
+        due: List[Tuple[str, int]] = []
+        while self._current + self.tick <= now_ms:
+            self._current += self.tick
+            # Cascada: al completar una vuelta de un nivel, baja la ranura del siguiente
+            for level in range(1, self.levels):
+                if (self._current // self.tick) % (self.slots ** level):
+                    break
+                span = self._spans[level]
+                slot = self._wheels[level][(self._current // span) % self.slots]
+                entries, slot[:] = list(slot), []
+                for key, dl in entries:
+                    if self._deadline.get(key) == dl:
+                        if dl <= self._current:
+                            due.append((key, dl))
+                        else:
+                            self._insert(key, dl)
+            slot = self._wheels[0][(self._current // self.tick) % self.slots]
+            if slot:
+                entries, slot[:] = list(slot), []
+                for key, dl in entries:
+                    if self._deadline.get(key) != dl:
+                        continue
+                    if dl <= self._current:
+                        due.append((key, dl))
+                    else:
+                        self._insert(key, dl)
+            # Si no hay nada programado, salta directo al presente
+            if not self._deadline:
+                self._current = (now_ms // self.tick) * self.tick
+                break
+        for key, _ in due:
+            self._deadline.pop(key, None)
+        return due
+
+
+class _User:
+    __slots__ = ("items", "fire_at")
+
+    def __init__(self):
+        # (ts, msg_id, text, name, rx_ms, type): tuplas en vez de dicts/JSON
+        self.items: List[Tuple[int, str, str, Optional[str], int, str]] = []
+        self.fire_at = 0
+
+
+class Journal:
+    """
+    Journal append-only (JSON por línea) del buffer: "i" agrega un mensaje,
+    "f" drena el buffer de un usuario. Al arrancar se reproduce y, si creció
+    más de `compact_bytes`, se reescribe sólo con lo que sigue pendiente.
+    """
+
+    def __init__(self, path: str | Path, fsync: bool = False, compact_bytes: int = 64 * 1024 * 1024):
+        self.path = Path(path)
+        self.fsync = fsync
+        self.compact_bytes = compact_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = open(self.path, "a", encoding="utf-8")
+
+    def replay(self) -> Dict[str, Tuple[int, List[tuple]]]:
+        pending: Dict[str, Tuple[int, List[tuple]]] = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break  # última línea truncada por el crash
+                if rec[0] == "i":
+                    _, wa_id, fire_at, item = rec
+                    _, items = pending.get(wa_id, (0, []))
+                    items.append(tuple(item))
+                    pending[wa_id] = (fire_at, items)
+                elif rec[0] == "f":
+                    pending.pop(rec[1], None)
+        return pending
+
+    def append(self, records: List[list]):
+        self._f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+        self._f.flush()
+        if self.fsync:
+            os.fsync(self._f.fileno())
+
+    def maybe_compact(self, snapshot: Callable[[], Dict[str, Tuple[int, List[tuple]]]]):
+        """`snapshot` sólo se evalúa si hay que compactar."""
+        if self._f.tell() < self.compact_bytes:
+            return
+        pending = snapshot()
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for wa_id, (fire_at, items) in pending.items():
+                for item in items:
+                    f.write(json.dumps(["i", wa_id, fire_at, list(item)], ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._f.close()
+        os.replace(tmp, self.path)
+        self._f = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        self._f.close()
+
+
+class LocalDebounce:
+    """
+    Debounce en memoria para despliegues de un solo nodo: mismo contrato que
+    RedisDebounce (ver DebounceBackend) pero sin round trips.
+
+    - Buffers por wa_id como listas de tuplas, ventanas en un TimerWheel.
+    - Memoria acotada: a lo sumo `max_users` usuarios con estado y
+      `max_buffer` mensajes por usuario; si se llena, el usuario con menos
+      actividad reciente se adelanta (su tanda sale ya) en vez de perderse.
+      Dedup y locks son LRU acotados que se limpian solos.
+    - Fencing tokens de un contador del proceso sembrado con el reloj, así
+      los turnos publicados antes de un reinicio no chocan con los nuevos.
+    - Histogramas de pausas (ventana adaptativa) en un LRU de `max_users`.
+    - `journal_path` opcional: los mensajes bufferizados sobreviven un crash
+      y se reprograman al arrancar.
+    """
+
+    def __init__(
+        self,
+        dedup_ttl_s: int,
+        lock_ttl_ms: int,
+        lock_retry_ms: int,
+        window: WindowPolicy,
+        tick_ms: int = 10,
+        max_users: int = 100_000,
+        max_buffer: int = 50,
+        max_dedup: int = 200_000,
+        journal_path: str | None = None,
+        journal_fsync: bool = False,
+    ):
+        self.dedup_ttl_s = dedup_ttl_s
+        self.lock_ttl_ms = lock_ttl_ms
+        self.lock_retry_ms = lock_retry_ms
+        self.max_users = max_users
+        self.max_buffer = max_buffer
+        self.max_dedup = max_dedup
+        self.window = window
+        self._cadence: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._wheel = TimerWheel(tick_ms)
+        self._users: "OrderedDict[str, _User]" = OrderedDict()  # orden = actividad reciente
+        self._ready: Deque[Tuple[str, int]] = deque()
+        self._dedup: "OrderedDict[str, float]" = OrderedDict()
+        # wa_id -> (fence, vence_ms); al soltarlo queda con vence_ms=0 para
+        # que is_current siga rechazando tokens viejos
+        self._locks: Dict[str, Tuple[int, int]] = {}
+        self._fences = count(_now_ms() * 1000)
+        self._journal = Journal(journal_path, journal_fsync) if journal_path else None
+        self.evicted = 0
+
+    async def start(self):
+        if self._journal is None:
+            return
+        pending = self._journal.replay()
+        for wa_id, (fire_at, items) in pending.items():
+            user = self._users.setdefault(wa_id, _User())
+            user.items.extend(items)
+            self._trim(user)
+            user.fire_at = fire_at
+            self._wheel.schedule(wa_id, fire_at)
+        self._journal.maybe_compact(self._snapshot)
+        if pending:
+            logging.info(f"Debounce journal: {len(pending)} buffered user(s) restored")
+
+    async def stop(self):
+        if self._journal is not None:
+            self._journal.close()
+
+    @property
+    def users(self) -> int:
+        return len(self._users)
+
+    def _seen(self, msg_id: str) -> bool:
+        now = time.monotonic()
+        while self._dedup:
+            expires = next(iter(self._dedup.values()))
+            if expires > now and len(self._dedup) < self.max_dedup:
+                break
+            self._dedup.popitem(last=False)
+        if msg_id in self._dedup:
+            return True
+        self._dedup[msg_id] = now + self.dedup_ttl_s
+        return False
+
+    def _snapshot(self) -> Dict[str, Tuple[int, List[tuple]]]:
+        return {wa_id: (u.fire_at, u.items) for wa_id, u in self._users.items() if u.items}
+
+    def _trim(self, user: _User):
+        """Se queda con los últimos `max_buffer` mensajes del usuario."""
+        if len(user.items) > self.max_buffer:
+            metrics.DROPPED.labels("buffer_overflow").inc(len(user.items) - self.max_buffer)
+            del user.items[:-self.max_buffer]
+
+    def _evict(self):
+        """
+        Sobre el límite, adelanta a los usuarios menos activos: su tanda se
+        procesa ya y el estado se libera en el flush. Los que ya estaban
+        reclamados (sin deadline) cuentan como liberados.
+        """
+        over = len(self._users) - self.max_users
+        if over <= 0:
+            return
+        for wa_id in list(islice(self._users, over)):
+            if self._wheel.deadline(wa_id) is not None:
+                self._wheel.cancel(wa_id)
+                self._ready.append((wa_id, self._users[wa_id].fire_at))
+                self.evicted += 1
+
+    def _window_for(self, wa_id: str, last_text: str, now_ms: int) -> int:
+        if not self.window.adaptive:
+            self.window.record(self.window.window_ms)
+            return self.window.window_ms
+        hist = self.window.update(self._cadence.pop(wa_id, None), now_ms)
+        self._cadence[wa_id] = hist
+        if len(self._cadence) > self.max_users:
+            self._cadence.popitem(last=False)
+        terminal = self.window.is_terminal(last_text)
+        window_ms = self.window.pick(hist, terminal)
+        self.window.record(window_ms, terminal)
+        return window_ms
+
+    async def ingest(self, by_user: Dict[str, List[dict]], now_ms: int) -> int:
+        accepted = 0
+        records = []
+        for wa_id, group in by_user.items():
+            fresh = [m for m in group if not self._seen(m["id"])]
+            if not fresh:
+                continue
+            fire_at_ms = now_ms + self._window_for(wa_id, max(fresh, key=lambda m: m["ts"])["text"], now_ms)
+            user = self._users.get(wa_id)
+            if user is None:
+                user = self._users[wa_id] = _User()
+            self._users.move_to_end(wa_id)
+            for m in fresh:
+                item = (m["ts"], m["id"], m["text"], m.get("name"), now_ms, m.get("type", "text"))
+                user.items.append(item)
+                records.append(["i", wa_id, fire_at_ms, list(item)])
+            self._trim(user)
+            user.fire_at = fire_at_ms
+            self._wheel.schedule(wa_id, fire_at_ms)
+            accepted += len(fresh)
+        if records and self._journal is not None:
+            self._journal.append(records)
+        self._evict()
+        return accepted
+
+    async def claim(self, limit: int) -> List[Tuple[str, int]]:
+        self._ready.extend(self._wheel.advance(_now_ms()))
+        out = []
+        while self._ready and len(out) < limit:
+            out.append(self._ready.popleft())
+        return out
+
+    async def flush(self, wa_id: str, claimed_score: int) -> Optional[Tuple[int, List[dict]]]:
+        user = self._users.get(wa_id)
+        # Llegó un mensaje nuevo (la ventana se reprogramó) o ya se procesó
+        if user is None or user.fire_at != claimed_score or self._wheel.deadline(wa_id) is not None:
+            return None
+        now = _now_ms()
+        if self._locks.get(wa_id, (0, 0))[1] > now:
+            # Hay una respuesta en curso: reintenta más tarde
+            metrics.LOCK_CONTENTION.inc()
+            user.fire_at = now + self.lock_retry_ms
+            self._wheel.schedule(wa_id, user.fire_at)
+            return None
+        del self._users[wa_id]
+        if not user.items:
+            return None
+        fence = next(self._fences)
+        self._locks[wa_id] = (fence, now + self.lock_ttl_ms)
+        self._prune_locks(now)
+        if self._journal is not None:
+            self._journal.append([["f", wa_id]])
+            self._journal.maybe_compact(self._snapshot)
+        items = sorted(user.items, key=lambda it: it[0])  # sort estable: empate por llegada
+        return fence, [
+            {"id": it[1], "ts": it[0], "text": it[2], "name": it[3], "rx": it[4], "type": it[5]}
+            for it in items
+        ]
+
+    def _prune_locks(self, now: int):
+        if len(self._locks) > self.max_users:
+            # Locks vencidos hace rato: ya no queda ningún turno que fencear
+            horizon = now - self.dedup_ttl_s * 1000
+            for k in [k for k, (_, exp) in self._locks.items() if exp <= horizon]:
+                del self._locks[k]
+
+    async def renew(self, wa_id: str, fence: int) -> bool:
+        lock = self._locks.get(wa_id)
+        if lock is not None and lock[0] != fence:
+            return False
+        self._locks[wa_id] = (fence, _now_ms() + self.lock_ttl_ms)
+        return True
+
+    async def is_current(self, wa_id: str, fence: int) -> bool:
+        lock = self._locks.get(wa_id)
+        return lock is None or lock[0] == fence
+
+    async def release(self, wa_id: str, fence: int | None = None):
+        lock = self._locks.get(wa_id)
+        if lock is not None and (fence is None or lock[0] == fence):
+            self._locks[wa_id] = (lock[0], 0)
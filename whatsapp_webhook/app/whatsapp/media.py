@@ -0,0 +1,394 @@
+# app/whatsapp/media.py
+"""
+Descarga de la media entrante (image/audio/video/document/sticker) fuera
+del request del webhook.
+
+handle_message sólo publica un job por mensaje en MEDIA_STREAM; el
+MediaFetcher lo consume con su propio consumer group y:
+
+1. resuelve el media_id en Graph API (GET /{version}/{media_id} -> url,
+   mime_type, sha256, file_size);
+2. baja el archivo en streaming, de a `chunk_bytes` (memoria acotada por
+   descarga, sin importar el tamaño), calculando el sha256 mientras escribe;
+3. lo guarda en el MediaStore, direccionado por contenido;
+4. entrega los metadatos a `on_result` (el MessageWriter los escribe en la
+   fila del mensaje) y confirma con XACK.
+
+Dedup en tres niveles: media_id ya descargado (clave en Redis con TTL),
+sha256 (del webhook o de los metadatos de Graph API) que ya está en disco,
+sin bajar el archivo, y mismo contenido bajado dos veces a la vez (el
+segundo archivo se descarta).
+`max_concurrent` acota las descargas simultáneas del proceso.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import random
+import socket
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+from app.core import metrics
+from app.whatsapp.client import RETRY_STATUS
+
+ResultFn = Callable[[str, Dict[str, Any]], None]
+
+TMP_DIR = "tmp"
+
+
+def _k_media(media_id: str) -> str:
+    return f"wa:media:{media_id}"
+
+
+def normalize_sha256(value: Optional[str]) -> Optional[str]:
+    """sha256 en hex; Meta lo manda en hex o en base64 según el endpoint."""
+    if not value:
+        return None
+    v = value.strip()
+    if len(v) == 64:
+        try:
+            bytes.fromhex(v)
+            return v.lower()
+        except ValueError:
+            pass
+    try:
+        raw = base64.b64decode(v, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return raw.hex() if len(raw) == 32 else None
+
+
+class MediaError(Exception):
+    """Falla definitiva de una descarga (no se reintenta): too_large, http, checksum."""
+
+    def __init__(self, reason: str, detail: Any = None):
+        super().__init__(f"media {reason}: {detail}")
+        self.reason = reason
+        self.detail = detail
+
+
+class MediaStore:
+    """
+    Archivos direccionados por contenido: `root/ab/cd/<sha256>`. Se escriben
+    en `root/tmp/*.part` y se mueven con os.replace al terminar (atómico),
+    así nunca queda un archivo a medias bajo su sha256. Las operaciones son
+    bloqueantes: MediaFetcher las corre en un thread.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.tmp = os.path.join(self.root, TMP_DIR)
+
+    def start(self):
+        os.makedirs(self.tmp, exist_ok=True)
+        # Restos de descargas interrumpidas (proceso caído o cancelado)
+        for name in os.listdir(self.tmp):
+            try:
+                os.unlink(os.path.join(self.tmp, name))
+            except OSError:
+                pass
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def size(self, sha256: str) -> Optional[int]:
+        """Tamaño del archivo si ya está guardado."""
+        try:
+            return os.stat(self.path(sha256)).st_size
+        except FileNotFoundError:
+            return None
+
+    def open_tmp(self):
+        fd, path = tempfile.mkstemp(dir=self.tmp, suffix=".part")
+        return os.fdopen(fd, "wb"), path
+
+    def commit(self, tmp_path: str, sha256: str) -> bool:
+        """Mueve el .part a su lugar; False si ese contenido ya estaba (se descarta)."""
+        dest = self.path(sha256)
+        if os.path.exists(dest):
+            os.unlink(tmp_path)
+            return False
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(tmp_path, dest)
+        return True
+
+
+class MediaFetcher:
+    """
+    Consumidor de MEDIA_STREAM (mismo patrón que OutboundDispatcher: XACK
+    tras procesar, XAUTOCLAIM de lo que quede colgado). Lee como mucho
+    2 * max_concurrent jobs a la vez; el semáforo deja `max_concurrent`
+    descargas activas y el resto espera su turno sin ocupar memoria.
+
+    Los 429/5xx y errores de red se reintentan con backoff (la descarga
+    vuelve a empezar); un 4xx, un archivo mayor a `max_bytes` o un checksum
+    distinto marcan la media como failed.
+    """
+
+    def __init__(
+        self,
+        r: Redis,
+        store: MediaStore,
+        access_token: str,
+        version: str,
+        base_url: str = "https://graph.facebook.com",
+        stream: str = "wa:media",
+        group: str = "media",
+        on_result: Optional[ResultFn] = None,
+        consumer: str | None = None,
+        max_concurrent: int = 4,
+        chunk_bytes: int = 64 * 1024,
+        max_bytes: int = 100 * 1024 * 1024,
+        max_retries: int = 3,
+        id_ttl_s: int = 30 * 24 * 60 * 60,
+        block_ms: int = 5000,
+        claim_idle_ms: int = 5 * 60 * 1000,
+        backoff_base_s: float = 0.5,
+        backoff_max_s: float = 8.0,
+        timeout_s: float = 30.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self._r = r
+        self.store = store
+        self.version = version
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self._on_result = on_result
+        self._max_concurrent = max_concurrent
+        self._chunk_bytes = chunk_bytes
+        self._max_bytes = max_bytes
+        self._max_retries = max_retries
+        self._id_ttl_s = id_ttl_s
+        self._block_ms = block_ms
+        self._claim_idle_ms = claim_idle_ms
+        self._backoff_base = backoff_base_s
+        self._backoff_max = backoff_max_s
+        self._sem = asyncio.Semaphore(max_concurrent)
+        self._jobs: Dict[str, asyncio.Task] = {}  # entry_id -> task
+        self._task: asyncio.Task | None = None
+        self.downloading = 0
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {access_token}"},
+            timeout=timeout_s,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=max_concurrent * 2, max_keepalive_connections=max_concurrent),
+            transport=transport,
+        )
+
+    async def start(self):
+        await asyncio.to_thread(self.store.start)
+        try:
+            await self._r.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Corta las descargas en curso: quedan pendientes y se reclaman en el próximo arranque."""
+        tasks = [t for t in (self._task, *self._jobs.values()) if t]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._jobs.clear()
+        await self._http.aclose()
+
+    async def _loop(self):
+        last_claim = 0.0
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                room = 2 * self._max_concurrent - len(self._jobs)
+                if room <= 0:
+                    await asyncio.wait(list(self._jobs.values()), return_when=asyncio.FIRST_COMPLETED)
+                    continue
+
+                if loop.time() - last_claim > self._claim_idle_ms / 1000.0:
+                    last_claim = loop.time()
+                    _, stalled, *_ = await self._r.xautoclaim(
+                        self.stream, self.group, self.consumer,
+                        min_idle_time=self._claim_idle_ms, count=room,
+                    )
+                    self._spawn(stalled)
+                    continue
+
+                resp = await self._r.xreadgroup(
+                    self.group, self.consumer, {self.stream: ">"},
+                    count=room, block=self._block_ms,
+                )
+                for _, entries in resp or []:
+                    self._spawn(entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.exception(f"media fetcher error: {e}")
+                await asyncio.sleep(1)
+
+    def _spawn(self, entries: List):
+        for entry_id, fields in entries:
+            if entry_id in self._jobs:
+                continue  # sigue bajando (más lento que claim_idle_ms)
+            task = asyncio.create_task(self._handle(entry_id, fields))
+            self._jobs[entry_id] = task
+            task.add_done_callback(lambda _, eid=entry_id: self._jobs.pop(eid, None))
+
+    async def _handle(self, entry_id: str, fields: Optional[Dict[str, str]]):
+        if fields is None:
+            # Recortada por MAXLEN mientras estaba pendiente
+            await self._r.xack(self.stream, self.group, entry_id)
+            return
+        media_id = fields["media_id"]
+        try:
+            meta = await self.fetch(media_id, fields.get("mime_type"), fields.get("sha256"))
+            status = "stored"
+        except MediaError as e:
+            logging.warning(f"media {media_id} of {fields.get('msg_id')} failed: {e}")
+            metrics.MEDIA_FAILED.labels(e.reason).inc()
+            meta = {"mime_type": fields.get("mime_type") or None, "sha256": None, "size": None}
+            status = "failed"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Redis, disco, etc.: queda pendiente y se reintenta al reclamarse
+            logging.exception(f"media {media_id} of {fields.get('msg_id')} error: {e}")
+            metrics.MEDIA_FAILED.labels("error").inc()
+            return
+
+        if self._on_result is not None and fields.get("msg_id"):
+            self._on_result(fields["msg_id"], {
+                "media_id": media_id,
+                "media_mime_type": meta["mime_type"],
+                "media_sha256": meta["sha256"],
+                "media_size": meta["size"],
+                "media_filename": fields.get("filename") or None,
+                "media_status": status,
+            })
+        await self._r.xack(self.stream, self.group, entry_id)
+
+    async def fetch(self, media_id: str, mime_type: str | None = None, sha256: str | None = None) -> Dict[str, Any]:
+        """
+        Devuelve {sha256, size, mime_type} de la media, bajándola sólo si hace
+        falta. Lanza MediaError si no se puede guardar.
+        """
+        cached = await self._r.get(_k_media(media_id))
+        if cached:
+            metrics.MEDIA_DEDUP.labels("media_id").inc()
+            return json.loads(cached)
+
+        expected = normalize_sha256(sha256)
+        size = await asyncio.to_thread(self.store.size, expected) if expected else None
+        if size is not None:
+            metrics.MEDIA_DEDUP.labels("content").inc()
+            meta = {"sha256": expected, "size": size, "mime_type": mime_type}
+        else:
+            async with self._sem:
+                self.downloading += 1
+                try:
+                    with metrics.MEDIA_DOWNLOAD_SECONDS.time():
+                        meta = await self._download(media_id, mime_type)
+                finally:
+                    self.downloading -= 1
+
+        await self._r.set(_k_media(media_id), json.dumps(meta), ex=self._id_ttl_s)
+        return meta
+
+    def _backoff(self, attempt: int, retry_after: str | None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self._backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self._backoff_max, self._backoff_base * 2 ** attempt))
+
+    async def _download(self, media_id: str, mime_type: str | None) -> Dict[str, Any]:
+        attempt = 0
+        while True:
+            try:
+                return await self._download_once(media_id, mime_type)
+            except httpx.TransportError as e:
+                if attempt >= self._max_retries:
+                    raise MediaError("http", repr(e)) from e
+                delay = self._backoff(attempt, None)
+            except httpx.HTTPStatusError as e:
+                resp = e.response
+                if resp.status_code not in RETRY_STATUS or attempt >= self._max_retries:
+                    raise MediaError("http", f"{resp.status_code} {resp.request.url}") from e
+                delay = self._backoff(attempt, resp.headers.get("Retry-After"))
+            attempt += 1
+            logging.warning(f"media {media_id} retry {attempt}/{self._max_retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def _download_once(self, media_id: str, mime_type: str | None) -> Dict[str, Any]:
+        resp = await self._http.get(f"/{self.version}/{media_id}")
+        resp.raise_for_status()
+        info = resp.json()
+        declared = info.get("file_size")
+        if declared is not None and int(declared) > self._max_bytes:
+            raise MediaError("too_large", f"{declared} bytes")
+        expected = normalize_sha256(info.get("sha256"))
+        mime_type = info.get("mime_type") or mime_type
+        size = await asyncio.to_thread(self.store.size, expected) if expected else None
+        if size is not None:
+            # Mismo archivo con otro media_id (media reenviada): no se baja
+            metrics.MEDIA_DEDUP.labels("content").inc()
+            return {"sha256": expected, "size": size, "mime_type": mime_type}
+
+        f, tmp_path = await asyncio.to_thread(self.store.open_tmp)
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            async with self._http.stream("GET", info["url"]) as body:
+                body.raise_for_status()
+                async for chunk in body.aiter_bytes(self._chunk_bytes):
+                    written += len(chunk)
+                    if written > self._max_bytes:
+                        raise MediaError("too_large", f"> {self._max_bytes} bytes")
+                    # hashlib suelta el GIL con bloques grandes: hash + write fuera del event loop
+                    await asyncio.to_thread(_write_chunk, f, digest, chunk)
+            await asyncio.to_thread(f.close)
+            sha256 = digest.hexdigest()
+            if expected and expected != sha256:
+                raise MediaError("checksum", f"expected {expected}, got {sha256}")
+            metrics.MEDIA_BYTES.inc(written)
+            if not await asyncio.to_thread(self.store.commit, tmp_path, sha256):
+                metrics.MEDIA_DEDUP.labels("content").inc()
+        except BaseException:
+            f.close()
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        return {"sha256": sha256, "size": written, "mime_type": mime_type}
+
+
+def _write_chunk(f, digest, chunk: bytes):
+    digest.update(chunk)
+    f.write(chunk)
+
+
+def media_job(msg: dict) -> Dict[str, str]:
+    """Campos del job en MEDIA_STREAM para un mensaje normalizado por _extract_events."""
+    media = msg["media"]
+    return {
+        "wa_id": msg["wa_id"],
+        "msg_id": msg["id"],
+        "type": msg["type"],
+        "media_id": media["id"],
+        "mime_type": media.get("mime_type") or "",
+        "sha256": media.get("sha256") or "",
+        "filename": media.get("filename") or "",
+        "ts": str(int(time.time() * 1000)),
+    }
@@ -0,0 +1,80 @@
+# app/whatsapp/scheduler.py
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Tuple
+
+ClaimFn = Callable[[int], Awaitable[List[Tuple[str, int]]]]
+DueFn = Callable[[str, int], Awaitable[None]]
+
+
+class DebounceScheduler:
+    """
+    Pollers que reclaman usuarios vencidos del sorted set de debounce.
+
+    En vez de una corrutina dormida por mensaje, cada proceso corre unos pocos
+    loops que piden a Redis los `wa_id` cuyo fireAt ya pasó (`claim`) y lanzan
+    `on_due` para cada uno. El estado vive en Redis, así que los flushes
+    pendientes sobreviven reinicios y se reparten entre todos los workers.
+    """
+
+    def __init__(
+        self,
+        claim: ClaimFn,
+        on_due: DueFn,
+        pollers: int = 2,
+        interval_ms: int = 100,
+        batch: int = 100,
+        max_inflight: int = 256,
+    ):
+        self._claim = claim
+        self._on_due = on_due
+        self._pollers = pollers
+        self._interval = interval_ms / 1000.0
+        self._batch = batch
+        self._max_inflight = max_inflight
+        self._loops: List[asyncio.Task] = []
+        self._inflight: set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    async def start(self):
+        self._stopping.clear()
+        self._loops = [asyncio.create_task(self._poll_loop()) for _ in range(self._pollers)]
+
+    async def stop(self):
+        """Detiene los pollers y espera a que terminen los flushes en curso."""
+        self._stopping.set()
+        for task in self._loops:
+            task.cancel()
+        await asyncio.gather(*self._loops, return_exceptions=True)
+        self._loops = []
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    async def _poll_loop(self):
+        while not self._stopping.is_set():
+            free = self._max_inflight - len(self._inflight)
+            claimed = []
+            if free > 0:
+                try:
+                    claimed = await self._claim(min(self._batch, free))
+                except Exception as e:
+                    logging.exception(f"debounce claim error: {e}")
+
+            for wa_id, score in claimed:
+                task = asyncio.create_task(self._run(wa_id, score))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+
+            # Si el lote vino lleno probablemente hay más vencidos: no duermas.
+            if len(claimed) < self._batch:
+                await asyncio.sleep(self._interval)
+
+    async def _run(self, wa_id: str, score: int):
+        try:
+            await self._on_due(wa_id, score)
+        except Exception as e:
+            logging.exception(f"try_process error for {wa_id}: {e}")
@@ -0,0 +1,88 @@
+# app/whatsapp/schemas.py
+"""
+Structs tipados (msgspec) del payload de webhooks de WhatsApp Cloud API.
+
+Sólo se declaran los campos que usamos; msgspec ignora el resto al
+decodificar, así que el decoder compilado valida y construye los objetos
+en una sola pasada sobre los bytes crudos.
+"""
+import msgspec
+
+MEDIA_TYPES = ("image", "audio", "video", "document", "sticker")
+
+
+class Profile(msgspec.Struct, kw_only=True):
+    name: str | None = None
+
+
+class Contact(msgspec.Struct, kw_only=True):
+    wa_id: str
+    profile: Profile | None = None
+
+
+class Text(msgspec.Struct, kw_only=True):
+    body: str = ""
+
+
+class Media(msgspec.Struct, kw_only=True):
+    """image/audio/video/document/sticker: sólo el id; el archivo se baja aparte (app/whatsapp/media.py)."""
+    id: str
+    mime_type: str | None = None
+    sha256: str | None = None
+    caption: str | None = None
+    filename: str | None = None
+    voice: bool = False
+
+
+class Message(msgspec.Struct, kw_only=True):
+    from_: str = msgspec.field(name="from")
+    id: str
+    timestamp: str
+    type: str = "text"
+    text: Text | None = None
+    image: Media | None = None
+    audio: Media | None = None
+    video: Media | None = None
+    document: Media | None = None
+    sticker: Media | None = None
+
+    @property
+    def media(self) -> Media | None:
+        return getattr(self, self.type, None) if self.type in MEDIA_TYPES else None
+
+
+class Status(msgspec.Struct, kw_only=True):
+    id: str
+    status: str
+    timestamp: str
+    recipient_id: str | None = None
+
+
+class Value(msgspec.Struct, kw_only=True):
+    messaging_product: str | None = None
+    contacts: list[Contact] = []
+    messages: list[Message] = []
+    statuses: list[Status] = []
+
+
+class Change(msgspec.Struct, kw_only=True):
+    field: str | None = None
+    value: Value | None = None
+
+
+class Entry(msgspec.Struct, kw_only=True):
+    id: str | None = None
+    changes: list[Change] = []
+
+
+class WebhookPayload(msgspec.Struct, kw_only=True):
+    object: str | None = None
+    entry: list[Entry] = []
+
+
+_decoder = msgspec.json.Decoder(WebhookPayload)
+
+
+def decode_webhook(raw: bytes) -> WebhookPayload:
+    """Decodifica el body crudo. Lanza msgspec.DecodeError si no es válido."""
+    return _decoder.decode(raw)
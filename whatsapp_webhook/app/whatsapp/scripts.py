@@ -0,0 +1,184 @@
+# app/whatsapp/scripts.py
+from redis.asyncio import Redis
+
+# ====== Lua: ingest ======
+# KEYS: buf, sched, gaps, dedup_1..dedup_n
+# ARGV: dedup_ttl_s, buf_ttl_s, now_ms, wa_id, params_json, terminal, item_1..item_n
+# Mete al buffer los mensajes de UN usuario que no sean reintentos (dedup)
+# y devuelve {aceptados, ventana_ms}. El fireAt del usuario vive en el
+# sorted set del scheduler; si entró algo se vuelve a empujar (y pisa
+# cualquier lease de un poller) a now + ventana. Con params.adaptive la
+# ventana sale del histograma de pausas del usuario (misma regla que
+# WindowPolicy en app/whatsapp/window.py).
+INGEST_LUA = """
+local accepted = 0
+for i = 4, #KEYS do
+    if redis.call('SET', KEYS[i], '1', 'NX', 'EX', ARGV[1]) then
+        redis.call('RPUSH', KEYS[1], ARGV[i + 3])
+        accepted = accepted + 1
+    end
+end
+if accepted == 0 then
+    return {0, 0}
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+
+local p = cjson.decode(ARGV[5])
+local now = tonumber(ARGV[3])
+local window = p.window_ms
+if p.adaptive == 1 then
+    local edges = p.edges
+    local k = #edges
+    local raw = redis.call('GET', KEYS[3])
+    local h = raw and cjson.decode(raw)
+    if type(h) ~= 'table' or #h ~= k + 2 then
+        h = {0}
+        for j = 2, k + 2 do h[j] = 0 end
+    elseif h[1] > 0 then
+        -- h = {ultimo_ms, bin_1..bin_k, sin_continuacion}
+        local gap = now - h[1]
+        local slot = k + 2
+        for j = 1, k do
+            if gap <= edges[j] then slot = j + 1; break end
+        end
+        h[slot] = h[slot] + 1
+        local total = 0
+        for j = 2, k + 2 do total = total + h[j] end
+        if total >= p.decay_at then
+            for j = 2, k + 2 do h[j] = h[j] / 2 end
+        end
+    end
+    h[1] = now
+    redis.call('SET', KEYS[3], cjson.encode(h), 'EX', p.history_ttl_s)
+
+    local total = 0
+    for j = 2, k + 2 do total = total + h[j] end
+    if total >= p.min_samples then
+        local allowed = p.tail * total
+        window = p.max_ms
+        local candidates = {p.min_ms}
+        for j = 1, k do
+            if edges[j] > p.min_ms then candidates[#candidates + 1] = edges[j] end
+        end
+        for _, t in ipairs(candidates) do
+            local later = 0
+            for j = 1, k do
+                if edges[j] > t then later = later + h[j + 1] end
+            end
+            if later <= allowed then window = t; break end
+        end
+    end
+    if ARGV[6] == '1' and window > p.terminal_ms then
+        window = p.terminal_ms
+    end
+end
+redis.call('ZADD', KEYS[2], now + window, ARGV[4])
+return {accepted, window}
+"""
+
+# ====== Lua: claim ======
+# KEYS: sched
+# ARGV: now_ms, limit, lease_ms
+# Reclama hasta `limit` usuarios vencidos moviendo su score a now + lease,
+# así otro poller no los toma y, si el proceso muere, vuelven a vencer.
+# Devuelve [wa_id, score, wa_id, score, ...].
+CLAIM_LUA = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+local lease = tonumber(ARGV[1]) + tonumber(ARGV[3])
+local out = {}
+for _, uid in ipairs(due) do
+    redis.call('ZADD', KEYS[1], 'XX', lease, uid)
+    out[#out + 1] = uid
+    out[#out + 1] = tostring(lease)
+end
+return out
+"""
+
+# ====== Lua: flush ======
+# KEYS: sched, lock, buf, fence
+# ARGV: wa_id, claimed_score, now_ms, lock_ttl_ms, retry_ms, fence_ttl_s
+# Devuelve {fence, item_1..item_n} con la tanda ordenada por ts (JSON), -1 si
+# hay una respuesta en curso (se reprograma) o nil si no toca procesar. Si
+# devuelve una tanda, el lock queda tomado con un
+# fencing token nuevo (contador por usuario): sólo ese token puede renovarlo,
+# soltarlo o enviar la respuesta.
+FLUSH_LUA = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not score or tonumber(score) ~= tonumber(ARGV[2]) then
+    -- llegó un mensaje nuevo (ventana reiniciada) o ya se procesó
+    return false
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    -- hay una respuesta en curso: reintenta más tarde
+    redis.call('ZADD', KEYS[1], 'XX', tonumber(ARGV[3]) + tonumber(ARGV[5]), ARGV[1])
+    return -1
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+local items = redis.call('LRANGE', KEYS[3], 0, -1)
+redis.call('DEL', KEYS[3])
+if #items == 0 then
+    return false
+end
+local fence = redis.call('INCR', KEYS[4])
+redis.call('EXPIRE', KEYS[4], ARGV[6])
+redis.call('SET', KEYS[2], fence, 'PX', ARGV[4])
+local rows = {}
+for i, raw in ipairs(items) do
+    local ok, msg = pcall(cjson.decode, raw)
+    local ts = (ok and type(msg) == 'table' and tonumber(msg['ts'])) or 0
+    rows[i] = {ts, i, raw}
+end
+table.sort(rows, function(a, b)
+    if a[1] == b[1] then return a[2] < b[2] end
+    return a[1] < b[1]
+end)
+local out = {fence}
+for i, row in ipairs(rows) do out[i + 1] = row[3] end
+return out
+"""
+
+# ====== Lua: renew ======
+# KEYS: lock, fence
+# ARGV: fence, lock_ttl_ms
+# Extiende el lock si `fence` sigue siendo el último token emitido (si ya
+# había vencido y nadie lo tomó, lo vuelve a tomar). Devuelve 1 o 0.
+RENEW_LUA = """
+local current = redis.call('GET', KEYS[2])
+if current and current ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return 1
+"""
+
+# ====== Lua: release ======
+# KEYS: lock
+# ARGV: fence
+# Suelta el lock sólo si lo tiene `fence` (un turno viejo no suelta el de otro).
+RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class BufferScripts:
+    """
+    Scripts Lua del buffer de debounce registrados sobre un cliente Redis.
+    Cada llamada es un solo EVALSHA (redis-py recarga el script si el
+    servidor responde NOSCRIPT).
+    """
+
+    def __init__(self, r: Redis):
+        self._r = r
+        self.ingest = r.register_script(INGEST_LUA)
+        self.claim = r.register_script(CLAIM_LUA)
+        self.flush = r.register_script(FLUSH_LUA)
+        self.renew = r.register_script(RENEW_LUA)
+        self.release = r.register_script(RELEASE_LUA)
+
+    async def preload(self) -> None:
+        """SCRIPT LOAD de todos los scripts, para llamarlo en el startup."""
+        for script in (self.ingest, self.claim, self.flush, self.renew, self.release):
+            await self._r.script_load(script.script)
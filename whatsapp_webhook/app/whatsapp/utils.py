@@ -1,54 +1,229 @@
 # app/whatsapp/utils.py
 import logging 
-import json, asyncio, time
-from fastapi import Request, BackgroundTasks
+import json, time, uuid
+from fastapi import Request
 from fastapi.responses import JSONResponse, PlainTextResponse
 from starlette import status
-from redis.asyncio import Redis
+from app.core import metrics
 from app.core.settings import settings
+from app.db.cache import ReadThroughCache
+from app.db.orm import AsyncPGORM, get_pool
+from app.db.write_behind import MessageWriter
+from app.history.sessions import SessionResolver
+from app.history.store import HistoryStore
+from app.redis_utils import get_redis
+from app.whatsapp.client import WhatsAppClient
+from app.whatsapp.schemas import WebhookPayload
+from app.whatsapp.debounce import DebounceBackend, RedisDebounce
+from app.whatsapp.local_debounce import LocalDebounce
+from app.whatsapp.media import MediaFetcher, MediaStore, media_job
+from app.whatsapp.window import WindowPolicy
 
 # ====== Config ======
-WINDOW_MS = 4000  # 4s de ventana (ajústalo a 1500–3000 ms)
+WINDOW_MS = 4000  # ventana fija; con DEBOUNCE_WINDOW_MODE=adaptive es la de usuarios sin historial
 DEDUP_TTL_S = 60 * 60
-TIMER_GRACE_MS = 5000  # margen para expiración del timer
-LOCK_TTL_MS = 5000     # para evitar doble procesamiento
-
-redis: Redis | None = None
+LOCK_TTL_MS = 15000    # lease inicial del lock; el agent lo renueva con heartbeats mientras trabaja
+LOCK_RETRY_MS = 1000   # si hay una respuesta en curso, reintenta el flush luego
+
+debounce: DebounceBackend | None = None
+window_policy: WindowPolicy | None = None
+wa_client: WhatsAppClient | None = None
+history: HistoryStore | None = None
+sessions: SessionResolver | None = None
+orm: AsyncPGORM | None = None
+writer: MessageWriter | None = None
+media: MediaFetcher | None = None
 
 # Logger
 logging.basicConfig(level=logging.INFO)
 
-async def get_redis() -> Redis:
-    global redis
-    if not redis:
-        redis = Redis.from_url(settings.REDIS_URL, decode_responses=True)
-    return redis
-
-def _k_buf(uid):   return f"wa:{uid}:buf"
-def _k_timer(uid): return f"wa:{uid}:timer"
-def _k_lock(uid):  return f"wa:{uid}:lock"
-def _k_dedup(mid): return f"wa:dedup:{mid}"
-
-def is_valid_whatsapp_message(body) -> bool:
-    return (
-        body.get("object")
-        and body.get("entry")
-        and body["entry"][0].get("changes")
-        and body["entry"][0]["changes"][0].get("value")
-        and body["entry"][0]["changes"][0]["value"].get("messages")
-        and body["entry"][0]["changes"][0]["value"]["messages"][0]
-    )
-
-def _extract_msg(body):
-    value = body["entry"][0]["changes"][0]["value"]
-    contact = value["contacts"][0]
-    msg = value["messages"][0]
-    wa_id = contact["wa_id"]
-    name = contact["profile"]["name"]
-    msg_id = msg["id"]
-    ts_ms = int(msg["timestamp"]) * 1000
-    text = msg.get("text", {}).get("body", "").strip()
-    return wa_id, name, msg_id, ts_ms, text
+# Texto que ve el agent por cada tipo de media (más el caption si viene)
+MEDIA_LABELS = {
+    "image": "[imagen]",
+    "audio": "[audio]",
+    "voice": "[nota de voz]",
+    "video": "[video]",
+    "document": "[documento]",
+    "sticker": "[sticker]",
+}
+
+
+def _timed_op(op: str, backend: str | None = None):
+    """Timer de wa_redis_op_seconds; las operaciones de debounce llevan el backend configurado."""
+    return metrics.REDIS_OP_SECONDS.labels(backend or settings.DEBOUNCE_BACKEND, op).time()
+
+
+def get_window_policy() -> WindowPolicy:
+    global window_policy
+    if not window_policy:
+        window_policy = WindowPolicy(
+            WINDOW_MS,
+            adaptive=settings.DEBOUNCE_WINDOW_MODE == "adaptive",
+            min_ms=settings.DEBOUNCE_WINDOW_MIN_MS,
+            max_ms=settings.DEBOUNCE_WINDOW_MAX_MS,
+            percentile=settings.DEBOUNCE_WINDOW_PERCENTILE,
+            terminal_ms=settings.DEBOUNCE_WINDOW_TERMINAL_MS,
+            min_samples=settings.DEBOUNCE_WINDOW_MIN_SAMPLES,
+        )
+    return window_policy
+
+
+async def get_debounce() -> DebounceBackend:
+    global debounce
+    if not debounce:
+        if settings.DEBOUNCE_BACKEND == "local":
+            debounce = LocalDebounce(
+                DEDUP_TTL_S,
+                LOCK_TTL_MS,
+                LOCK_RETRY_MS,
+                get_window_policy(),
+                tick_ms=settings.DEBOUNCE_LOCAL_TICK_MS,
+                max_users=settings.DEBOUNCE_LOCAL_MAX_USERS,
+                max_buffer=settings.DEBOUNCE_LOCAL_MAX_BUFFER,
+                journal_path=settings.DEBOUNCE_JOURNAL_PATH or None,
+                journal_fsync=settings.DEBOUNCE_JOURNAL_FSYNC,
+            )
+        else:
+            debounce = RedisDebounce(
+                await get_redis(), DEDUP_TTL_S, settings.DEBOUNCE_LEASE_MS, LOCK_TTL_MS, LOCK_RETRY_MS,
+                get_window_policy(),
+            )
+    return debounce
+
+
+def get_whatsapp_client() -> WhatsAppClient:
+    global wa_client
+    if not wa_client:
+        wa_client = WhatsAppClient(
+            access_token=settings.ACCESS_TOKEN,
+            phone_number_id=settings.PHONE_NUMBER_ID,
+            version=settings.VERSION,
+            base_url=settings.GRAPH_API_URL,
+            rate_per_s=settings.WHATSAPP_SEND_RATE,
+            max_inflight=settings.WHATSAPP_MAX_INFLIGHT,
+            queue_size=settings.WHATSAPP_SEND_QUEUE,
+            max_retries=settings.WHATSAPP_MAX_RETRIES,
+        )
+    return wa_client
+
+
+async def get_orm() -> AsyncPGORM:
+    global orm
+    if not orm:
+        cache = None
+        if settings.ORM_CACHE_ENABLED:
+            cache = ReadThroughCache(
+                await get_redis(),
+                settings.ORM_CACHE_TABLES,
+                local_entries=settings.ORM_CACHE_LOCAL_ENTRIES,
+                local_ttl_s=settings.ORM_CACHE_LOCAL_TTL_S,
+                ttl_s=settings.ORM_CACHE_TTL_S,
+            )
+        orm = AsyncPGORM(cache)
+    return orm
+
+
+async def get_writer() -> MessageWriter:
+    global writer
+    if not writer:
+        writer = MessageWriter(
+            await get_orm(),
+            flush_ms=settings.WRITE_BEHIND_FLUSH_MS,
+            max_rows=settings.WRITE_BEHIND_MAX_ROWS,
+            status_retry_s=settings.WRITE_BEHIND_STATUS_RETRY_S,
+            max_buffer=settings.WRITE_BEHIND_MAX_BUFFER,
+            backoff_max_s=settings.WRITE_BEHIND_BACKOFF_MAX_S,
+            dead_letter_path=settings.WRITE_BEHIND_DEAD_LETTER_PATH or None,
+        )
+    return writer
+
+
+async def get_media() -> MediaFetcher:
+    global media
+    if not media:
+        w = await get_writer()
+        media = MediaFetcher(
+            await get_redis(),
+            MediaStore(settings.MEDIA_DIR),
+            access_token=settings.ACCESS_TOKEN,
+            version=settings.VERSION,
+            base_url=settings.GRAPH_API_URL,
+            stream=settings.MEDIA_STREAM,
+            group=settings.MEDIA_GROUP,
+            on_result=w.add_media,
+            max_concurrent=settings.MEDIA_MAX_CONCURRENT_DOWNLOADS,
+            chunk_bytes=settings.MEDIA_CHUNK_BYTES,
+            max_bytes=settings.MEDIA_MAX_BYTES,
+            max_retries=settings.MEDIA_MAX_RETRIES,
+            id_ttl_s=settings.MEDIA_ID_TTL_S,
+            claim_idle_ms=settings.MEDIA_CLAIM_IDLE_MS,
+        )
+    return media
+
+
+async def get_history() -> HistoryStore:
+    global history
+    if not history:
+        history = HistoryStore(
+            await get_redis(),
+            get_pool(),
+            await get_writer(),
+            max_messages=settings.HISTORY_MAX_MESSAGES,
+            max_chars=settings.HISTORY_MAX_CHARS,
+            ttl_s=settings.HISTORY_TTL_S,
+        )
+    return history
+
+
+async def get_sessions() -> SessionResolver:
+    global sessions
+    if not sessions:
+        sessions = SessionResolver(await get_redis(), get_pool(), session_ttl_s=settings.SESSION_TTL_S)
+    return sessions
+
+
+def is_valid_whatsapp_message(payload: WebhookPayload) -> bool:
+    return bool(payload.object and payload.entry)
+
+
+def _extract_events(payload: WebhookPayload) -> tuple[list[dict], list]:
+    """
+    Recorre TODAS las entries/changes del payload (Meta agrupa varios
+    mensajes y contactos en un mismo POST bajo carga) y devuelve
+    (mensajes normalizados, statuses).
+    """
+    messages, statuses = [], []
+    for entry in payload.entry:
+        for change in entry.changes:
+            value = change.value
+            if value is None:
+                continue
+            names = {c.wa_id: c.profile.name if c.profile else None for c in value.contacts}
+            for msg in value.messages:
+                m = {
+                    "wa_id": msg.from_,
+                    "name": names.get(msg.from_),
+                    "id": msg.id,
+                    "ts": int(msg.timestamp) * 1000,
+                    "type": msg.type,
+                    "text": msg.text.body.strip() if msg.text else "",
+                }
+                media = msg.media
+                if media is not None:
+                    # El archivo se baja aparte (MEDIA_STREAM); al agent le llega la etiqueta + caption
+                    label = MEDIA_LABELS["voice" if media.voice else msg.type]
+                    detail = media.caption or media.filename
+                    m["text"] = f"{label} {detail.strip()}" if detail else label
+                    m["media"] = {
+                        "id": media.id,
+                        "mime_type": media.mime_type,
+                        "sha256": media.sha256,
+                        "filename": media.filename,
+                    }
+                messages.append(m)
+            statuses.extend(value.statuses)
+    return messages, statuses
+
 
 async def verify(request: Request):
     mode = request.query_params.get("hub.mode")
@@ -66,117 +241,260 @@ async def verify(request: Request):
         logging.info("MISSING_PARAMETER")
         return JSONResponse({"status": "error", "message": "Missing parameters"}, status_code=status.HTTP_400_BAD_REQUEST)
 
-async def handle_message(request: Request, background: BackgroundTasks | None = None):
-    try:
-        body = await request.json()
-    except json.JSONDecodeError:
-        logging.error("Failed to decode JSON")
-        return JSONResponse({"status": "error", "message": "Invalid JSON provided"}, status_code=status.HTTP_400_BAD_REQUEST)
 
-    # Status callback? Ignóralo rápido
-    if body.get("entry", [{}])[0].get("changes", [{}])[0].get("value", {}).get("statuses"):
-        logging.info("Received a WhatsApp status update.")
-        return JSONResponse({"status": "ok"}, status_code=status.HTTP_200_OK)
+async def handle_message(request: Request):
+    # Ya verificado y decodificado una sola vez en signature_required
+    payload: WebhookPayload = request.state.payload
 
-    if not is_valid_whatsapp_message(body):
+    if not is_valid_whatsapp_message(payload):
         return JSONResponse({"status": "error", "message": "Not a WhatsApp API event"}, status_code=status.HTTP_404_NOT_FOUND)
 
-    # # ---- Debounce + Buffer ----
-    # r = await get_redis()
-    wa_id, name, msg_id, ts_ms, text = _extract_msg(body)
-    
-    # # Check if user exists in DB (example usage of ORM)
-    
-    logging.info(f"Received message from {wa_id} ({name}): {text}")
-
-    # # # Idempotencia: ignora reintentos del mismo msg_id
-    # was_set = await r.set(_k_dedup(msg_id), "1", nx=True, ex=DEDUP_TTL_S)
-    # if not was_set:
-    #     return JSONResponse({"status": "ok"}, status_code=status.HTTP_200_OK)
-
-    # # Mete al buffer como JSONL
-    # item = json.dumps({"id": msg_id, "ts": ts_ms, "text": text})
-    # await r.rpush(_k_buf(wa_id), item)
-    # await r.expire(_k_buf(wa_id), DEDUP_TTL_S)
-
-    # # (Re)programa timer (guardamos el fireAt en ms)
-    fire_at = int(time.time() * 1000) + WINDOW_MS
-    # # Timer con expiración: si no llega nada, expira solo
-    await r.psetex(_k_timer(wa_id), WINDOW_MS + TIMER_GRACE_MS, str(fire_at))
-
-    # # Dispara verificación luego de la ventana
-    if background is not None:
-        background.add_task(_schedule_try_process, wa_id, WINDOW_MS)
-    else:
-        # fallback si llamas sin BackgroundTasks
-        asyncio.create_task(_schedule_try_process(wa_id, WINDOW_MS))
+    msgs, statuses = _extract_events(payload)
+
+    # Status callbacks: se coalescen y se escriben en lote (write-behind)
+    if statuses:
+        w = await get_writer()
+        for st in statuses:
+            w.add_status(st.id, st.status, int(st.timestamp) if st.timestamp else None)
+
+    if not msgs and not statuses:
+        return JSONResponse({"status": "error", "message": "Not a WhatsApp API event"}, status_code=status.HTTP_404_NOT_FOUND)
+
+    if msgs:
+        await _buffer_messages(msgs)
+        if settings.MEDIA_ENABLED:
+            await _enqueue_media([m for m in msgs if "media" in m])
 
     return JSONResponse({"status": "ok"}, status_code=status.HTTP_200_OK)
 
-async def _schedule_try_process(wa_id: str, delay_ms: int):
-    await asyncio.sleep((delay_ms + 50) / 1000.0)
-    print(f"Procesando mensajes para {wa_id}...")
+
+async def _buffer_messages(msgs: list[dict]) -> int:
+    """
+    Agrupa los mensajes por wa_id y hace dedup + buffer + (re)programa el
+    fireAt de cada usuario en el backend de debounce (Redis: un round trip
+    por webhook; local: en memoria). Los pollers del DebounceScheduler
+    recogen a cada usuario al vencer su ventana.
+    """
+    by_user: dict[str, list[dict]] = {}
+    for m in msgs:
+        logging.info(f"Received message from {m['wa_id']} ({m['name']}): {m['text']}")
+        by_user.setdefault(m["wa_id"], []).append(m)
+
+    # La ventana (fija o adaptativa) la pone el backend según el WindowPolicy.
+    # Los reintentos del mismo msg_id (idempotencia) no cuentan
+    d = await get_debounce()
+    with _timed_op("ingest"):
+        accepted = await d.ingest(by_user, int(time.time() * 1000))
+    if accepted < len(msgs):
+        metrics.DEDUP_HITS.inc(len(msgs) - accepted)
+    return accepted
+
+
+async def _enqueue_media(msgs: list[dict]):
+    """
+    Publica un job por mensaje con media en MEDIA_STREAM (un solo round trip);
+    la descarga la hace el MediaFetcher, nunca el request del webhook. Los
+    reintentos de Meta también encolan: el fetcher deduplica por media_id.
+    """
+    if not msgs:
+        return
+    r = await get_redis()
     try:
-        await try_process(wa_id)
+        with _timed_op("xadd_media", backend="redis"):
+            async with r.pipeline(transaction=False) as pipe:
+                for m in msgs:
+                    pipe.xadd(settings.MEDIA_STREAM, media_job(m),
+                              maxlen=settings.MEDIA_STREAM_MAXLEN, approximate=True)
+                await pipe.execute()
     except Exception as e:
-        logging.exception(f"try_process error for {wa_id}: {e}")
+        # El texto ya está en el buffer: el turno sale igual, sin el archivo
+        logging.exception(f"media enqueue failed for {[m['id'] for m in msgs]}: {e}")
+        metrics.MEDIA_FAILED.labels("enqueue").inc(len(msgs))
+
+
+async def claim_due(limit: int) -> list[tuple[str, int]]:
+    """Reclama hasta `limit` usuarios cuya ventana ya venció."""
+    d = await get_debounce()
+    with _timed_op("claim"):
+        return await d.claim(limit)
 
-async def try_process(wa_id: str):
+
+async def try_process(wa_id: str, claimed_score: int):
+    # Chequeo del fireAt + lock + drenado del buffer (en Redis, un solo EVALSHA).
+    # Devuelve el fencing token y la tanda ya ordenada por ts, o nada si aún no toca.
+    d = await get_debounce()
+    with _timed_op("flush"):
+        flushed = await d.flush(wa_id, claimed_score)
+    if not flushed:
+        return
+    fence, msgs = flushed
+    now_ms = int(time.time() * 1000)
+    metrics.FLUSH_MESSAGES.observe(len(msgs))
+    metrics.DEBOUNCE_WAIT_SECONDS.observe(max(0, now_ms - min(m.get("rx", m["ts"]) for m in msgs)) / 1000.0)
+
+    # El trace_id identifica al turno de punta a punta: viaja en TURNS_STREAM,
+    # el agent lo copia en cada salida y deliver_reply lo loguea
+    trace_id = uuid.uuid4().hex
+
+    # Construye el bloque/turno
+    prompt = _join_messages(msgs)
+
+    logging.info(f"→ Turno de {wa_id} [trace {trace_id}, {len(msgs)} mensajes]: {prompt}")
+
+    turn_history = await _record_inbound(wa_id, msgs)
+
+    # Publica el turno para el agent worker. El lock queda tomado hasta que
+    # se entregue la respuesta (deliver_reply) o deje de renovarse y venza.
+    # El fence viaja con el turno y vuelve en cada salida del agent.
     r = await get_redis()
-    tkey = _k_timer(wa_id)
-    fire_at_str = await r.get(tkey)
-    if not fire_at_str:
-        # Hubo mensaje nuevo o ya se procesó
+    try:
+        with _timed_op("xadd_turn", backend="redis"):
+            await r.xadd(
+                settings.TURNS_STREAM,
+                {
+                    "wa_id": wa_id,
+                    "text": prompt,
+                    "msg_ids": json.dumps([m["id"] for m in msgs]),
+                    "ts": str(msgs[-1]["ts"]),
+                    "history": json.dumps(turn_history, ensure_ascii=False),
+                    "fence": str(fence),
+                    "trace_id": trace_id,
+                },
+                maxlen=settings.TURNS_STREAM_MAXLEN,
+                approximate=True,
+            )
+    except Exception:
+        metrics.DROPPED.labels("publish_failed").inc(len(msgs))
+        await d.release(wa_id, fence)
+        raise
+
+
+async def deliver_reply(fields: dict):
+    """
+    Entrega una salida del agent worker:
+    - kind=typing: indicador de "escribiendo" sobre el último mensaje del turno.
+    - kind=text: un segmento de la respuesta (o la respuesta completa).
+    - kind=end: fin de una respuesta en streaming.
+    - kind=heartbeat: el agent sigue trabajando en el turno; renueva el lock.
+    Con final=1 se suelta el lock del usuario y se registran las métricas
+    del turno (las del LLM las agrega el agent a esa salida). Un turno cuyo
+    fence ya no es el vigente (su lock venció y otro turno lo tomó) no
+    envía nada.
+
+    Los reintentos del envío son los del WhatsAppClient; si igual falla, la
+    excepción llega al OutboundDispatcher, que no lo reintenta. Lo que pasa
+    después de un envío exitoso (historial, release, métricas) no lanza:
+    un reintento del dispatcher mandaría el mismo segmento otra vez.
+    """
+    wa_id = fields["wa_id"]
+    kind = fields.get("kind", "text")
+    fence = int(fields["fence"]) if fields.get("fence") else None
+    trace_id = fields.get("trace_id") or "-"
+    d = await get_debounce()
+
+    if kind == "heartbeat":
+        if fence is not None:
+            with _timed_op("renew"):
+                renewed = await d.renew(wa_id, fence)
+            if not renewed:
+                metrics.LOCK_LOST.inc()
+                logging.warning(
+                    f"Lock de {wa_id} ya tomado por otro turno; {fields.get('turn_id')} "
+                    f"[trace {trace_id}, fence {fence}] quedó obsoleto"
+                )
         return
-    if int(time.time() * 1000) < int(fire_at_str):
-        # Aún dentro de ventana; algún otro task lo revisará
+
+    if kind == "typing":
+        msg_ids = json.loads(fields.get("msg_ids") or "[]")
+        if msg_ids:
+            with metrics.SEND_SECONDS.labels("typing").time():
+                await get_whatsapp_client().send_typing_indicator(msg_ids[-1])
+    elif kind == "text" and fields.get("text"):
+        current = True
+        if fence is not None:
+            with _timed_op("is_current"):
+                current = await d.is_current(wa_id, fence)
+        if not current:
+            metrics.DROPPED.labels("stale_reply").inc()
+            logging.warning(
+                f"Descartada respuesta obsoleta para {wa_id} (turno {fields.get('turn_id')}, "
+                f"trace {trace_id}, fence {fence})"
+            )
+        else:
+            logging.info(f"← Respuesta para {wa_id} [trace {trace_id}]: {fields['text']}")
+            with metrics.SEND_SECONDS.labels("text").time():
+                sent = await send_whatsapp_message(wa_id, fields["text"])
+            await _record_outbound(wa_id, fields["text"], sent)
+
+    if fields.get("final", "1") == "1":
+        try:
+            with _timed_op("release"):
+                await d.release(wa_id, fence)
+        except Exception as e:
+            # El lock vence solo por su TTL
+            logging.exception(f"release failed for {wa_id} (turno {fields.get('turn_id')}, trace {trace_id}): {e}")
+        try:
+            _observe_turn(fields)
+        except Exception as e:
+            logging.exception(f"turn metrics failed for {wa_id} (trace {trace_id}): {e}")
+
+
+def _observe_turn(fields: dict):
+    """Métricas de un turno terminado: duración total y lo que midió el agent."""
+    turn_id = fields.get("turn_id") or ""
+    if "-" in turn_id:
+        # El ID de la entrada del turno es el ms en que try_process lo publicó
+        metrics.TURN_SECONDS.observe(max(0, time.time() * 1000 - int(turn_id.split("-")[0])) / 1000.0)
+    source = fields.get("source")
+    if not source:
         return
+    metrics.TURN_RESULTS.labels(source).inc()
+    if fields.get("queue_ms"):
+        metrics.LLM_QUEUE_SECONDS.observe(float(fields["queue_ms"]) / 1000.0)
+    if source == "llm":
+        if fields.get("llm_ms"):
+            metrics.LLM_SECONDS.observe(float(fields["llm_ms"]) / 1000.0)
+        if fields.get("tokens_in"):
+            metrics.LLM_TOKENS.labels("in").observe(int(fields["tokens_in"]))
+        if fields.get("tokens_out"):
+            metrics.LLM_TOKENS.labels("out").observe(int(fields["tokens_out"]))
+
+
+async def _record_inbound(wa_id: str, msgs: list[dict]) -> list[dict]:
+    """
+    Lee el historial de la sesión (sin la tanda actual) y luego persiste la
+    tanda en Postgres + Redis. Un fallo aquí no debe frenar la respuesta.
+    """
+    try:
+        session_id, created = await (await get_sessions()).resolve(wa_id, msgs[-1].get("name"))
+        store = await get_history()
+        if created:
+            await store.reset(wa_id)
+            recent = []
+        else:
+            recent = await store.recent(wa_id, session_id)
+        await store.record(wa_id, session_id, [
+            {"role": "user", "content": m["text"], "channel_id": m["id"], "ts": m["ts"], "status": "delivered",
+             "message_type": m.get("type", "text")}
+            for m in msgs
+        ])
+    except Exception as e:
+        logging.exception(f"history write-through failed for {wa_id}: {e}")
+        return []
+    return [{"role": h["role"], "content": h["content"]} for h in recent]
 
-    # Evita doble procesamiento concurrente
-    lock_key = _k_lock(wa_id)
-    got_lock = await r.set(lock_key, "1", nx=True, px=LOCK_TTL_MS)
-    if not got_lock:
-        return  # otro worker lo tomará
 
+async def _record_outbound(wa_id: str, text: str, sent: dict):
+    # El mensaje ya salió: si falla el registro no se reintenta el envío.
     try:
-        # Verifica de nuevo el timer (double-check)
-        fire_at_str = await r.get(tkey)
-        if not fire_at_str or int(time.time() * 1000) < int(fire_at_str):
-            return
-
-        # Extrae todo el buffer
-        buf_key = _k_buf(wa_id)
-        msgs_raw = []
-        while True:
-            item = await r.lpop(buf_key)
-            if not item:
-                break
-            msgs_raw.append(item)
-        # Borra el timer para esta tanda
-        await r.delete(tkey)
-
-        if not msgs_raw:
-            return
-
-        msgs = [json.loads(x) for x in msgs_raw]
-        msgs.sort(key=lambda m: m["ts"])  # orden temporal
-
-        # Construye el bloque/turno
-        prompt = _join_messages(msgs)
-        
-        print(f"→ Mensajes recibidos de {wa_id}: {prompt}")
-
-        # Aquí pones tu integración NLU/LLM o tus reglas
-        reply = generate_reply(prompt)
-        
-        print(f"← Respuesta generada para {wa_id}: {reply}")
-
-        # Envía UNA sola respuesta
-        await send_whatsapp_message(wa_id, reply)
-
-    finally:
-        # Suelta el lock
-        await r.delete(lock_key)
+        session_id, _ = await (await get_sessions()).resolve(wa_id)
+        channel_id = ((sent or {}).get("messages") or [{}])[0].get("id")
+        await (await get_history()).record(wa_id, session_id, [
+            {"role": "assistant", "content": text, "channel_id": channel_id, "status": "sent"}
+        ])
+    except Exception as e:
+        logging.exception(f"history write-through failed for {wa_id}: {e}")
+
 
 def _join_messages(msgs: list[dict]) -> str:
     # Une con puntuación simple (puedes personalizar)
@@ -192,13 +510,7 @@ def _join_messages(msgs: list[dict]) -> str:
             parts.append(t + ".")
     return " ".join(parts).strip()
 
-def generate_reply(prompt: str) -> str:
-    # Ejemplo tonto; reemplázalo con tu motor
-    if any(w in prompt.lower() for w in ["cotizacion", "cotización"]):
-        return "¡Claro! Para cotizar, dime: producto/servicio, cantidad y ciudad de entrega."
-    return "¡Gracias! ¿En qué puedo ayudarte?"
 
 async def send_whatsapp_message(to_wa_id: str, text: str):
-    # Implementa tu cliente WhatsApp (Cloud API/proveedor)
-    # p.ej. con httpx y tu PHONE_NUMBER_ID + access_token
     logging.info(f"→ Respondiendo a {to_wa_id}: {text}")
+    return await get_whatsapp_client().send_text(to_wa_id, text)
@@ -0,0 +1,137 @@
+# app/whatsapp/window.py
+import json
+import statistics
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+# Cotas superiores (ms) de los bins del histograma de pausas entre mensajes
+GAP_EDGES_MS = (250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 12000, 16000)
+TERMINAL_ENDINGS = (".", "?", "!")
+CONTINUATION_ENDINGS = ("...", "…", ",", ":", ";")
+
+
+class WindowPolicy:
+    """
+    Ventana de debounce por usuario.
+
+    - fixed: siempre `window_ms` (comportamiento anterior).
+    - adaptive: cada mensaje aporta una muestra al histograma del usuario: la
+      pausa desde su mensaje anterior (en el bin de su cota) o "sin
+      continuación" si pasó más de `max_ms`. La ventana es la menor cota,
+      entre `min_ms` y `max_ms`, tal que a lo sumo `1 - percentile` de los
+      mensajes tuvo una continuación más tardía. Con menos de `min_samples`
+      muestras se usa `window_ms`. Si el último mensaje parece cerrar la
+      idea (ver is_terminal), la ventana se acorta a `terminal_ms`.
+      Al llegar a `decay_at` muestras el histograma se reduce a la mitad,
+      así sigue los cambios de ritmo; se olvida tras `history_ttl_s` sin
+      mensajes.
+
+    El histograma es una lista [último_ms, bin_1..bin_k, sin_continuación];
+    RedisDebounce la guarda como JSON y aplica la misma regla en Lua
+    (INGEST_LUA), LocalDebounce usa update/pick de aquí.
+    """
+
+    def __init__(
+        self,
+        window_ms: int,
+        adaptive: bool = False,
+        min_ms: int = 800,
+        max_ms: int = 8000,
+        percentile: float = 0.95,
+        terminal_ms: int = 800,
+        min_samples: int = 5,
+        decay_at: int = 64,
+        history_ttl_s: int = 7 * 24 * 60 * 60,
+        stats_size: int = 10000,
+    ):
+        self.window_ms = window_ms
+        self.adaptive = adaptive
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.percentile = percentile
+        self.terminal_ms = terminal_ms
+        self.min_samples = min_samples
+        self.decay_at = decay_at
+        self.history_ttl_s = history_ttl_s
+        self.edges = [e for e in GAP_EDGES_MS if e < max_ms] + [max_ms]
+        self._windows: Deque[int] = deque(maxlen=stats_size)
+        self._terminal = 0
+        self._picked = 0
+
+    @staticmethod
+    def is_terminal(text: str) -> bool:
+        """Una pregunta, o una frase de 3+ palabras que cierra con . o !."""
+        t = (text or "").strip()
+        if not t or t.endswith(CONTINUATION_ENDINGS) or not t.endswith(TERMINAL_ENDINGS):
+            return False
+        return t.endswith("?") or len(t.split()) >= 3
+
+    def params_json(self) -> str:
+        """Parámetros para INGEST_LUA (se serializan una vez)."""
+        return json.dumps({
+            "window_ms": self.window_ms,
+            "adaptive": 1 if self.adaptive else 0,
+            "min_ms": self.min_ms,
+            "max_ms": self.max_ms,
+            "tail": 1.0 - self.percentile,
+            "terminal_ms": self.terminal_ms,
+            "min_samples": self.min_samples,
+            "decay_at": self.decay_at,
+            "history_ttl_s": self.history_ttl_s,
+            "edges": self.edges,
+        })
+
+    def update(self, hist: Optional[List[float]], now_ms: int) -> List[float]:
+        """Suma la pausa desde el mensaje anterior y devuelve el histograma nuevo."""
+        k = len(self.edges)
+        if hist is None or len(hist) != k + 2:
+            hist = [0] + [0] * (k + 1)
+        elif hist[0] > 0:
+            gap = now_ms - hist[0]
+            for j, edge in enumerate(self.edges):
+                if gap <= edge:
+                    hist[j + 1] += 1
+                    break
+            else:
+                hist[k + 1] += 1
+            if sum(hist[1:]) >= self.decay_at:
+                hist[1:] = [c / 2 for c in hist[1:]]
+        hist[0] = now_ms
+        return hist
+
+    def pick(self, hist: Optional[List[float]], terminal: bool) -> int:
+        window = self.window_ms
+        if self.adaptive:
+            if hist is not None and sum(hist[1:]) >= self.min_samples:
+                window = self._percentile_window(hist)
+            if terminal and window > self.terminal_ms:
+                window = self.terminal_ms
+        return window
+
+    def _percentile_window(self, hist: List[float]) -> int:
+        bins = hist[1:-1]
+        allowed = (1.0 - self.percentile) * sum(hist[1:])
+        for t in [self.min_ms] + [e for e in self.edges if e > self.min_ms]:
+            later = sum(c for e, c in zip(self.edges, bins) if e > t)
+            if later <= allowed:
+                return t
+        return self.max_ms
+
+    def record(self, window_ms: int, terminal: bool = False):
+        self._windows.append(window_ms)
+        self._picked += 1
+        if terminal and self.adaptive and window_ms == self.terminal_ms:
+            self._terminal += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Mediana de la ventana elegida (por mensaje) y ahorro contra la fija."""
+        if not self._windows:
+            return {"mode": "adaptive" if self.adaptive else "fixed", "samples": 0}
+        median = statistics.median(self._windows)
+        return {
+            "mode": "adaptive" if self.adaptive else "fixed",
+            "samples": len(self._windows),
+            "median_window_ms": median,
+            "median_saved_ms": self.window_ms - median,
+            "terminal_pct": round(100.0 * self._terminal / self._picked, 1),
+        }
@@ -0,0 +1,105 @@
+"""
+Ventana de debounce fija (WINDOW_MS) contra adaptativa (WindowPolicy), sobre
+conversaciones sintéticas con reloj simulado:
+
+- "una frase": turnos de un solo mensaje, casi siempre completos.
+- "ráfagas": 2–4 mensajes con pausas cortas (mediana ~1.2 s).
+- "lentos": 2–3 mensajes con pausas largas (mediana ~4.5 s).
+
+Para cada turno se mide la latencia muerta (de su último mensaje al flush)
+y si la ventana lo partió en dos (una pausa mayor a la ventana vigente).
+Se reporta la mediana de latencia ahorrada contra la ventana fija.
+
+Uso (desde whatsapp_webhook/):
+    python -m benchmarks.bench_adaptive_window
+"""
+import os
+import random
+import statistics
+
+from app.whatsapp.utils import WINDOW_MS
+from app.whatsapp.window import WindowPolicy
+
+USERS = int(os.getenv("BENCH_USERS", "3000"))
+TURNS = int(os.getenv("BENCH_TURNS", "30"))
+SEED = int(os.getenv("BENCH_SEED", "7"))
+PERCENTILE = float(os.getenv("BENCH_PERCENTILE", "0.95"))
+
+PROFILES = (
+    # nombre, peso, (min, max) mensajes por turno, mediana de pausa (ms), prob. de cerrar con . ? !
+    ("una frase", 0.40, (1, 1), 0, 0.85),
+    ("ráfagas", 0.35, (2, 4), 1200, 0.5),
+    ("lentos", 0.25, (2, 3), 4500, 0.5),
+)
+OPEN_TEXTS = ("hola", "mira", "tengo una duda", "sobre mi pedido", "y otra cosa")
+TERMINAL_TEXTS = ("¿Cuánto cuesta el envío?", "Quiero cambiar mi dirección de entrega.", "¿Me ayudas con eso?")
+
+
+def _turns(rng: random.Random, profile):
+    """Genera (ms de llegada, texto, turno) para un usuario."""
+    _, _, (lo, hi), gap_ms, p_terminal = profile
+    t = 0.0
+    for turn in range(TURNS):
+        t += rng.uniform(30_000, 120_000)  # leer la respuesta y escribir de nuevo
+        n = rng.randint(lo, hi)
+        for i in range(n):
+            if i:
+                t += rng.lognormvariate(0, 0.5) * gap_ms
+            last = i == n - 1
+            text = rng.choice(TERMINAL_TEXTS) if last and rng.random() < p_terminal else rng.choice(OPEN_TEXTS)
+            yield int(t), text, turn
+
+
+def simulate(policy: WindowPolicy, rng: random.Random):
+    """Devuelve, por perfil, (latencias muertas, turnos partidos, turnos)."""
+    out = {p[0]: ([], 0, 0) for p in PROFILES}
+    for _ in range(USERS):
+        profile = rng.choices(PROFILES, weights=[p[1] for p in PROFILES])[0]
+        dead, splits, turns = out[profile[0]]
+        hist = None
+        msgs = list(_turns(rng, profile))
+        for i, (at, text, turn) in enumerate(msgs):
+            hist = policy.update(hist, at) if policy.adaptive else None
+            window = policy.pick(hist, policy.is_terminal(text))
+            nxt = msgs[i + 1] if i + 1 < len(msgs) else None
+            if nxt is not None and nxt[0] - at <= window:
+                continue  # el siguiente mensaje reinicia la ventana
+            # flush: la tanda sale `window` ms después de este mensaje
+            dead.append(window)
+            if nxt is not None and nxt[2] == turn:
+                splits += 1
+            else:
+                turns += 1
+        out[profile[0]] = (dead, splits, turns)
+    return out
+
+
+def _report(label: str, dead, splits: int, turns: int) -> float:
+    dead = sorted(dead)
+    p50 = statistics.median(dead)
+    print(f"  {label:<11} latencia muerta p50={p50:6.0f} ms  p90={dead[int(len(dead) * 0.9)]:6.0f} ms  "
+          f"turnos partidos={100.0 * splits / max(1, turns):5.2f}%")
+    return p50
+
+
+def main():
+    fixed = WindowPolicy(WINDOW_MS)
+    adaptive = WindowPolicy(WINDOW_MS, adaptive=True, percentile=PERCENTILE)
+    print(f"{USERS} usuarios x {TURNS} turnos, ventana fija {WINDOW_MS} ms")
+    runs = {label: simulate(policy, random.Random(SEED)) for label, policy in (("fija", fixed), ("adaptativa", adaptive))}
+    medians = {}
+    for name, *_ in PROFILES + (("todos",),):
+        print(f"\n{name}")
+        for label, out in runs.items():
+            if name == "todos":
+                dead = [d for v in out.values() for d in v[0]]
+                splits = sum(v[1] for v in out.values())
+                turns = sum(v[2] for v in out.values())
+            else:
+                dead, splits, turns = out[name]
+            medians[label] = _report(label, dead, splits, turns)
+    print(f"\nmediana de latencia ahorrada: {medians['fija'] - medians['adaptativa']:.0f} ms por turno")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""
+Benchmark de punta a punta: webhook firmado → debounce → turno → "LLM" →
+respuesta en Graph API, con la app de main.py corriendo en proceso (lifespan
+completo) y stand-ins locales con latencia configurable:
+
+- Redis: fakeredis con latencia por round trip (o un Redis real con --redis-url,
+  usa una DB descartable: el benchmark escribe en los streams de la app).
+- Postgres: StandInPool (o uno real con --database-url y las migraciones aplicadas).
+- WhatsApp: StubGraphAPI (HTTP real sobre loopback).
+- LLM: StubAgent consumiendo TURNS_STREAM.
+
+La carga es de lazo abierto: los turnos llegan como un proceso de Poisson a
+--rps / (mensajes por turno), cada uno a un usuario libre de --users, y se
+escriben como ráfagas de 1..N mensajes con pausas --gap (un webhook firmado
+por mensaje). Tras la respuesta se envían los callbacks delivered/read.
+
+Reporta p50/p99 de ingest (POST /webhook), latencia último mensaje → turno
+publicado (debounce) y → respuesta enviada, throughput, operaciones Redis y
+consultas por turno y memoria (RSS). Guarda el resultado en JSON para
+comparar entre commits (--compare).
+
+Uso (desde whatsapp_webhook/):
+    python -m benchmarks.bench_e2e --users 500 --rps 50 --duration 60
+    python -m benchmarks.bench_e2e --window-mode adaptive --compare benchmarks/results/base.json
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import time
+from pathlib import Path
+from typing import Dict, List
+
+for _name in ("APP_NAME", "ACCESS_TOKEN", "APP_ID", "RECIPIENT_WAID", "VERSION", "PHONE_NUMBER_ID",
+              "VERIFY_TOKEN", "OPENAI_API_KEY", "OPENAI_ASSISTANT_ID", "REDIS_URL",
+              "DB_HOST", "DB_USER", "DB_PASSWORD", "DB_NAME"):
+    os.environ.setdefault(_name, "bench")
+os.environ.setdefault("DB_PORT", "5432")
+os.environ.setdefault("APP_SECRET", "bench-secret")
+os.environ.setdefault("REDIS_BACKEND", "memory")
+
+import httpx  # noqa: E402
+
+from benchmarks.standins import (  # noqa: E402
+    CountingRedis, Latency, StandInPool, StubAgent, latency_redis, now_ms, wa_status_payload, wa_text_payload,
+)
+from benchmarks.stub_graph_api import StubGraphAPI  # noqa: E402
+
+RESULTS_DIR = Path(__file__).parent / "results"
+# Los mensajes intermedios de una ráfaga no cierran la idea; el último a veces sí (ver WindowPolicy.is_terminal)
+OPEN_TEXTS = ("hola", "buenas tardes", "tengo una duda", "sobre mi pedido", "y otra cosa", "mira")
+TERMINAL_TEXTS = ("¿Tienen horario el sábado?", "Necesito cambiar la dirección de entrega.", "¿Me ayudas con eso?")
+P_TERMINAL = 0.5
+# Métricas que compara --compare y si más es mejor
+COMPARED = (
+    ("ingest_ms.p50", False), ("ingest_ms.p99", False),
+    ("debounce_ms.p50", False), ("reply_ms.p50", False), ("reply_ms.p99", False),
+    ("throughput.turns_per_s", True), ("throughput.webhooks_per_s", True),
+    ("redis.commands_per_turn", False), ("redis.round_trips_per_turn", False),
+    ("db.queries_per_turn", False), ("memory.rss_peak_mb", False),
+)
+
+
+def _args():
+    p = argparse.ArgumentParser(description="Carga y latencia del pipeline webhook → respuesta.")
+    p.add_argument("--users", type=int, default=200)
+    p.add_argument("--rps", type=float, default=20.0, help="webhooks de mensajes por segundo (objetivo)")
+    p.add_argument("--duration", type=float, default=30.0, help="segundos generando carga")
+    p.add_argument("--drain", type=float, default=30.0, help="segundos máximos esperando respuestas pendientes")
+    p.add_argument("--burst", default="1-4", help="mensajes por turno, min-max")
+    p.add_argument("--gap", default="lognormal:1200,0.6", help="pausa entre mensajes de una ráfaga (ms)")
+    p.add_argument("--redis-latency", default="const:0.2")
+    p.add_argument("--redis-url", default=None, help="Redis real en vez de fakeredis")
+    p.add_argument("--db-latency", default="lognormal:2,0.5")
+    p.add_argument("--db-pool", type=int, default=10)
+    p.add_argument("--database-url", default=None, help="Postgres real en vez del stand-in")
+    p.add_argument("--graph-latency", default="normal:80,20")
+    p.add_argument("--llm-latency", default="lognormal:1500,0.5")
+    p.add_argument("--llm-concurrency", type=int, default=16)
+    p.add_argument("--debounce-backend", choices=("redis", "local"), default="redis")
+    p.add_argument("--window-mode", choices=("fixed", "adaptive"), default="fixed")
+    p.add_argument("--window-ms", type=int, default=None, help="WINDOW_MS (por defecto el de utils)")
+    p.add_argument("--no-statuses", action="store_true", help="no enviar callbacks delivered/read")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--out", default=None, help="archivo JSON de salida")
+    p.add_argument("--compare", default=None, help="JSON de una corrida anterior para comparar")
+    return p.parse_args()
+
+
+def _pcts(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"n": 0}
+    s = sorted(samples)
+    pick = lambda q: s[min(len(s) - 1, int(len(s) * q))]  # noqa: E731
+    return {"n": len(s), "p50": round(statistics.median(s), 2), "p90": round(pick(0.9), 2),
+            "p99": round(pick(0.99), 2), "max": round(s[-1], 2)}
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        return float("nan")
+
+
+def _git_rev() -> str:
+    try:
+        rev = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD"]) != 0
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class _User:
+    __slots__ = ("index", "wa_id", "name", "sending", "waiting", "last_sent_ms")
+
+    def __init__(self, i: int):
+        self.index = i
+        self.wa_id = f"52155{i:08d}"
+        self.name = f"Usuario {i}"
+        self.sending = False
+        self.waiting = False
+        self.last_sent_ms = 0
+
+
+class LoadRun:
+    def __init__(self, args, client: httpx.AsyncClient, agent: StubAgent, rng: random.Random):
+        self.args = args
+        self.client = client
+        self.agent = agent
+        self.rng = rng
+        self.secret = os.environ["APP_SECRET"].encode("latin-1")
+        self.gap = Latency(args.gap, rng)
+        lo, _, hi = args.burst.partition("-")
+        self.burst = (int(lo), int(hi or lo))
+        self.users = [_User(i) for i in range(args.users)]
+        self.by_id = {u.wa_id: u for u in self.users}
+        self.idle = list(range(args.users))
+        self.statuses: asyncio.Queue = asyncio.Queue()
+        self.tasks: set = set()
+        self.msg_seq = 0
+        self.ingest_ms: List[float] = []
+        self.status_ingest_ms: List[float] = []
+        self.debounce_ms: List[float] = []
+        self.reply_ms: List[float] = []
+        self.webhooks = 0
+        self.errors = 0
+        self.turns_started = 0
+        self.turns_done = 0
+        self.splits = 0
+        self.skipped = 0
+        self.load_s = 0.0
+        self.load_webhooks = self.load_turns = 0
+
+    async def _post(self, body: bytes, samples: List[float]):
+        sig = hmac.new(self.secret, msg=body, digestmod=hashlib.sha256).hexdigest()
+        t0 = time.perf_counter()
+        resp = await self.client.post("/webhook", content=body, headers={
+            "Content-Type": "application/json", "X-Hub-Signature-256": f"sha256={sig}",
+        })
+        samples.append((time.perf_counter() - t0) * 1000)
+        self.webhooks += 1
+        if resp.status_code != 200:
+            self.errors += 1
+
+    def on_graph_request(self, sent: dict, message_id: str):
+        """Hook de StubGraphAPI: un envío de texto es la respuesta a un turno."""
+        user = self.by_id.get(sent.get("to") or "")
+        if user is None or sent.get("type") != "text" or not user.waiting and not user.sending:
+            return
+        # StubAgent responde "[<entry id del turno>] ...": el id trae el ms de publicación
+        body = sent["text"]["body"]
+        published = int(body[1:body.index("-")])
+        if user.sending or published < user.last_sent_ms:
+            # La ventana cerró antes del último mensaje: el turno salió partido
+            self.splits += 1
+            return
+        t = now_ms()
+        self.debounce_ms.append(published - user.last_sent_ms)
+        self.reply_ms.append(t - user.last_sent_ms)
+        user.waiting = False
+        self.turns_done += 1
+        self.idle.append(user.index)
+        if not self.args.no_statuses:
+            self.statuses.put_nowait((user.wa_id, message_id))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _turn(self, user: _User):
+        user.sending = True
+        try:
+            n = self.rng.randint(*self.burst)
+            for i in range(n):
+                if i:
+                    await asyncio.sleep(self.gap.sample_ms() / 1000.0)
+                last = i == n - 1
+                text = self.rng.choice(TERMINAL_TEXTS if last and self.rng.random() < P_TERMINAL else OPEN_TEXTS)
+                self.msg_seq += 1
+                body = wa_text_payload(user.wa_id, user.name, f"wamid.bench.{self.msg_seq}", text, int(time.time()))
+                user.last_sent_ms = now_ms()
+                await self._post(body, self.ingest_ms)
+        finally:
+            user.sending = False
+            user.waiting = True
+
+    async def _status_sender(self):
+        while True:
+            wa_id, message_id = await self.statuses.get()
+            for status in ("delivered", "read"):
+                await self._post(wa_status_payload(wa_id, message_id, status, int(time.time())), self.status_ingest_ms)
+
+    async def run(self) -> float:
+        mean_burst = (self.burst[0] + self.burst[1]) / 2
+        turn_rate = self.args.rps / mean_burst
+        sender = asyncio.create_task(self._status_sender())
+        t0 = time.perf_counter()
+        deadline = t0 + self.args.duration
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(self.rng.expovariate(turn_rate))
+            if not self.idle:
+                self.skipped += 1
+                continue
+            k = self.rng.randrange(len(self.idle))
+            self.idle[k], self.idle[-1] = self.idle[-1], self.idle[k]
+            self.turns_started += 1
+            self._spawn(self._turn(self.users[self.idle.pop()]))
+        # Throughput sostenido: lo que se procesó mientras había carga
+        self.load_s = time.perf_counter() - t0
+        self.load_webhooks, self.load_turns = self.webhooks, self.turns_done
+
+        # Drenado: espera las respuestas pendientes (o --drain)
+        drain_until = time.perf_counter() + self.args.drain
+        while time.perf_counter() < drain_until and any(u.sending or u.waiting for u in self.users):
+            await asyncio.sleep(0.1)
+        while not self.statuses.empty() and time.perf_counter() < drain_until + 5:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - t0
+        sender.cancel()
+        await asyncio.gather(sender, *self.tasks, return_exceptions=True)
+        return elapsed
+
+
+async def main():
+    args = _args()
+    rng = random.Random(args.seed)
+
+    from app.core.settings import settings
+    from app.db import orm as orm_module
+    from app.redis_utils import client as redis_client
+    from app.whatsapp import utils
+
+    settings.DEBOUNCE_BACKEND = args.debounce_backend
+    settings.DEBOUNCE_WINDOW_MODE = args.window_mode
+    if args.window_ms is not None:
+        utils.WINDOW_MS = args.window_ms
+
+    # Redis: el de la app y el del agent stand-in comparten servidor, no contadores
+    if args.redis_url:
+        webhook_r = CountingRedis.from_url(args.redis_url, decode_responses=True)
+        agent_r = CountingRedis.from_url(args.redis_url, decode_responses=True)
+    else:
+        from fakeredis import FakeServer
+
+        server = FakeServer()
+        webhook_r = latency_redis(server, Latency(args.redis_latency, random.Random(args.seed + 1)))
+        agent_r = latency_redis(server, Latency(args.redis_latency, random.Random(args.seed + 2)))
+    redis_client.redis = webhook_r
+
+    pool = None
+    if args.database_url:
+        await orm_module.init_db_pool(args.database_url, max_size=args.db_pool)
+    else:
+        pool = StandInPool(Latency(args.db_latency, random.Random(args.seed + 3)), max_size=args.db_pool)
+        orm_module._pool = pool
+
+    agent = StubAgent(agent_r, settings.TURNS_STREAM, settings.OUTBOUND_STREAM,
+                      Latency(args.llm_latency, random.Random(args.seed + 4)), concurrency=args.llm_concurrency)
+    graph_latency = Latency(args.graph_latency, random.Random(args.seed + 5))
+    stub = StubGraphAPI(latency=graph_latency.sample_ms)
+    await stub.start()
+    settings.GRAPH_API_URL = stub.base_url
+
+    import main as webhook_main
+
+    logging.getLogger().setLevel(logging.WARNING)
+    rss_start = _rss_mb()
+    async with webhook_main.lifespan(webhook_main.app):
+        await agent.start()
+        transport = httpx.ASGITransport(app=webhook_main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            load = LoadRun(args, client, agent, rng)
+            stub.on_request = load.on_graph_request
+            webhook_r.counter.reset()
+            # La app imprime cada turno por stdout: se silencia durante la corrida
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                elapsed = await load.run()
+        await agent.stop()
+        rss_end = _rss_mb()
+    await stub.close()
+
+    done = max(1, load.turns_done)
+    result = {
+        "rev": _git_rev(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "ingest_ms": _pcts(load.ingest_ms),
+        "status_ingest_ms": _pcts(load.status_ingest_ms),
+        "debounce_ms": _pcts(load.debounce_ms),
+        "reply_ms": _pcts(load.reply_ms),
+        "throughput": {
+            "load_s": round(load.load_s, 2),
+            "elapsed_s": round(elapsed, 2),
+            "webhooks_per_s": round(load.load_webhooks / load.load_s, 2),
+            "turns_per_s": round(load.load_turns / load.load_s, 2),
+        },
+        "turns": {
+            "started": load.turns_started, "completed": load.turns_done, "split": load.splits,
+            "unanswered": sum(u.sending or u.waiting for u in load.users), "skipped_no_idle_user": load.skipped,
+            "webhook_errors": load.errors, "agent_turns": agent.turns,
+        },
+        "redis": {
+            "backend": "redis" if args.redis_url else "fakeredis",
+            "commands": webhook_r.counter.commands,
+            "round_trips": webhook_r.counter.round_trips,
+            "commands_per_turn": round(webhook_r.counter.commands / done, 2),
+            "round_trips_per_turn": round(webhook_r.counter.round_trips / done, 2),
+            "top_commands_per_turn": {c: round(n / done, 2) for c, n in webhook_r.counter.by_command.most_common(8)},
+        },
+        "db": {
+            "backend": "postgres" if args.database_url else "stand-in",
+            "queries_per_turn": round(pool.queries / done, 2) if pool else None,
+            "rows_copied": pool.rows_copied if pool else None,
+        },
+        "memory": {
+            "rss_start_mb": round(rss_start, 1),
+            "rss_end_mb": round(rss_end, 1),
+            "rss_peak_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+    }
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"e2e-{result['rev']}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+    _print(result)
+    print(f"\nresultado: {out}")
+    if args.compare:
+        _compare(json.loads(Path(args.compare).read_text()), result)
+
+
+def _get(d: dict, path: str):
+    for part in path.split("."):
+        d = (d or {}).get(part)
+    return d
+
+
+def _print(r: dict):
+    t = r["turns"]
+    print(f"rev {r['rev']}: {t['completed']}/{t['started']} turnos respondidos en {r['throughput']['elapsed_s']} s "
+          f"({t['split']} partidos, {t['unanswered']} sin respuesta, {t['skipped_no_idle_user']} sin usuario libre)")
+    for key in ("ingest_ms", "status_ingest_ms", "debounce_ms", "reply_ms"):
+        p = r[key]
+        if p.get("n"):
+            print(f"  {key:<17} n={p['n']:<6} p50={p['p50']:9.2f}  p90={p['p90']:9.2f}  p99={p['p99']:9.2f}")
+    print(f"  throughput        {r['throughput']['webhooks_per_s']} webhooks/s, {r['throughput']['turns_per_s']} turnos/s")
+    print(f"  redis             {r['redis']['commands_per_turn']} comandos/turno, "
+          f"{r['redis']['round_trips_per_turn']} round trips/turno")
+    print("                    " + ", ".join(f"{c} {n}" for c, n in r["redis"]["top_commands_per_turn"].items()))
+    if r["db"]["queries_per_turn"] is not None:
+        print(f"  db                {r['db']['queries_per_turn']} consultas/turno")
+    print(f"  memoria           RSS {r['memory']['rss_start_mb']} → {r['memory']['rss_end_mb']} MB "
+          f"(pico {r['memory']['rss_peak_mb']} MB)")
+
+
+def _compare(base: dict, cur: dict):
+    print(f"\ncomparación contra {base.get('rev')} ({base.get('timestamp')}):")
+    for path, higher_is_better in COMPARED:
+        old, new = _get(base, path), _get(cur, path)
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)):
+            continue
+        delta = (new - old) / old * 100 if old else 0.0
+        worse = delta < 0 if higher_is_better else delta > 0
+        flag = "  <-- regresión" if worse and abs(delta) >= 10 else ""
+        print(f"  {path:<28} {old:>10} → {new:<10} ({delta:+.1f}%){flag}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
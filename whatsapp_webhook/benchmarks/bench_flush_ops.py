@@ -0,0 +1,117 @@
+"""
+Round trips a Redis por ráfaga: camino anterior (GET/SET/LPOP uno a uno)
+contra los scripts Lua de app/whatsapp/scripts.py.
+
+Uso (desde whatsapp_webhook/, con un Redis local):
+    REDIS_URL=redis://localhost:6379/15 python -m benchmarks.bench_flush_ops
+"""
+import asyncio
+import json
+import os
+import time
+
+from redis.asyncio import Redis
+
+from app.whatsapp.scripts import BufferScripts
+from app.whatsapp.window import WindowPolicy
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/15")
+BURSTS = (1, 5, 30)
+ROUNDS = 200
+TTL_S = 60
+LOCK_TTL_MS = 5000
+WINDOW = WindowPolicy(0).params_json()  # ventana fija de 0 ms: vence ya
+
+
+class CountingRedis(Redis):
+    """Cliente que cuenta cada comando enviado (un round trip por comando)."""
+
+    calls = 0
+
+    async def execute_command(self, *args, **options):
+        self.calls += 1
+        return await super().execute_command(*args, **options)
+
+
+def _keys(uid):
+    return f"bench:{uid}:buf", f"bench:{uid}:timer", f"bench:{uid}:lock"
+
+
+async def legacy_burst(r: Redis, uid: str, n: int) -> int:
+    buf, timer, lock = _keys(uid)
+    for i in range(n):
+        mid = f"{uid}:{i}"
+        if not await r.set(f"bench:dedup:{mid}", "1", nx=True, ex=TTL_S):
+            continue
+        await r.rpush(buf, json.dumps({"id": mid, "ts": i, "text": "hola"}))
+        await r.expire(buf, TTL_S)
+        await r.psetex(timer, 10_000, "0")
+
+    fire_at = await r.get(timer)
+    if not fire_at or int(time.time() * 1000) < int(fire_at):
+        return 0
+    if not await r.set(lock, "1", nx=True, px=LOCK_TTL_MS):
+        return 0
+    try:
+        if not await r.get(timer):
+            return 0
+        items = []
+        while True:
+            item = await r.lpop(buf)
+            if not item:
+                break
+            items.append(item)
+        await r.delete(timer)
+        return len(items)
+    finally:
+        await r.delete(lock)
+
+
+async def scripted_burst(r: Redis, s: BufferScripts, uid: str, n: int) -> int:
+    buf, _, lock = _keys(uid)
+    sched = f"bench:sched:{uid}"
+    for i in range(n):
+        mid = f"{uid}:{i}"
+        item = json.dumps({"id": mid, "ts": i, "text": "hola"})
+        await s.ingest(keys=[buf, sched, f"bench:{uid}:gaps", f"bench:dedup:{mid}"],
+                       args=[TTL_S, TTL_S, 0, uid, WINDOW, "0", item])
+
+    # claim (normalmente amortizado entre muchos usuarios) + flush
+    now = int(time.time() * 1000)
+    _, score = await s.claim(keys=[sched], args=[now, 1, 30_000])
+    flushed = await s.flush(keys=[sched, lock, buf, f"bench:{uid}:fence"], args=[uid, score, now, LOCK_TTL_MS, 1000, TTL_S])
+    if not isinstance(flushed, list):  # nil, o -1 si hay una respuesta en curso
+        return 0
+    await s.release(keys=[lock], args=[flushed[0]])
+    return len(flushed) - 1
+
+
+async def run(label: str, r: CountingRedis, burst, n: int):
+    await r.flushdb()
+    r.calls = 0
+    t0 = time.perf_counter()
+    drained = 0
+    for i in range(ROUNDS):
+        drained += await burst(f"{label}{n}:{i}", n)
+    elapsed = time.perf_counter() - t0
+    assert drained == ROUNDS * n, (label, drained)
+    return r.calls / ROUNDS, elapsed / ROUNDS * 1000
+
+
+async def main():
+    r = CountingRedis.from_url(REDIS_URL, decode_responses=True)
+    s = BufferScripts(r)
+    await s.preload()
+
+    print(f"{'burst':>5} | {'legacy ops':>10} {'legacy ms':>9} | {'lua ops':>7} {'lua ms':>7}")
+    for n in BURSTS:
+        legacy_ops, legacy_ms = await run("legacy", r, lambda uid, n: legacy_burst(r, uid, n), n)
+        lua_ops, lua_ms = await run("lua", r, lambda uid, n: scripted_burst(r, s, uid, n), n)
+        print(f"{n:>5} | {legacy_ops:>10.1f} {legacy_ms:>9.2f} | {lua_ops:>7.1f} {lua_ms:>7.2f}")
+
+    await r.flushdb()
+    await r.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
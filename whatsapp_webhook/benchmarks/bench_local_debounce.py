@@ -0,0 +1,126 @@
+"""
+Debounce en memoria (LocalDebounce) contra Redis (RedisDebounce):
+
+1. Latencia de flush: USERS usuarios con ventanas repartidas en SPREAD_MS;
+   un poller llama claim() cada POLL_MS y mide cuánto tarde sale cada tanda
+   respecto de su fireAt (p50/p99) y el costo de ingest + claim + flush.
+2. Memoria por 10k usuarios activos con MSGS mensajes cada uno
+   (tracemalloc para el backend local, INFO memory para Redis).
+
+Uso (desde whatsapp_webhook/):
+    python -m benchmarks.bench_local_debounce
+    BENCH_REDIS_URL=redis://localhost:6379/15 python -m benchmarks.bench_local_debounce   # compara con Redis
+"""
+import asyncio
+import os
+import statistics
+import time
+import tracemalloc
+
+for _name in ("APP_NAME", "ACCESS_TOKEN", "APP_ID", "RECIPIENT_WAID", "VERSION", "PHONE_NUMBER_ID",
+              "APP_SECRET", "VERIFY_TOKEN", "OPENAI_API_KEY", "OPENAI_ASSISTANT_ID", "REDIS_URL",
+              "DB_HOST", "DB_USER", "DB_PASSWORD", "DB_NAME"):
+    os.environ.setdefault(_name, "bench")
+os.environ.setdefault("DB_PORT", "5432")
+
+from app.whatsapp.debounce import RedisDebounce  # noqa: E402
+from app.whatsapp.local_debounce import LocalDebounce  # noqa: E402
+from app.whatsapp.window import WindowPolicy  # noqa: E402
+
+REDIS_URL = os.getenv("BENCH_REDIS_URL")
+USERS = int(os.getenv("BENCH_USERS", "10000"))
+MSGS = int(os.getenv("BENCH_MSGS", "3"))
+SPREAD_MS = int(os.getenv("BENCH_SPREAD_MS", "2000"))
+POLL_MS = int(os.getenv("BENCH_POLL_MS", "10"))
+BATCH = 1000
+# Ventana fija corta para la latencia; para la memoria, una que no vence durante la medición
+SHORT = WindowPolicy(200)
+LONG = WindowPolicy(3_600_000)
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _msgs(uid: int, n: int):
+    return [{"id": f"b{uid}-{i}", "ts": 1700000000 + i, "text": f"mensaje {i} del usuario {uid}", "name": "Bench"}
+            for i in range(n)]
+
+
+def _pct(samples, q):
+    samples = sorted(samples)
+    return samples[max(0, int(len(samples) * q) - 1)]
+
+
+async def flush_latency(label: str, backend):
+    base = _now_ms()
+    t0 = time.perf_counter()
+    for uid in range(USERS):
+        await backend.ingest({f"u{uid}": _msgs(uid, MSGS)}, base + uid * SPREAD_MS // USERS)
+    ingest_us = (time.perf_counter() - t0) * 1e6 / USERS
+
+    lateness, flush_us, done = [], [], 0
+    while done < USERS:
+        due = await backend.claim(BATCH)
+        now = _now_ms()
+        for wa_id, score in due:
+            lateness.append(now - score)
+            t = time.perf_counter()
+            flushed = await backend.flush(wa_id, score)
+            flush_us.append((time.perf_counter() - t) * 1e6)
+            if flushed:
+                await backend.release(wa_id, flushed[0])
+                done += 1
+        if not due:
+            await asyncio.sleep(POLL_MS / 1000)
+    print(f"{label:<6} ingest={ingest_us:7.1f} us/usuario  flush p50={statistics.median(flush_us):7.1f} us  "
+          f"retraso sobre fireAt p50={statistics.median(lateness):4.0f} ms  p99={_pct(lateness, 0.99):4.0f} ms")
+
+
+async def memory_local() -> float:
+    backend = LocalDebounce(3600, 5000, 1000, LONG, max_users=USERS * 2)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    now = _now_ms()
+    for uid in range(USERS):
+        await backend.ingest({f"u{uid}": _msgs(uid, MSGS)}, now)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return sum(s.size_diff for s in after.compare_to(before, "filename"))
+
+
+async def memory_redis(r) -> float:
+    backend = RedisDebounce(r, 3600, 30000, 5000, 1000, LONG)
+    await backend.start()
+    before = (await r.info("memory"))["used_memory"]
+    now = _now_ms()
+    for uid in range(USERS):
+        await backend.ingest({f"u{uid}": _msgs(uid, MSGS)}, now)
+    return (await r.info("memory"))["used_memory"] - before
+
+
+async def main():
+    print(f"{USERS} usuarios x {MSGS} mensajes, fireAt repartido en {SPREAD_MS} ms, poll cada {POLL_MS} ms\n")
+    local = LocalDebounce(3600, 5000, 1000, SHORT, max_users=USERS * 2)
+    await flush_latency("local", local)
+    r = None
+    if REDIS_URL:
+        from app.redis_utils import create_redis
+
+        r = create_redis(REDIS_URL)
+        await r.flushdb()
+        remote = RedisDebounce(r, 3600, 30000, 5000, 1000, SHORT)
+        await remote.start()
+        await flush_latency("redis", remote)
+        await r.flushdb()
+
+    per_10k = 10_000 / USERS
+    print(f"\nmemoria local: {await memory_local() * per_10k / 1024 / 1024:6.2f} MiB por 10k usuarios activos")
+    if r is not None:
+        print(f"memoria redis: {await memory_redis(r) * per_10k / 1024 / 1024:6.2f} MiB por 10k usuarios activos")
+        await r.flushdb()
+        await r.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,196 @@
+"""
+Descarga de media contra StubGraphAPI: MediaFetcher (streaming por chunks a
+disco, con tope de descargas simultáneas) frente a la descarga ingenua
+(`resp.content` completo en memoria y sha256 en el event loop).
+
+Publica --files jobs en MEDIA_STREAM (notas de voz de --size-mb, a
+--bandwidth-mbps por descarga); una fracción --dup-ids repite un media_id
+(reintentos de Meta) y --dup-content usa otro media_id con el mismo archivo
+(media reenviada). Reporta duración, MB/s, pico de memoria de Python
+(tracemalloc), descargas simultáneas vistas por el stub, dedup y el retraso
+del event loop mientras se descarga (lo que esperaría un webhook entrante).
+
+Uso (desde whatsapp_webhook/):
+    python -m benchmarks.bench_media --files 24 --size-mb 16 --concurrency 4
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+for _name in ("APP_NAME", "ACCESS_TOKEN", "APP_ID", "RECIPIENT_WAID", "VERSION", "PHONE_NUMBER_ID",
+              "VERIFY_TOKEN", "OPENAI_API_KEY", "OPENAI_ASSISTANT_ID", "REDIS_URL",
+              "DB_HOST", "DB_USER", "DB_PASSWORD", "DB_NAME"):
+    os.environ.setdefault(_name, "bench")
+os.environ.setdefault("DB_PORT", "5432")
+os.environ.setdefault("APP_SECRET", "bench-secret")
+
+import httpx  # noqa: E402
+from fakeredis import FakeServer  # noqa: E402
+
+from app.whatsapp.media import MediaFetcher, MediaStore  # noqa: E402
+from benchmarks.standins import latency_redis  # noqa: E402
+from benchmarks.stub_graph_api import StubGraphAPI  # noqa: E402
+
+VERSION = "v21.0"
+
+
+def _args():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--files", type=int, default=24, help="jobs publicados en MEDIA_STREAM")
+    p.add_argument("--size-mb", type=float, default=16.0, help="tamaño de cada archivo")
+    p.add_argument("--bandwidth-mbps", type=float, default=0.0, help="MB/s por descarga en el stub (0 = sin tope)")
+    p.add_argument("--concurrency", type=int, default=4, help="MEDIA_MAX_CONCURRENT_DOWNLOADS")
+    p.add_argument("--chunk-kb", type=int, default=64, help="MEDIA_CHUNK_BYTES / 1024")
+    p.add_argument("--dup-ids", type=float, default=0.1, help="fracción de jobs que repiten un media_id")
+    p.add_argument("--dup-content", type=float, default=0.1, help="fracción de media_ids con contenido repetido")
+    p.add_argument("--seed", type=int, default=7)
+    return p.parse_args()
+
+
+class LoopLag:
+    """Retraso del event loop: cuánto tarda en despertar un sleep de 1 ms."""
+
+    def __init__(self):
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.001)
+            self.samples.append((time.perf_counter() - t0 - 0.001) * 1000)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    def report(self) -> str:
+        s = sorted(self.samples) or [0.0]
+        return f"p50={statistics.median(s):.2f} ms p99={s[int(len(s) * 0.99)]:.2f} ms max={s[-1]:.2f} ms"
+
+
+def _populate(stub: StubGraphAPI, args, rng: random.Random):
+    """Registra los archivos en el stub y devuelve la lista de jobs (con repetidos)."""
+    size = int(args.size_mb * 1024 * 1024)
+    blobs = []
+    ids = []
+    for i in range(args.files):
+        if blobs and rng.random() < args.dup_content:
+            data = rng.choice(blobs)
+        else:
+            data = os.urandom(size)
+            blobs.append(data)
+        media_id = f"media{i}"
+        stub.add_media(media_id, data, "audio/ogg")
+        ids.append(media_id)
+    jobs = []
+    for i, media_id in enumerate(ids):
+        jobs.append(rng.choice(ids[:i]) if i and rng.random() < args.dup_ids else media_id)
+    return jobs
+
+
+async def run_fetcher(stub: StubGraphAPI, jobs, args, root: str):
+    r = latency_redis(FakeServer(), None)
+    results = {}
+    done = asyncio.Event()
+
+    def on_result(msg_id, meta):
+        results[msg_id] = meta
+        if len(results) == len(jobs):
+            done.set()
+
+    fetcher = MediaFetcher(
+        r, MediaStore(root), access_token="bench", version=VERSION, base_url=stub.base_url,
+        on_result=on_result, max_concurrent=args.concurrency, chunk_bytes=args.chunk_kb * 1024,
+        max_bytes=int(args.size_mb * 1024 * 1024) + 1, block_ms=50,
+    )
+    await fetcher.start()
+    for i, media_id in enumerate(jobs):
+        await r.xadd(fetcher.stream, {"wa_id": "5215550000000", "msg_id": f"wamid.{i}", "type": "audio",
+                                      "media_id": media_id, "mime_type": "audio/ogg", "sha256": "", "filename": ""})
+    lag = LoopLag()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    lag.start()
+    t0 = time.perf_counter()
+    await asyncio.wait_for(done.wait(), timeout=600)
+    elapsed = time.perf_counter() - t0
+    await lag.stop()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    await fetcher.stop()
+    await r.aclose()
+
+    for msg_id, meta in results.items():
+        media_id = jobs[int(msg_id.split(".")[1])]
+        assert meta["media_status"] == "stored", meta
+        assert meta["media_sha256"] == stub.media[media_id][2], (msg_id, meta)
+        with open(fetcher.store.path(meta["media_sha256"]), "rb") as f:
+            assert hashlib.file_digest(f, "sha256").hexdigest() == meta["media_sha256"]
+    return elapsed, peak, lag
+
+
+async def run_naive(stub: StubGraphAPI, jobs, root: str):
+    """Lo que haría el request del webhook: bajar todo en memoria y hashear en el loop."""
+    lag = LoopLag()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    lag.start()
+    t0 = time.perf_counter()
+    async with httpx.AsyncClient(base_url=stub.base_url, timeout=60) as http:
+        async def one(i, media_id):
+            info = (await http.get(f"/{VERSION}/{media_id}")).json()
+            data = (await http.get(info["url"])).content
+            sha256 = hashlib.sha256(data).hexdigest()
+            with open(os.path.join(root, f"{i}-{sha256}"), "wb") as f:
+                f.write(data)
+        await asyncio.gather(*(one(i, m) for i, m in enumerate(jobs)))
+    elapsed = time.perf_counter() - t0
+    await lag.stop()
+    return elapsed, tracemalloc.get_traced_memory()[1] - base, lag
+
+
+async def main():
+    args = _args()
+    rng = random.Random(args.seed)
+    stub = StubGraphAPI(latency_ms=5, jitter_ms=1,
+                        media_bps=args.bandwidth_mbps * 1024 * 1024 if args.bandwidth_mbps else None)
+    jobs = _populate(stub, args, rng)
+    await stub.start()
+    tracemalloc.start()
+    unique_ids = len(set(jobs))
+    unique_content = len({stub.media[m][2] for m in jobs})
+    total_mb = len(jobs) * args.size_mb
+    print(f"{len(jobs)} jobs de {args.size_mb:g} MB: {unique_ids} media_ids, {unique_content} contenidos distintos")
+
+    with tempfile.TemporaryDirectory() as root:
+        elapsed, peak, lag = await run_fetcher(stub, jobs, args, root)
+        print(f"\nMediaFetcher (concurrency={args.concurrency}, chunk={args.chunk_kb} KB)")
+        print(f"  {elapsed:.2f} s, {total_mb / elapsed:.1f} MB/s efectivos, "
+              f"{stub.media_downloads} descargas, máx. simultáneas {stub.max_media_concurrent}")
+        print(f"  pico de memoria {peak / 1024 / 1024:.1f} MB, loop lag {lag.report()}")
+        assert stub.max_media_concurrent <= args.concurrency
+        assert stub.media_downloads <= unique_ids
+
+    stub.media_downloads = stub.max_media_concurrent = 0
+    with tempfile.TemporaryDirectory() as root:
+        elapsed, peak, lag = await run_naive(stub, jobs, root)
+        print("\ningenua (todo en memoria, sin tope ni dedup)")
+        print(f"  {elapsed:.2f} s, {total_mb / elapsed:.1f} MB/s efectivos, "
+              f"{stub.media_downloads} descargas, máx. simultáneas {stub.max_media_concurrent}")
+        print(f"  pico de memoria {peak / 1024 / 1024:.1f} MB, loop lag {lag.report()}")
+
+    tracemalloc.stop()
+    await stub.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
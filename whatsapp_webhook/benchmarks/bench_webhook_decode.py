@@ -0,0 +1,98 @@
+"""
+Requests/seg por core del camino de decodificación del webhook:
+HMAC + json.loads + sondeo de dicts (anterior) contra HMAC + decoder
+msgspec compilado + structs tipados (actual). Sin red ni Redis.
+
+Uso (desde whatsapp_webhook/):
+    python -m benchmarks.bench_webhook_decode
+"""
+import hashlib
+import hmac
+import json
+import os
+import time
+
+for _name in ("APP_NAME", "ACCESS_TOKEN", "APP_ID", "RECIPIENT_WAID", "VERSION", "PHONE_NUMBER_ID",
+              "APP_SECRET", "VERIFY_TOKEN", "OPENAI_API_KEY", "OPENAI_ASSISTANT_ID", "REDIS_URL",
+              "DB_HOST", "DB_USER", "DB_PASSWORD", "DB_NAME"):
+    os.environ.setdefault(_name, "bench")
+os.environ.setdefault("DB_PORT", "5432")
+
+from app.whatsapp.schemas import decode_webhook  # noqa: E402
+from app.whatsapp.utils import _extract_events, is_valid_whatsapp_message  # noqa: E402
+
+SECRET = b"bench-secret"
+DURATION_S = 2.0
+
+
+def make_payload(n_messages: int, n_statuses: int = 0) -> bytes:
+    messages = [
+        {"from": f"52155{i:07d}", "id": f"wamid.{i}", "timestamp": "1760000000",
+         "type": "text", "text": {"body": f"hola, quiero agendar una limpieza {i}"}}
+        for i in range(n_messages)
+    ]
+    contacts = [{"wa_id": m["from"], "profile": {"name": f"Paciente {i}"}} for i, m in enumerate(messages)]
+    statuses = [
+        {"id": f"wamid.out.{i}", "status": "delivered", "timestamp": "1760000000", "recipient_id": "5215500000000"}
+        for i in range(n_statuses)
+    ]
+    value = {"messaging_product": "whatsapp", "metadata": {"display_phone_number": "5215500000000",
+             "phone_number_id": "123"}, "contacts": contacts, "messages": messages, "statuses": statuses}
+    body = {"object": "whatsapp_business_account",
+            "entry": [{"id": "WABA", "changes": [{"field": "messages", "value": value}]}]}
+    return json.dumps(body).encode()
+
+
+def _verify(raw: bytes, signature: str) -> bool:
+    expected = hmac.new(SECRET, msg=raw, digestmod=hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def legacy_path(raw: bytes, signature: str) -> int:
+    assert _verify(raw, signature)
+    body = json.loads(raw)
+    count = 0
+    for entry in body.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            names = {c.get("wa_id"): (c.get("profile") or {}).get("name") for c in value.get("contacts") or []}
+            for msg in value.get("messages") or []:
+                _ = (msg.get("from"), names.get(msg.get("from")), msg["id"], int(msg["timestamp"]) * 1000,
+                     (msg.get("text") or {}).get("body", "").strip())
+                count += 1
+            count += len(value.get("statuses") or [])
+    return count
+
+
+def typed_path(raw: bytes, signature: str) -> int:
+    assert _verify(raw, signature)
+    payload = decode_webhook(raw)
+    assert is_valid_whatsapp_message(payload)
+    msgs, statuses = _extract_events(payload)
+    return len(msgs) + len(statuses)
+
+
+def rps(fn, raw: bytes, signature: str) -> float:
+    n = 0
+    deadline = time.perf_counter() + DURATION_S
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            fn(raw, signature)
+        n += 100
+    return n / DURATION_S
+
+
+def main():
+    print(f"{'payload':>16} | {'bytes':>6} | {'legacy req/s':>12} | {'msgspec req/s':>13} | {'speedup':>7}")
+    for n_msgs, n_status in ((1, 0), (0, 3), (10, 0), (50, 50)):
+        raw = make_payload(n_msgs, n_status)
+        sig = hmac.new(SECRET, msg=raw, digestmod=hashlib.sha256).hexdigest()
+        assert legacy_path(raw, sig) == typed_path(raw, sig)
+        legacy = rps(legacy_path, raw, sig)
+        typed = rps(typed_path, raw, sig)
+        label = f"{n_msgs} msg/{n_status} st"
+        print(f"{label:>16} | {len(raw):>6} | {legacy:>12,.0f} | {typed:>13,.0f} | {typed / legacy:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
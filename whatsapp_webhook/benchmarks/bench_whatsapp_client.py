@@ -0,0 +1,62 @@
+"""
+Latencia y throughput de WhatsAppClient contra StubGraphAPI local.
+
+Uso (desde whatsapp_webhook/):
+    python -m benchmarks.bench_whatsapp_client
+"""
+import asyncio
+import logging
+import statistics
+import time
+
+from app.whatsapp.client import WhatsAppClient
+from benchmarks.stub_graph_api import StubGraphAPI
+
+SENDS = 2000
+SCENARIOS = (
+    # (rate/s, max_inflight, error_rate)
+    (80, 32, 0.0),
+    (1000, 32, 0.0),
+    (1000, 32, 0.05),
+    (1000, 128, 0.0),
+)
+
+
+async def run(rate: float, inflight: int, error_rate: float):
+    stub = StubGraphAPI(latency_ms=20, jitter_ms=5, error_rate=error_rate)
+    await stub.start()
+    client = WhatsAppClient(
+        access_token="bench", phone_number_id="123", version="v21.0",
+        base_url=stub.base_url, rate_per_s=rate, max_inflight=inflight,
+        backoff_base_s=0.01, http2=False,
+    )
+    sends = min(SENDS, int(rate * 5))
+    latencies = []
+
+    async def one(i):
+        t0 = time.perf_counter()
+        await client.send_text(f"52155{i:07d}", "hola")
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(sends)))
+    elapsed = time.perf_counter() - t0
+    await client.close()
+    await stub.close()
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{rate:>6.0f} {inflight:>8} {error_rate:>6.2f} | {sends / elapsed:>9.1f} "
+          f"{statistics.median(latencies):>8.1f} {p99:>8.1f} | {stub.max_concurrent:>6} {stub.errors:>6}")
+
+
+async def main():
+    logging.disable(logging.WARNING)  # sin el log de cada reintento
+    print(f"{'rate':>6} {'inflight':>8} {'err':>6} | {'sends/s':>9} {'p50 ms':>8} {'p99 ms':>8} | "
+          f"{'conc':>6} {'retry':>6}")
+    for scenario in SCENARIOS:
+        await run(*scenario)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
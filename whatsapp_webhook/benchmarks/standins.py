@@ -0,0 +1,344 @@
+"""
+Stand-ins locales para el benchmark de punta a punta (bench_e2e):
+
+- Latency: distribución de latencia a partir de un spec ("20", "normal:20,5",
+  "lognormal:20,0.6", "uniform:10,30", "exp:20"), en ms.
+- LatencyRedis / CountingRedis: Redis en memoria (fakeredis) con latencia
+  por round trip, o un Redis real; ambos cuentan comandos y round trips
+  (un pipeline es un round trip).
+- StandInPool: reemplazo del asyncpg.Pool con las consultas que hace el
+  webhook (resolve_session, historial, COPY de messages, status), con
+  latencia por consulta y tamaño de pool.
+- StubAgent: consumidor de TURNS_STREAM que imita al agent worker (latencia
+  del LLM, tope de concurrencia, heartbeats) y publica en OUTBOUND_STREAM.
+"""
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ResponseError
+
+
+class Latency:
+    """Muestrea latencias (ms) según un spec `tipo:parámetros`."""
+
+    KINDS = ("const", "normal", "lognormal", "uniform", "exp")
+
+    def __init__(self, spec: str | float, rng: random.Random | None = None):
+        self.spec = str(spec)
+        self._rng = rng or random.Random()
+        kind, _, params = self.spec.partition(":")
+        if not params:
+            kind, params = "const", kind
+        if kind not in self.KINDS:
+            raise ValueError(f"Latencia inválida {spec!r}: usa uno de {self.KINDS}")
+        self.kind = kind
+        self.params = [float(x) for x in params.split(",")]
+
+    def sample_ms(self) -> float:
+        p, rng = self.params, self._rng
+        if self.kind == "const":
+            v = p[0]
+        elif self.kind == "normal":
+            v = rng.gauss(p[0], p[1])
+        elif self.kind == "lognormal":
+            v = p[0] * rng.lognormvariate(0, p[1])  # p[0] = mediana
+        elif self.kind == "uniform":
+            v = rng.uniform(p[0], p[1])
+        else:
+            v = rng.expovariate(1.0 / p[0])
+        return max(0.0, v)
+
+    async def sleep(self):
+        ms = self.sample_ms()
+        if ms > 0:
+            await asyncio.sleep(ms / 1000.0)
+
+    def __repr__(self) -> str:
+        return self.spec
+
+
+class _Counter:
+    def __init__(self):
+        self.commands = 0
+        self.round_trips = 0
+        self.by_command: Counter = Counter()
+
+    def reset(self):
+        self.commands = self.round_trips = 0
+        self.by_command.clear()
+
+
+class _CountingPipeline(Pipeline):
+    counter: _Counter
+    latency: Optional[Latency] = None
+
+    async def execute(self, raise_on_error: bool = True) -> List[Any]:
+        if self.command_stack:
+            self.counter.round_trips += 1
+            self.counter.commands += len(self.command_stack)
+            self.counter.by_command.update(str(args[0]).upper() for args, _ in self.command_stack)
+            if self.latency is not None:
+                await self.latency.sleep()
+        return await super().execute(raise_on_error)
+
+
+class _CountingMixin:
+    """Cuenta comandos/round trips y opcionalmente agrega latencia por round trip."""
+
+    counter: _Counter
+    latency: Optional[Latency] = None
+
+    async def execute_command(self, *args, **options):
+        self.counter.round_trips += 1
+        self.counter.commands += 1
+        self.counter.by_command[str(args[0]).upper()] += 1
+        if self.latency is not None:
+            await self.latency.sleep()
+        return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> Pipeline:
+        pipe = _CountingPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+        pipe.counter = self.counter
+        pipe.latency = self.latency
+        return pipe
+
+
+class CountingRedis(_CountingMixin, Redis):
+    """Redis real con contador de operaciones."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.counter = _Counter()
+
+
+class _BlockingReadsMixin:
+    """
+    fakeredis responde XREAD/XREADGROUP con BLOCK al instante aunque no haya
+    nada: aquí se reintenta cada 10 ms hasta que llegue algo o venza el BLOCK,
+    como haría Redis (si no, los consumidores giran en vacío y ensucian las
+    cuentas de comandos y la CPU del benchmark).
+    """
+
+    async def execute_command(self, *args, **options):
+        words = [a.decode() if isinstance(a, bytes) else a for a in args]
+        if str(words[0]).upper() not in ("XREAD", "XREADGROUP") or "BLOCK" not in words:
+            return await super().execute_command(*args, **options)
+        block_s = int(words[words.index("BLOCK") + 1]) / 1000.0
+        deadline = time.monotonic() + (block_s or 3600.0)  # BLOCK 0 = sin límite
+        while True:
+            resp = await super().execute_command(*args, **options)
+            remaining = deadline - time.monotonic()
+            if resp or remaining <= 0:
+                return resp
+            await asyncio.sleep(min(0.01, remaining))
+
+
+def latency_redis(server, latency: Latency | None) -> Redis:
+    """Cliente fakeredis (sobre `server`, compartible) con latencia por round trip."""
+    from fakeredis.aioredis import FakeRedis
+
+    class LatencyRedis(_CountingMixin, _BlockingReadsMixin, FakeRedis):
+        pass
+
+    r = LatencyRedis(server=server, decode_responses=True)
+    r.counter = _Counter()
+    r.latency = latency
+    return r
+
+
+class _StandInConnection:
+    def __init__(self, pool: "StandInPool"):
+        self._pool = pool
+
+    async def _call(self):
+        self._pool.queries += 1
+        await self._pool.latency.sleep()
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def fetchrow(self, sql: str, *args):
+        await self._call()
+        if "resolve_session" in sql:
+            return self._pool.resolve(args[0])
+        return None
+
+    async def fetch(self, sql: str, *args) -> List[Dict[str, Any]]:
+        await self._call()
+        if sql.lstrip().startswith("UPDATE messages") or "SELECT channel_id FROM messages" in sql:
+            return [{"channel_id": c} for c in args[0] if c in self._pool.channel_ids]
+        return []
+
+    async def fetchval(self, sql: str, *args):
+        await self._call()
+        if "pg_try_advisory_lock" in sql:
+            return False  # el mantenimiento de particiones no corre en el benchmark
+        return None
+
+    async def execute(self, sql: str, *args) -> str:
+        await self._call()
+        return "OK"
+
+    async def executemany(self, sql: str, records):
+        await self._call()
+
+    async def copy_records_to_table(self, table: str, records, columns, schema_name=None):
+        await self._call()
+        self._pool.rows_copied += len(records)
+        if table == "messages" and "channel_id" in columns:
+            idx = list(columns).index("channel_id")
+            self._pool.channel_ids.update(r[idx] for r in records if r[idx])
+
+
+class StandInPool:
+    """
+    Reemplazo de asyncpg.Pool para el webhook: `max_size` conexiones y una
+    latencia por consulta. Guarda lo mínimo para responder como Postgres
+    (sesiones por teléfono y los channel_id insertados en messages).
+    """
+
+    def __init__(self, latency: Latency, max_size: int = 10, session_ttl_s: int = 24 * 60 * 60):
+        self.latency = latency
+        self.session_ttl_s = session_ttl_s
+        self.queries = 0
+        self.rows_copied = 0
+        self.channel_ids: Set[str] = set()
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._slots = asyncio.Semaphore(max_size)
+
+    def resolve(self, phone: str) -> Dict[str, Any]:
+        row = self._sessions.get(phone)
+        if row is not None:
+            return {**row, "created": False}
+        row = {
+            "user_id": uuid.uuid4(),
+            "conversation_id": uuid.uuid4(),
+            "session_id": uuid.uuid4(),
+            "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.session_ttl_s),
+        }
+        self._sessions[phone] = row
+        return {**row, "created": True}
+
+    @asynccontextmanager
+    async def acquire(self):
+        async with self._slots:
+            yield _StandInConnection(self)
+
+    async def close(self):
+        pass
+
+
+class StubAgent:
+    """
+    Imita al agent worker sobre los streams: lee turnos con XREADGROUP,
+    espera la latencia del LLM (con a lo sumo `concurrency` en curso),
+    publica heartbeats mientras tanto y luego typing + la respuesta final
+    con el mismo fence del turno. La respuesta empieza con "[entry_id]",
+    así quien la recibe sabe a qué turno (y a qué hora publicado) responde.
+    """
+
+    def __init__(self, r: Redis, turns_stream: str, outbound_stream: str, llm: Latency,
+                 concurrency: int = 16, heartbeat_ms: int = 4000, group: str = "bench-agent"):
+        self._r = r
+        self.turns_stream = turns_stream
+        self.outbound_stream = outbound_stream
+        self.llm = llm
+        self.group = group
+        self.heartbeat_s = heartbeat_ms / 1000.0
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self._loop_task: asyncio.Task | None = None
+        self.turns = 0
+
+    async def start(self):
+        try:
+            await self._r.xgroup_create(self.turns_stream, self.group, id="$", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._loop_task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._loop_task:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _loop(self):
+        while True:
+            resp = await self._r.xreadgroup(self.group, "stub", {self.turns_stream: ">"}, count=50, block=50)
+            for _, entries in resp or []:
+                for entry_id, fields in entries:
+                    await self._r.xack(self.turns_stream, self.group, entry_id)
+                    task = asyncio.create_task(self._reply(entry_id, fields))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+
+    async def _publish(self, entry_id: str, fields: Dict[str, str], kind: str, text: str = "", final: bool = False,
+                       stats: Dict[str, str] | None = None):
+        await self._r.xadd(self.outbound_stream, {
+            "kind": kind, "wa_id": fields["wa_id"], "text": text, "seq": "0",
+            "final": "1" if final else "0", "turn_id": entry_id,
+            "msg_ids": fields.get("msg_ids", "[]"), "fence": fields.get("fence", ""),
+            "trace_id": fields.get("trace_id", ""), **(stats or {}),
+        })
+
+    async def _beat(self, entry_id: str, fields: Dict[str, str]):
+        while True:
+            await asyncio.sleep(self.heartbeat_s)
+            await self._publish(entry_id, fields, "heartbeat")
+
+    async def _reply(self, entry_id: str, fields: Dict[str, str]):
+        beat = asyncio.create_task(self._beat(entry_id, fields))
+        try:
+            t0 = time.perf_counter()
+            async with self._slots:
+                t1 = time.perf_counter()
+                await self._publish(entry_id, fields, "typing")
+                await self.llm.sleep()
+            self.turns += 1
+            # Mismos campos de métricas que la salida final del TurnHandler
+            stats = {"source": "llm", "queue_ms": f"{(t1 - t0) * 1000:.0f}",
+                     "llm_ms": f"{(time.perf_counter() - t1) * 1000:.0f}",
+                     "tokens_in": str(len(fields["text"]) // 4 + 400), "tokens_out": "60"}
+            await self._publish(entry_id, fields, "text", f"[{entry_id}] respuesta a: {fields['text'][:60]}",
+                                final=True, stats=stats)
+        finally:
+            beat.cancel()
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def wa_text_payload(wa_id: str, name: str, msg_id: str, text: str, ts_s: int) -> bytes:
+    value = {
+        "messaging_product": "whatsapp",
+        "metadata": {"display_phone_number": "5215500000000", "phone_number_id": "bench"},
+        "contacts": [{"wa_id": wa_id, "profile": {"name": name}}],
+        "messages": [{"from": wa_id, "id": msg_id, "timestamp": str(ts_s), "type": "text", "text": {"body": text}}],
+    }
+    return json.dumps({"object": "whatsapp_business_account",
+                       "entry": [{"id": "WABA", "changes": [{"field": "messages", "value": value}]}]}).encode()
+
+
+def wa_status_payload(recipient: str, msg_id: str, status: str, ts_s: int) -> bytes:
+    value = {
+        "messaging_product": "whatsapp",
+        "metadata": {"display_phone_number": "5215500000000", "phone_number_id": "bench"},
+        "statuses": [{"id": msg_id, "status": status, "timestamp": str(ts_s), "recipient_id": recipient}],
+    }
+    return json.dumps({"object": "whatsapp_business_account",
+                       "entry": [{"id": "WABA", "changes": [{"field": "messages", "value": value}]}]}).encode()
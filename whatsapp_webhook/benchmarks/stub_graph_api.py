@@ -0,0 +1,152 @@
+"""
+Servidor HTTP/1.1 mínimo (asyncio puro) que imita /{version}/{phone}/messages
+de Graph API, con latencia configurable y una fracción de respuestas 429/5xx,
+para probar y medir WhatsAppClient sin salir a Internet.
+
+`latency` (callable que devuelve ms) reemplaza a la normal latency_ms/jitter_ms
+y `on_request` recibe el body y el message id de cada envío exitoso
+(bench_e2e lo usa para medir cuándo llega la respuesta a cada usuario).
+
+También sirve media: `add_media` registra un archivo y el stub responde
+GET /{version}/{media_id} con sus metadatos (url, mime_type, sha256,
+file_size) y GET /media/{media_id} con el contenido, escrito de a
+`MEDIA_CHUNK` bytes y a `media_bps` bytes/seg si se fija.
+"""
+import asyncio
+import hashlib
+import json
+import random
+from typing import Callable, Dict, Optional, Tuple
+
+MEDIA_CHUNK = 64 * 1024
+
+
+class StubGraphAPI:
+    def __init__(self, latency_ms: float = 20.0, jitter_ms: float = 5.0, error_rate: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0,
+                 latency: Optional[Callable[[], float]] = None,
+                 on_request: Optional[Callable[[dict, str], None]] = None,
+                 media_bps: Optional[float] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.latency = latency or (lambda: random.gauss(self.latency_ms, self.jitter_ms))
+        self.on_request = on_request
+        self.error_rate = error_rate
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.errors = 0
+        self.max_concurrent = 0
+        self.media_bps = media_bps
+        self.media: Dict[str, Tuple[bytes, str, str]] = {}  # media_id -> (data, mime_type, sha256)
+        self.media_downloads = 0
+        self.max_media_concurrent = 0
+        self._media_concurrent = 0
+        self._concurrent = 0
+        self._server: asyncio.AbstractServer | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def add_media(self, media_id: str, data: bytes, mime_type: str = "application/octet-stream") -> str:
+        """Registra un archivo descargable y devuelve su sha256 (hex)."""
+        sha256 = hashlib.sha256(data).hexdigest()
+        self.media[media_id] = (data, mime_type, sha256)
+        return sha256
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _respond(self, writer, status: int, body: dict, extra: str = ""):
+        raw = json.dumps(body).encode()
+        reason = {200: "OK", 404: "Not Found", 429: "Too Many Requests", 503: "Service Unavailable"}.get(status, "OK")
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(raw)}\r\n{extra}\r\n".encode() + raw
+        )
+        await writer.drain()
+
+    async def _send_media(self, writer, media_id: str):
+        data, mime_type, _ = self.media[media_id]
+        self.media_downloads += 1
+        self._media_concurrent += 1
+        self.max_media_concurrent = max(self.max_media_concurrent, self._media_concurrent)
+        try:
+            writer.write(
+                f"HTTP/1.1 200 OK\r\nContent-Type: {mime_type}\r\nContent-Length: {len(data)}\r\n\r\n".encode()
+            )
+            view = memoryview(data)
+            for i in range(0, len(data), MEDIA_CHUNK):
+                writer.write(view[i:i + MEDIA_CHUNK])
+                await writer.drain()
+                if self.media_bps:
+                    await asyncio.sleep(MEDIA_CHUNK / self.media_bps)
+        finally:
+            self._media_concurrent -= 1
+
+    async def _handle_get(self, writer, path: str):
+        parts = path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "media" and parts[1] in self.media:
+            await self._send_media(writer, parts[1])
+        elif len(parts) == 2 and parts[1] in self.media:
+            data, mime_type, sha256 = self.media[parts[1]]
+            await self._respond(writer, 200, {
+                "messaging_product": "whatsapp",
+                "url": f"{self.base_url}/media/{parts[1]}",
+                "mime_type": mime_type,
+                "sha256": sha256,
+                "file_size": len(data),
+                "id": parts[1],
+            })
+        else:
+            await self._respond(writer, 404, {"error": {"message": "unknown media"}})
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                method, path, _ = head.split(b"\r\n", 1)[0].decode().split(" ", 2)
+                length = 0
+                for line in head.split(b"\r\n")[1:]:
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                body = await reader.readexactly(length) if length else b""
+
+                self.requests += 1
+                self._concurrent += 1
+                self.max_concurrent = max(self.max_concurrent, self._concurrent)
+                try:
+                    delay = max(0.0, self.latency()) / 1000.0
+                    await asyncio.sleep(delay)
+                    if random.random() < self.error_rate:
+                        self.errors += 1
+                        status = random.choice((429, 503))
+                        extra = "Retry-After: 0\r\n" if status == 429 else ""
+                        await self._respond(writer, status, {"error": {"message": "stub error"}}, extra)
+                        continue
+                    if method == "GET":
+                        await self._handle_get(writer, path)
+                        continue
+                    sent = json.loads(body or b"{}")
+                    to = sent.get("to")
+                    message_id = f"wamid.stub.{self.requests}"
+                    if self.on_request is not None:
+                        self.on_request(sent, message_id)
+                    await self._respond(writer, 200, {
+                        "messaging_product": "whatsapp",
+                        "contacts": [{"input": to, "wa_id": to}],
+                        "messages": [{"id": message_id}],
+                    })
+                finally:
+                    self._concurrent -= 1
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
@@ -1,24 +1,101 @@
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from app.api.routes.health import health_router
+from app.api.routes.metrics import metrics_router
 from app.api.routes.webhooks import whatsapp_webhook_router
+from app.core import metrics
 from app.core.settings import settings
-from app.db.orm import init_db_pool, close_db_pool, AsyncPGORM
+from app.db.orm import init_db_pool, close_db_pool
+from app.db.partitions import PartitionMaintainer
+from app.redis_utils import close_redis, get_redis, health_check
+from app.whatsapp.dispatcher import OutboundDispatcher
+from app.whatsapp.scheduler import DebounceScheduler
+from app.whatsapp.utils import (
+    get_debounce, get_history, get_media, get_orm, get_writer, get_whatsapp_client, claim_due, try_process,
+    deliver_reply,
+)
 
 DB_URL = f"postgresql://{settings.DB_USER}:{settings.DB_PASSWORD}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
 
 
-# async def lifespan(app: FastAPI):
-#     global orm
-    
-#     await init_db_pool(DB_URL)
-#     orm = AsyncPGORM()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Falla rápido si Redis no responde
+    redis_health = await health_check()
+    if not redis_health["ok"]:
+        raise RuntimeError(f"Redis no disponible: {redis_health.get('error')}")
+
+    await init_db_pool(DB_URL)
+    orm = await get_orm()
+    if orm.cache is not None:
+        await orm.cache.start()
+    writer = await get_writer()
+    await writer.start()
+    partitions = PartitionMaintainer(
+        months_ahead=settings.PARTITION_MONTHS_AHEAD,
+        retain_months=settings.MESSAGES_RETENTION_MONTHS,
+        archive_dir=settings.MESSAGES_ARCHIVE_DIR,
+        interval_s=settings.PARTITION_MAINTENANCE_INTERVAL_S,
+    )
+    await partitions.start()
+
+    # Precarga los scripts Lua (EVALSHA desde el primer mensaje) o reproduce el journal local
+    debounce = await get_debounce()
+    await debounce.start()
+    await (await get_history()).preload()
+
+    scheduler = DebounceScheduler(
+        claim=claim_due,
+        on_due=try_process,
+        pollers=settings.DEBOUNCE_POLLERS,
+        interval_ms=settings.DEBOUNCE_POLL_INTERVAL_MS,
+        batch=settings.DEBOUNCE_CLAIM_BATCH,
+        max_inflight=settings.DEBOUNCE_MAX_INFLIGHT,
+    )
+    await scheduler.start()
+
+    # Entrega las respuestas que publica el agent worker
+    dispatcher = OutboundDispatcher(
+        await get_redis(),
+        stream=settings.OUTBOUND_STREAM,
+        group=settings.OUTBOUND_GROUP,
+        deliver=deliver_reply,
+        claim_idle_ms=settings.OUTBOUND_CLAIM_IDLE_MS,
+        retry_s=settings.OUTBOUND_RETRY_S,
+    )
+    await get_whatsapp_client().start()
+    await dispatcher.start()
+
+    # Descarga la media entrante fuera del request (sus metadatos van al writer)
+    media = await get_media() if settings.MEDIA_ENABLED else None
+    if media is not None:
+        await media.start()
+        metrics.MEDIA_INFLIGHT.set_function(lambda: media.downloading)
+
+    metrics.DEBOUNCE_INFLIGHT.set_function(lambda: scheduler.inflight)
+    metrics.SEND_QUEUE.set_function(lambda: get_whatsapp_client().queued)
     
-#     try:
-#         yield
-#     finally:
-#         await close_db_pool()
+    try:
+        yield
+    finally:
+        await scheduler.stop()
+        await debounce.stop()
+        await dispatcher.stop()
+        if media is not None:
+            await media.stop()
+        await get_whatsapp_client().close()
+        # Después de scheduler/dispatcher: ya no llegan filas nuevas
+        await writer.stop()
+        await partitions.stop()
+        if orm.cache is not None:
+            await orm.cache.stop()
+            logging.info(f"ORM cache stats: {orm.cache.stats()}")
+        await close_db_pool()
+        await close_redis()
 
-app = FastAPI(title=settings.APP_NAME) #, lifespan=lifespan)
+app = FastAPI(title=settings.APP_NAME, lifespan=lifespan)
 
 # app.add_middleware(
 #     CORSMiddleware,
@@ -28,9 +105,9 @@ app = FastAPI(title=settings.APP_NAME) #, lifespan=lifespan)
 #     allow_headers=["*"],
 # )
 
-# custom_orm: AsyncPGORM | None = None
-
 app.include_router(whatsapp_webhook_router)
+app.include_router(health_router)
+app.include_router(metrics_router)
 
 
 
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# Los tests corren desde whatsapp_webhook/ (o desde la raíz del repo) e importan `app`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings exige estas variables aunque los tests no las usen
+for _name in ("APP_NAME", "ACCESS_TOKEN", "APP_ID", "RECIPIENT_WAID", "VERSION", "PHONE_NUMBER_ID",
+              "APP_SECRET", "VERIFY_TOKEN", "OPENAI_API_KEY", "OPENAI_ASSISTANT_ID", "REDIS_URL",
+              "DB_HOST", "DB_USER", "DB_PASSWORD", "DB_NAME"):
+    os.environ.setdefault(_name, "test")
+os.environ.setdefault("DB_PORT", "5432")
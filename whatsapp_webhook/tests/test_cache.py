@@ -0,0 +1,127 @@
+"""ReadThroughCache (L1 en proceso + L2 en Redis) sobre fakeredis[lua]."""
+import asyncio
+import datetime
+from decimal import Decimal
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from app.core import metrics
+from app.db.cache import ReadThroughCache
+
+TABLES = {"contacts": ("id", "wa_id")}
+ROW = {"id": "c1", "wa_id": "5215550000000", "name": "Ana",
+       "created_at": datetime.datetime(2026, 1, 2, 3, 4, 5), "credit": Decimal("1.50")}
+
+
+class Loader:
+    """Simula Postgres: cuenta lecturas y devuelve la fila actual."""
+
+    def __init__(self, row=ROW):
+        self.row = row
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return dict(self.row) if self.row is not None else None
+
+
+def _cache(server: FakeServer) -> ReadThroughCache:
+    return ReadThroughCache(FakeRedis(server=server, decode_responses=True), TABLES, ttl_s=60)
+
+
+def _lookups(result: str) -> float:
+    return metrics.ORM_CACHE_LOOKUPS.labels("contacts", result).value
+
+
+def test_miss_fills_l2_and_l1_under_every_cached_field():
+    async def scenario():
+        server = FakeServer()
+        a, b = _cache(server), _cache(server)
+        load = Loader()
+        first = await a.get("contacts", "id", "c1", load)
+        by_wa_id = await a.get("contacts", "wa_id", ROW["wa_id"], load)  # L1 por el otro campo
+        from_redis = await b.get("contacts", "id", "c1", load)          # otro worker: L2
+        again = await b.get("contacts", "id", "c1", load)               # ya en su L1
+        return first, by_wa_id, from_redis, again, load.calls, a.stats(), b.stats()
+
+    before = {r: _lookups(r) for r in ("local", "redis", "miss")}
+    first, by_wa_id, from_redis, again, calls, a_stats, b_stats = asyncio.run(scenario())
+
+    assert calls == 1
+    assert first == by_wa_id == from_redis == again == ROW  # datetime y Decimal sobreviven a Redis
+    assert a_stats["contacts"] == {"local": 1, "redis": 0, "miss": 1, "hit_rate": 0.5}
+    assert b_stats["contacts"] == {"local": 1, "redis": 1, "miss": 0, "hit_rate": 1.0}
+    assert {r: _lookups(r) - before[r] for r in before} == {"local": 2, "redis": 1, "miss": 1}
+    assert 'wa_orm_cache_lookups_total{table="contacts",result="redis"}' in metrics.render()
+
+
+def test_missing_row_is_not_cached():
+    async def scenario():
+        cache = _cache(FakeServer())
+        load = Loader(None)
+        await cache.get("contacts", "id", "nope", load)
+        await cache.get("contacts", "id", "nope", load)
+        return load.calls
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_invalidate_bumps_version_and_drops_both_levels():
+    async def scenario():
+        server = FakeServer()
+        cache = _cache(server)
+        r = FakeRedis(server=server, decode_responses=True)
+        load = Loader()
+        await cache.get("contacts", "id", "c1", load)
+        await cache.invalidate("contacts", [ROW])
+        keys = sorted(await r.keys("orm:*"))
+        versions = await r.mget("orm:v:contacts:id:c1", "orm:v:contacts:wa_id:" + ROW["wa_id"])
+        load.row = {**ROW, "name": "Ana María"}
+        fresh = await cache.get("contacts", "wa_id", ROW["wa_id"], load)
+        return keys, versions, fresh, load.calls
+
+    keys, versions, fresh, calls = asyncio.run(scenario())
+
+    assert keys == ["orm:v:contacts:id:c1", "orm:v:contacts:wa_id:" + ROW["wa_id"]]
+    assert versions == ["1", "1"]
+    assert fresh["name"] == "Ana María" and calls == 2
+
+
+def test_invalidation_during_load_does_not_store_stale_row():
+    async def scenario():
+        cache = _cache(FakeServer())
+        stale = Loader()
+
+        async def load():
+            row = await stale()
+            await cache.invalidate("contacts", [ROW])  # otro request actualizó la fila mientras leíamos
+            return row
+
+        await cache.get("contacts", "id", "c1", load)
+        after = Loader({**ROW, "name": "nuevo"})
+        return await cache.get("contacts", "id", "c1", after), after.calls
+
+    row, calls = asyncio.run(scenario())
+
+    assert calls == 1 and row["name"] == "nuevo"
+
+
+def test_pubsub_invalidation_evicts_other_workers_l1():
+    async def scenario():
+        server = FakeServer()
+        a, b = _cache(server), _cache(server)
+        await b.start()
+        await asyncio.sleep(0.05)  # suscrito antes de invalidar
+        load = Loader()
+        await b.get("contacts", "id", "c1", load)
+        await a.invalidate("contacts", [ROW])
+        await asyncio.sleep(0.05)
+        load.row = {**ROW, "name": "cambiado"}
+        row = await b.get("contacts", "id", "c1", load)
+        await b.stop()
+        return row, load.calls
+
+    row, calls = asyncio.run(scenario())
+
+    assert calls == 2 and row["name"] == "cambiado"
@@ -0,0 +1,97 @@
+"""WhatsAppClient contra un transporte httpx.MockTransport (sin red)."""
+import asyncio
+
+import httpx
+import pytest
+
+from app.whatsapp.client import WhatsAppClient, WhatsAppSendError
+
+
+def _client(handler, **kw) -> WhatsAppClient:
+    kw.setdefault("max_retries", 3)
+    return WhatsAppClient(
+        access_token="token",
+        phone_number_id="123",
+        version="v21.0",
+        base_url="https://graph.test",
+        backoff_base_s=0.0,
+        transport=httpx.MockTransport(handler),
+        **kw,
+    )
+
+
+def _send(client: WhatsAppClient, text: str = "hola"):
+    async def go():
+        try:
+            return await client.send_text("5215550000000", text)
+        finally:
+            await client.close()
+    return asyncio.run(go())
+
+
+class Responses:
+    """Devuelve las respuestas en orden y registra cada request."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        resp = self.responses.pop(0)
+        if isinstance(resp, Exception):
+            raise resp
+        return resp
+
+
+OK = httpx.Response(200, json={"messages": [{"id": "wamid.1"}]})
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_retries_transient_status_then_succeeds(status):
+    handler = Responses(httpx.Response(status), httpx.Response(status), OK)
+    assert _send(_client(handler)) == {"messages": [{"id": "wamid.1"}]}
+    assert len(handler.requests) == 3
+
+
+def test_retries_transport_errors():
+    handler = Responses(httpx.ConnectError("boom"), OK)
+    assert _send(_client(handler))["messages"][0]["id"] == "wamid.1"
+    assert len(handler.requests) == 2
+
+
+def test_gives_up_after_max_retries():
+    handler = Responses(*[httpx.Response(503, text="down")] * 3)
+    with pytest.raises(WhatsAppSendError) as exc:
+        _send(_client(handler, max_retries=2))
+    assert exc.value.status_code == 503
+    assert len(handler.requests) == 3
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404])
+def test_does_not_retry_client_errors(status):
+    handler = Responses(httpx.Response(status, json={"error": {"message": "bad"}}), OK)
+    with pytest.raises(WhatsAppSendError) as exc:
+        _send(_client(handler))
+    assert exc.value.status_code == status
+    assert len(handler.requests) == 1
+
+
+def test_request_shape():
+    handler = Responses(OK)
+    _send(_client(handler), "¿hola?")
+    req = handler.requests[0]
+    assert req.url.path == "/v21.0/123/messages"
+    assert req.headers["Authorization"] == "Bearer token"
+    assert b'"to":"5215550000000"' in req.content.replace(b" ", b"")
+
+
+def test_backoff_honours_retry_after_and_caps_it():
+    client = _client(Responses(), backoff_max_s=8.0)
+    assert client._backoff(0, "2") == 2.0
+    assert client._backoff(0, "120") == 8.0
+    # Sin Retry-After (o inválido): full jitter acotado por base * 2^intento
+    client._backoff_base = 1.0
+    assert all(0 <= client._backoff(2, None) <= 4.0 for _ in range(100))
+    assert 0 <= client._backoff(10, "soon") <= 8.0
+    asyncio.run(client.close())
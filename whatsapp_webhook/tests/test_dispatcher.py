@@ -0,0 +1,92 @@
+"""OutboundDispatcher sobre fakeredis: orden por usuario y qué se reintenta."""
+import asyncio
+
+from fakeredis import FakeServer
+
+from app.whatsapp.client import WhatsAppSendError
+from app.whatsapp.dispatcher import OutboundDispatcher
+from benchmarks.standins import latency_redis
+
+
+def _run(deliver, entries, settle_s=0.4):
+    """Publica `entries` en el stream, deja correr al dispatcher y devuelve lo pendiente."""
+    async def go():
+        r = latency_redis(FakeServer(), None)
+        d = OutboundDispatcher(r, "out", "g", deliver, block_ms=20, retry_base_s=0.01, retry_s=1.0)
+        await d.start()
+        for fields in entries:
+            await r.xadd("out", fields)
+        await asyncio.sleep(settle_s)
+        pending = (await r.xpending("out", "g"))["pending"]
+        await d.stop()
+        await r.aclose()
+        return pending
+    return asyncio.run(go())
+
+
+def test_send_error_is_not_retried_and_next_segment_follows():
+    calls = []
+
+    async def deliver(fields):
+        calls.append(fields["seq"])
+        if fields["seq"] == "0":
+            raise WhatsAppSendError(503, "agotó los reintentos del cliente")
+
+    pending = _run(deliver, [{"wa_id": "a", "seq": "0"}, {"wa_id": "a", "seq": "1"}])
+
+    assert calls == ["0", "1"]
+    assert pending == 0
+
+
+def test_error_before_send_is_retried_in_place_keeping_order():
+    calls = []
+    failures = {"0": 2}
+
+    async def deliver(fields):
+        calls.append(fields["wa_id"] + fields["seq"])
+        if failures.get(fields["seq"]) and fields["wa_id"] == "a":
+            failures[fields["seq"]] -= 1
+            raise ConnectionError("redis")
+
+    pending = _run(deliver, [
+        {"wa_id": "a", "seq": "0"}, {"wa_id": "b", "seq": "0"},
+        {"wa_id": "a", "seq": "1"}, {"wa_id": "b", "seq": "1"},
+    ])
+
+    a = [c for c in calls if c.startswith("a")]
+    assert a == ["a0", "a0", "a0", "a1"]
+    assert [c for c in calls if c.startswith("b")] == ["b0", "b1"]
+    assert pending == 0
+
+
+def test_deliver_reply_does_not_raise_after_a_successful_send(monkeypatch):
+    from app.whatsapp import utils
+
+    sent = []
+
+    class Debounce:
+        async def is_current(self, wa_id, fence):
+            return True
+
+        async def release(self, wa_id, fence):
+            raise ConnectionError("redis")
+
+    async def get_debounce():
+        return Debounce()
+
+    async def send(wa_id, text):
+        sent.append(text)
+        return {"messages": [{"id": "wamid.1"}]}
+
+    monkeypatch.setattr(utils, "get_debounce", get_debounce)
+    monkeypatch.setattr(utils, "send_whatsapp_message", send)
+    monkeypatch.setattr(utils, "_record_outbound", lambda *a: asyncio.sleep(0))
+
+    # release falla y llm_ms no es un número: el segmento ya salió, no debe reintentarse
+    pending = _run(utils.deliver_reply, [{
+        "wa_id": "a", "kind": "text", "text": "hola", "fence": "1", "final": "1",
+        "turn_id": "1-0", "source": "llm", "llm_ms": "no-es-un-numero",
+    }])
+
+    assert sent == ["hola"]
+    assert pending == 0
@@ -0,0 +1,172 @@
+"""TimerWheel, Journal y LocalDebounce (debounce en memoria de un solo nodo)."""
+import asyncio
+import json
+
+import pytest
+
+from app.whatsapp.local_debounce import Journal, LocalDebounce, TimerWheel, _now_ms
+from app.whatsapp.window import WindowPolicy
+
+WINDOW_MS = 1000
+
+
+def _drain(wheel: TimerWheel, until_ms: int, step_ms: int):
+    """Avanza de a `step_ms` y devuelve [(clave, deadline, momento en que salió)]."""
+    fired = []
+    for now in range(step_ms, until_ms + step_ms, step_ms):
+        fired.extend((key, dl, now) for key, dl in wheel.advance(now))
+    return fired
+
+
+def test_timer_wheel_fires_in_deadline_order_across_levels():
+    wheel = TimerWheel(tick_ms=10, slots=8, levels=3, now_ms=0)
+    # nivel 0 cubre 80 ms, nivel 1 640 ms, nivel 2 5120 ms; lo que sigue se reinserta
+    deadlines = {"a": 35, "b": 5, "c": 75, "d": 300, "e": 641, "f": 4000, "g": 9000}
+    for key, dl in deadlines.items():
+        wheel.schedule(key, dl)
+
+    fired = _drain(wheel, 10000, 10)
+
+    assert [k for k, _, _ in fired] == sorted(deadlines, key=deadlines.get)
+    for key, dl, at in fired:
+        assert dl <= at < dl + 10, (key, dl, at)
+    assert len(wheel) == 0
+
+
+def test_timer_wheel_reschedule_and_cancel():
+    wheel = TimerWheel(tick_ms=10, slots=8, levels=2, now_ms=0)
+    wheel.schedule("a", 50)
+    wheel.schedule("b", 60)
+    wheel.schedule("a", 200)  # la entrada vieja de "a" se descarta al vencer
+    wheel.cancel("b")
+
+    assert wheel.advance(100) == []
+    assert wheel.deadline("a") == 200
+    assert wheel.advance(200) == [("a", 200)]
+    assert wheel.deadline("a") is None
+
+
+def test_journal_replays_pending_and_tolerates_truncated_tail(tmp_path):
+    path = tmp_path / "journal"
+    j = Journal(path)
+    j.append([
+        ["i", "u1", 100, [1, "m1", "hola", None, 10, "text"]],
+        ["i", "u2", 200, [2, "m2", "buenas", "Ana", 20, "text"]],
+        ["i", "u1", 150, [3, "m3", "¿estás?", None, 30, "text"]],
+        ["f", "u2"],
+    ])
+    j.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('["i", "u3", 300, [4, "m4"')  # el crash cortó la última línea
+
+    pending = Journal(path).replay()
+
+    assert pending == {"u1": (150, [(1, "m1", "hola", None, 10, "text"), (3, "m3", "¿estás?", None, 30, "text")])}
+
+
+def test_journal_compaction_keeps_only_pending(tmp_path):
+    path = tmp_path / "journal"
+    j = Journal(path, compact_bytes=1)
+    j.append([["i", "u1", 100, [1, "m1", "a", None, 10, "text"]], ["f", "u1"],
+              ["i", "u2", 200, [2, "m2", "b", None, 20, "text"]]])
+    j.maybe_compact(lambda: {"u2": (200, [(2, "m2", "b", None, 20, "text")])})
+    j.append([["i", "u2", 250, [3, "m3", "c", None, 30, "text"]]])
+    j.close()
+
+    lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+    assert [rec[1] for rec in lines] == ["u2", "u2"]
+    assert Journal(path).replay() == {
+        "u2": (250, [(2, "m2", "b", None, 20, "text"), (3, "m3", "c", None, 30, "text")]),
+    }
+
+
+def _debounce(**kw) -> LocalDebounce:
+    return LocalDebounce(3600, 5000, 1000, WindowPolicy(WINDOW_MS), **kw)
+
+
+def _msgs(*ids):
+    return [{"id": m, "ts": i, "text": m, "name": None} for i, m in enumerate(ids)]
+
+
+def _past() -> int:
+    """Un now_ms cuya ventana ya venció: el usuario sale en el próximo tick."""
+    return _now_ms() - 2 * WINDOW_MS
+
+
+async def _claim_and_flush(d: LocalDebounce, wa_id: str):
+    await asyncio.sleep(0.03)
+    claimed = dict(await d.claim(100))
+    return await d.flush(wa_id, claimed[wa_id])
+
+
+def test_restart_replays_journal_trimmed_to_max_buffer(tmp_path):
+    path = str(tmp_path / "journal")
+
+    async def scenario():
+        before = _debounce(journal_path=path, max_buffer=50)
+        await before.start()
+        now = _past()
+        await before.ingest({"u": _msgs("m0", "m1", "m2", "m3", "m4")}, now)
+        await before.stop()
+
+        after = _debounce(journal_path=path, max_buffer=2)
+        await after.start()
+        deadline = after._wheel.deadline("u")
+        flushed = await _claim_and_flush(after, "u")
+        await after.stop()
+        return now, deadline, flushed
+
+    now, deadline, flushed = asyncio.run(scenario())
+
+    assert deadline == now + WINDOW_MS
+    fence, msgs = flushed
+    assert [m["id"] for m in msgs] == ["m3", "m4"]
+    assert msgs[0] == {"id": "m3", "ts": 3, "text": "m3", "name": None, "rx": now, "type": "text"}
+
+
+def test_flushed_user_is_not_replayed(tmp_path):
+    path = str(tmp_path / "journal")
+
+    async def scenario():
+        before = _debounce(journal_path=path)
+        await before.start()
+        await before.ingest({"u": _msgs("m0")}, _past())
+        await before.ingest({"v": _msgs("n0")}, _now_ms())
+        assert await _claim_and_flush(before, "u")
+        await before.stop()
+
+        after = _debounce(journal_path=path)
+        await after.start()
+        users = sorted(after._users)
+        await after.stop()
+        return users
+
+    assert asyncio.run(scenario()) == ["v"]
+
+
+def test_duplicate_msg_id_and_live_trim():
+    async def scenario():
+        d = _debounce(max_buffer=3)
+        accepted = await d.ingest({"u": _msgs("a", "b")}, 1000)
+        again = await d.ingest({"u": _msgs("a", "b", "c", "d", "e")}, 1100)
+        return accepted, again, [it[1] for it in d._users["u"].items]
+
+    assert asyncio.run(scenario()) == (2, 3, ["c", "d", "e"])
+
+
+@pytest.mark.parametrize("fence_offset", [-1, 1])
+def test_stale_fence_cannot_renew_or_release(fence_offset):
+    async def scenario():
+        d = _debounce()
+        await d.ingest({"u": _msgs("a")}, _past())
+        fence, _ = await _claim_and_flush(d, "u")
+        stale = fence + fence_offset
+        renewed = await d.renew("u", stale)
+        await d.release("u", stale)
+        return renewed, await d.is_current("u", stale), await d.is_current("u", fence), d._locks["u"][1] > 0
+
+    renewed, stale_current, current, still_locked = asyncio.run(scenario())
+
+    assert renewed is False and stale_current is False
+    assert current is True and still_locked is True
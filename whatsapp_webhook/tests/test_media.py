@@ -0,0 +1,219 @@
+"""MediaFetcher.fetch contra un Graph API de httpx.MockTransport y fakeredis (sin red)."""
+import asyncio
+import base64
+import hashlib
+import os
+
+import httpx
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from app.whatsapp.media import MediaError, MediaFetcher, MediaStore
+
+VERSION = "v21.0"
+BASE_URL = "https://graph.test"
+
+
+class Graph:
+    """
+    Graph API mínimo: GET /{version}/{media_id} devuelve los metadatos y
+    GET /files/{media_id} el archivo. `fail[path]` es una lista de status
+    a devolver antes de responder bien.
+    """
+
+    def __init__(self):
+        self.media = {}
+        self.fail = {}
+        self.requests = []
+
+    def add(self, media_id, data: bytes, mime_type="audio/ogg", **info):
+        meta = {
+            "url": f"{BASE_URL}/files/{media_id}",
+            "mime_type": mime_type,
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "file_size": len(data),
+            "id": media_id,
+        }
+        meta.update(info)
+        self.media[media_id] = (data, {k: v for k, v in meta.items() if v is not None})
+
+    @property
+    def downloads(self) -> int:
+        return sum(r.url.path.startswith("/files/") for r in self.requests)
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        path = request.url.path
+        pending = self.fail.get(path)
+        if pending:
+            return httpx.Response(pending.pop(0), headers={"Retry-After": "0"})
+        kind, _, media_id = path.strip("/").partition("/")
+        if kind == VERSION and media_id in self.media:
+            return httpx.Response(200, json=self.media[media_id][1])
+        if kind == "files" and media_id in self.media:
+            return httpx.Response(200, content=self.media[media_id][0])
+        return httpx.Response(404, json={"error": {"message": "not found"}})
+
+
+@pytest.fixture
+def graph():
+    return Graph()
+
+
+@pytest.fixture
+def fetch(graph, tmp_path):
+    """fetch(media_id, ...) de un MediaFetcher nuevo; devuelve (meta, fetcher)."""
+    server = FakeServer()
+
+    def go(*args, max_bytes=1024 * 1024, **kw):
+        async def run():
+            r = FakeRedis(server=server, decode_responses=True)
+            store = MediaStore(str(tmp_path))
+            store.start()
+            fetcher = MediaFetcher(
+                r, store, access_token="token", version=VERSION, base_url=BASE_URL,
+                max_bytes=max_bytes, chunk_bytes=1024, max_retries=3, backoff_base_s=0.0,
+                transport=httpx.MockTransport(graph),
+            )
+            try:
+                return await fetcher.fetch(*args, **kw), fetcher
+            finally:
+                await fetcher.stop()
+                await r.aclose()
+        return asyncio.run(run())
+
+    return go
+
+
+def _stored(fetcher: MediaFetcher, sha256: str) -> bytes:
+    with open(fetcher.store.path(sha256), "rb") as f:
+        return f.read()
+
+
+def test_downloads_and_stores_by_content(graph, fetch):
+    data = os.urandom(10_000)
+    graph.add("m1", data)
+
+    meta, fetcher = fetch("m1")
+
+    sha256 = hashlib.sha256(data).hexdigest()
+    assert meta == {"sha256": sha256, "size": len(data), "mime_type": "audio/ogg"}
+    assert _stored(fetcher, sha256) == data
+    assert os.listdir(fetcher.store.tmp) == []
+    assert graph.requests[0].headers["Authorization"] == "Bearer token"
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_retries_retryable_status_then_succeeds(graph, fetch, status):
+    data = os.urandom(3000)
+    graph.add("m1", data)
+    graph.fail[f"/{VERSION}/m1"] = [status]
+    graph.fail["/files/m1"] = [status, status]
+
+    meta, _ = fetch("m1")
+
+    assert meta["size"] == len(data)
+    assert graph.downloads == 3  # dos fallidas + la buena
+
+
+def test_gives_up_after_max_retries(graph, fetch):
+    graph.add("m1", b"x")
+    graph.fail[f"/{VERSION}/m1"] = [503] * 10
+
+    with pytest.raises(MediaError) as e:
+        fetch("m1")
+
+    assert e.value.reason == "http"
+    assert len(graph.requests) == 4  # intento + 3 reintentos
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404])
+def test_client_error_is_not_retried(graph, fetch, status):
+    graph.add("m1", b"x")
+    graph.fail["/files/m1"] = [status]
+
+    with pytest.raises(MediaError) as e:
+        fetch("m1")
+
+    assert e.value.reason == "http"
+    assert graph.downloads == 1
+
+
+def test_checksum_mismatch_fails_and_leaves_nothing(graph, fetch, tmp_path):
+    graph.add("m1", b"real content", sha256=hashlib.sha256(b"other content").hexdigest())
+
+    with pytest.raises(MediaError) as e:
+        fetch("m1")
+
+    assert e.value.reason == "checksum"
+    assert sorted(os.listdir(tmp_path)) == ["tmp"]
+    assert os.listdir(tmp_path / "tmp") == []
+
+
+def test_checksum_accepts_base64(graph, fetch):
+    data = b"voice note"
+    graph.add("m1", data, sha256=base64.b64encode(hashlib.sha256(data).digest()).decode())
+
+    meta, _ = fetch("m1")
+
+    assert meta["sha256"] == hashlib.sha256(data).hexdigest()
+
+
+def test_declared_size_over_limit_is_not_downloaded(graph, fetch):
+    graph.add("m1", b"x" * 100, file_size=5000)
+
+    with pytest.raises(MediaError) as e:
+        fetch("m1", max_bytes=1000)
+
+    assert e.value.reason == "too_large"
+    assert graph.downloads == 0
+
+
+def test_stream_over_limit_is_cut_off(graph, fetch, tmp_path):
+    # Sin file_size (o mintiendo): se corta al pasar max_bytes mientras baja
+    graph.add("m1", os.urandom(5000), file_size=None, sha256=None)
+
+    with pytest.raises(MediaError) as e:
+        fetch("m1", max_bytes=2048)
+
+    assert e.value.reason == "too_large"
+    assert os.listdir(tmp_path / "tmp") == []
+
+
+def test_same_content_under_two_media_ids_is_stored_once(graph, fetch, tmp_path):
+    data = os.urandom(4000)
+    graph.add("m1", data)
+    graph.add("m2", data)  # media reenviada: otro media_id, mismo archivo
+
+    first, _ = fetch("m1")
+    second, _ = fetch("m2")
+
+    assert first["sha256"] == second["sha256"]
+    assert graph.downloads == 1
+    files = [f for _, _, names in os.walk(tmp_path) for f in names]
+    assert files == [first["sha256"]]
+
+
+def test_known_sha256_skips_graph_api(graph, fetch):
+    data = os.urandom(2000)
+    graph.add("m1", data)
+    graph.add("m2", data)
+    meta, _ = fetch("m1")
+    graph.requests.clear()
+
+    again, _ = fetch("m2", "audio/ogg", meta["sha256"])
+
+    assert again == meta
+    assert graph.requests == []
+
+
+def test_same_media_id_is_fetched_once(graph, fetch):
+    graph.add("m1", os.urandom(2000))
+    meta, _ = fetch("m1")
+    graph.requests.clear()
+
+    again, _ = fetch("m1")
+
+    assert again == meta
+    assert graph.requests == []
@@ -0,0 +1,81 @@
+"""metrics.render(): formato de texto de Prometheus 0.0.4."""
+import asyncio
+
+import pytest
+
+from app.core import metrics
+from app.db import orm as orm_module
+from app.db.orm import AsyncPGORM
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Registro vacío: las métricas de cada test no se mezclan con el catálogo."""
+    monkeypatch.setattr(metrics, "_registry", [])
+
+
+def test_counter_and_gauge_have_help_type_and_escaped_labels(registry):
+    dropped = metrics.Counter("t_dropped_total", "Descartados.", labels=("reason",))
+    queue = metrics.Gauge("t_queue", "Cola.")
+    inflight = metrics.Gauge("t_inflight", "En curso.")
+    dropped.labels('a "quoted"\\path\nline').inc()
+    dropped.labels("plain").inc(2.5)
+    queue.set(3)
+    inflight.set_function(lambda: 1 / 0)
+
+    text = metrics.render()
+
+    assert text.endswith("\n")
+    assert text.splitlines() == [
+        "# HELP t_dropped_total Descartados.",
+        "# TYPE t_dropped_total counter",
+        't_dropped_total{reason="a \\"quoted\\"\\\\path\\nline"} 1',
+        't_dropped_total{reason="plain"} 2.5',
+        "# HELP t_queue Cola.",
+        "# TYPE t_queue gauge",
+        "t_queue 3",
+        "# HELP t_inflight En curso.",
+        "# TYPE t_inflight gauge",
+        "t_inflight NaN",
+    ]
+
+
+def test_histogram_buckets_are_cumulative_with_inf_sum_and_count(registry):
+    hist = metrics.Histogram("t_seconds", "Duración.", labels=("op",), buckets=(0.5, 0.1, 1))
+    for v in (0.05, 0.1, 0.3, 2.0):
+        hist.labels("get").observe(v)
+
+    assert metrics.render().splitlines() == [
+        "# HELP t_seconds Duración.",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{op="get",le="0.1"} 2',  # le es inclusivo
+        't_seconds_bucket{op="get",le="0.5"} 3',
+        't_seconds_bucket{op="get",le="1"} 3',
+        't_seconds_bucket{op="get",le="+Inf"} 4',
+        't_seconds_sum{op="get"} 2.45',
+        't_seconds_count{op="get"} 4',
+    ]
+
+
+def test_labels_must_match_declared_names(registry):
+    counter = metrics.Counter("t_total", "x", labels=("a", "b"))
+
+    with pytest.raises(ValueError):
+        counter.labels("solo-uno")
+    assert counter.labels("1", 2) is counter.labels(1, "2")
+
+
+def test_exists_through_cache_is_timed_once(monkeypatch):
+    class Cache:
+        def enabled(self, table, field):
+            return True
+
+        async def get(self, table, field, value, loader):
+            return {"id": value}
+
+    count = lambda method: sum(metrics.DB_QUERY_SECONDS.labels(method).counts)
+    before = count("exists"), count("get")
+    monkeypatch.setattr(orm_module, "get_pool", lambda: pytest.fail("no debe ir a Postgres"))
+
+    assert asyncio.run(AsyncPGORM(Cache()).exists("contacts", "wa_id", "1")) is True
+    assert (count("exists") - before[0], count("get") - before[1]) == (1, 0)
@@ -0,0 +1,157 @@
+"""Scripts Lua del buffer de debounce (app/whatsapp/scripts.py) sobre fakeredis[lua]."""
+import asyncio
+import json
+
+import pytest
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from app.whatsapp.scripts import BufferScripts
+from app.whatsapp.window import WindowPolicy
+
+WA_ID = "5215550000000"
+WINDOW_MS = 1000
+PARAMS = WindowPolicy(WINDOW_MS).params_json()
+BUF, LOCK, FENCE, GAPS, SCHED = f"wa:{WA_ID}:buf", f"wa:{WA_ID}:lock", f"wa:{WA_ID}:fence", f"wa:{WA_ID}:gaps", "wa:sched"
+
+
+@pytest.fixture
+def run():
+    """run(fn) corre `fn(r, scripts)` contra un Redis en memoria nuevo."""
+    def go(fn):
+        async def main():
+            r = FakeRedis(server=FakeServer(), decode_responses=True)
+            try:
+                return await fn(r, BufferScripts(r))
+            finally:
+                await r.aclose()
+        return asyncio.run(main())
+    return go
+
+
+def _item(msg_id: str, ts: int) -> str:
+    return json.dumps({"id": msg_id, "ts": ts, "text": msg_id, "name": None})
+
+
+async def _ingest(s: BufferScripts, now_ms: int, *msgs):
+    """msgs: (msg_id, ts). Devuelve [aceptados, ventana_ms]."""
+    return await s.ingest(
+        keys=[BUF, SCHED, GAPS, *(f"wa:dedup:{m}" for m, _ in msgs)],
+        args=[3600, 3600, now_ms, WA_ID, PARAMS, "0", *(_item(m, ts) for m, ts in msgs)],
+    )
+
+
+async def _flush(s: BufferScripts, score: int, now_ms: int = 0):
+    return await s.flush(keys=[SCHED, LOCK, BUF, FENCE], args=[WA_ID, score, now_ms, 30000, 500, 86400])
+
+
+def test_ingest_schedules_window_and_ignores_duplicate_msg_id(run):
+    async def scenario(r, s):
+        first = await _ingest(s, 1000, ("m1", 1), ("m2", 2))
+        again = await _ingest(s, 1500, ("m2", 2))  # reintento de Meta
+        return first, again, await r.lrange(BUF, 0, -1), await r.zscore(SCHED, WA_ID)
+
+    first, again, buf, score = run(scenario)
+
+    assert first == [2, WINDOW_MS]
+    assert again == [0, 0]
+    assert [json.loads(x)["id"] for x in buf] == ["m1", "m2"]
+    assert score == 1000 + WINDOW_MS  # el duplicado no reinicia la ventana
+
+
+def test_claim_moves_due_users_to_lease(run):
+    async def scenario(r, s):
+        await _ingest(s, 1000, ("m1", 1))
+        early = await s.claim(keys=[SCHED], args=[1500, 10, 30000])
+        due = await s.claim(keys=[SCHED], args=[2000, 10, 30000])
+        again = await s.claim(keys=[SCHED], args=[2001, 10, 30000])
+        return early, due, again
+
+    early, due, again = run(scenario)
+
+    assert early == []
+    assert due == [WA_ID, "32000"]
+    assert again == []  # en lease: otro poller no lo toma
+
+
+def test_flush_returns_batch_sorted_by_ts_with_new_fence(run):
+    async def scenario(r, s):
+        await _ingest(s, 1000, ("late", 9), ("early", 3), ("tie_a", 5), ("tie_b", 5))
+        out = await _flush(s, 2000)
+        return out, await r.get(LOCK), await r.exists(BUF), await r.zscore(SCHED, WA_ID)
+
+    out, lock, buf_exists, score = run(scenario)
+
+    assert out[0] == 1
+    assert [json.loads(x)["id"] for x in out[1:]] == ["early", "tie_a", "tie_b", "late"]
+    assert lock == "1"
+    assert buf_exists == 0 and score is None
+
+
+def test_flush_with_stale_score_returns_nothing(run):
+    async def scenario(r, s):
+        await _ingest(s, 1000, ("m1", 1))
+        await _ingest(s, 1400, ("m2", 2))  # ventana reiniciada: score 2400
+        stale = await _flush(s, 2000)
+        return stale, await r.llen(BUF), await r.exists(LOCK)
+
+    stale, buffered, locked = run(scenario)
+
+    assert stale is None
+    assert buffered == 2
+    assert locked == 0
+
+
+def test_contended_lock_returns_minus_one_and_reschedules(run):
+    async def scenario(r, s):
+        await r.set(LOCK, "7", px=30000)  # respuesta anterior en curso
+        await _ingest(s, 1000, ("m1", 1))
+        out = await _flush(s, 2000, now_ms=2000)
+        return out, await r.zscore(SCHED, WA_ID), await r.llen(BUF)
+
+    out, score, buffered = run(scenario)
+
+    assert out == -1
+    assert score == 2000 + 500  # now + retry_ms
+    assert buffered == 1
+
+
+def test_fence_increments_per_flush(run):
+    async def scenario(r, s):
+        fences = []
+        for i, now in enumerate((1000, 5000)):
+            await _ingest(s, now, (f"m{i}", i))
+            fences.append((await _flush(s, now + WINDOW_MS))[0])
+            await r.delete(LOCK)
+        return fences
+
+    assert run(scenario) == [1, 2]
+
+
+def test_renew_and_release_reject_stale_fence(run):
+    async def scenario(r, s):
+        await r.set(FENCE, "2")
+        await r.set(LOCK, "2", px=1000)
+        stale_renew = await s.renew(keys=[LOCK, FENCE], args=[1, 30000])
+        stale_release = await s.release(keys=[LOCK], args=[1])
+        ttl_after_stale = await r.pttl(LOCK)
+        renew = await s.renew(keys=[LOCK, FENCE], args=[2, 30000])
+        ttl = await r.pttl(LOCK)
+        release = await s.release(keys=[LOCK], args=[2])
+        return stale_renew, stale_release, ttl_after_stale, renew, ttl, release, await r.exists(LOCK)
+
+    stale_renew, stale_release, ttl_after_stale, renew, ttl, release, exists = run(scenario)
+
+    assert (stale_renew, stale_release) == (0, 0)
+    assert ttl_after_stale <= 1000
+    assert renew == 1 and ttl > 1000
+    assert release == 1 and exists == 0
+
+
+def test_renew_retakes_expired_lock_for_current_fence(run):
+    async def scenario(r, s):
+        await r.set(FENCE, "3")
+        renewed = await s.renew(keys=[LOCK, FENCE], args=[3, 30000])
+        return renewed, await r.get(LOCK)
+
+    assert run(scenario) == (1, "3")
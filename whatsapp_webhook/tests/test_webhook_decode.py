@@ -0,0 +1,150 @@
+"""decode_webhook + _extract_events sobre payloads con la forma real de WhatsApp Cloud API."""
+import json
+
+import msgspec
+import pytest
+
+from app.whatsapp.schemas import decode_webhook
+from app.whatsapp.utils import _extract_events, is_valid_whatsapp_message
+
+METADATA = {"display_phone_number": "15550001111", "phone_number_id": "106540352242922"}
+
+# Dos entries (Meta agrupa bajo carga), la segunda con dos changes; campos que
+# no declaramos (metadata, context, pricing, errors...) se ignoran al decodificar.
+PAYLOAD = {
+    "object": "whatsapp_business_account",
+    "entry": [
+        {
+            "id": "102290129340398",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": METADATA,
+                    "contacts": [
+                        {"profile": {"name": "Ana"}, "wa_id": "5215550000001"},
+                        {"wa_id": "5215550000002"},
+                    ],
+                    "messages": [
+                        {"from": "5215550000001", "id": "wamid.A1", "timestamp": "1760000000",
+                         "type": "text", "text": {"body": "  Hola, ¿a qué hora abren?  "}},
+                        {"from": "5215550000002", "id": "wamid.B1", "timestamp": "1760000001",
+                         "type": "image", "context": {"from": "15550001111", "id": "wamid.OUT"},
+                         "image": {"caption": " ticket de compra ", "mime_type": "image/jpeg",
+                                   "sha256": "mXx1Q8/Wq6pJ4wKb3VQJ5l1Xr6T4wQk0c8Rr3Yy8H2E=", "id": "1479537139650973"}},
+                    ],
+                },
+            }],
+        },
+        {
+            "id": "102290129340398",
+            "changes": [
+                {
+                    "field": "messages",
+                    "value": {
+                        "messaging_product": "whatsapp",
+                        "metadata": METADATA,
+                        "contacts": [{"profile": {"name": "Ana"}, "wa_id": "5215550000001"}],
+                        "messages": [
+                            {"from": "5215550000001", "id": "wamid.A2", "timestamp": "1760000002",
+                             "type": "audio", "audio": {"mime_type": "audio/ogg; codecs=opus",
+                                                        "sha256": "a2V5", "id": "2001", "voice": True}},
+                            {"from": "5215550000001", "id": "wamid.A3", "timestamp": "1760000003",
+                             "type": "document", "document": {"filename": "factura.pdf",
+                                                              "mime_type": "application/pdf", "id": "2002"}},
+                            {"from": "5215550000001", "id": "wamid.A4", "timestamp": "1760000004",
+                             "type": "reaction", "reaction": {"message_id": "wamid.OUT", "emoji": "👍"}},
+                            {"from": "5215550000001", "id": "wamid.A5", "timestamp": "1760000005",
+                             "type": "unsupported",
+                             "errors": [{"code": 131051, "title": "Message type unknown"}]},
+                        ],
+                    },
+                },
+                {
+                    "field": "messages",
+                    "value": {
+                        "messaging_product": "whatsapp",
+                        "metadata": METADATA,
+                        "statuses": [
+                            {"id": "wamid.OUT", "status": "delivered", "timestamp": "1760000010",
+                             "recipient_id": "5215550000001",
+                             "conversation": {"id": "c1", "origin": {"type": "service"}},
+                             "pricing": {"billable": True, "pricing_model": "CBP", "category": "service"}},
+                            {"id": "wamid.OUT", "status": "read", "timestamp": "1760000020",
+                             "recipient_id": "5215550000001"},
+                        ],
+                    },
+                },
+            ],
+        },
+    ],
+}
+
+
+def _events(payload=PAYLOAD):
+    return _extract_events(decode_webhook(json.dumps(payload).encode()))
+
+
+def test_walks_every_entry_change_and_message_in_order():
+    msgs, statuses = _events()
+
+    assert [m["id"] for m in msgs] == ["wamid.A1", "wamid.B1", "wamid.A2", "wamid.A3", "wamid.A4", "wamid.A5"]
+    assert len(statuses) == 2
+    assert msgs[0] == {
+        "wa_id": "5215550000001", "name": "Ana", "id": "wamid.A1", "ts": 1760000000000,
+        "type": "text", "text": "Hola, ¿a qué hora abren?",
+    }
+    assert msgs[1]["name"] is None  # contacto sin profile
+
+
+def test_statuses_are_passed_through():
+    _, statuses = _events()
+
+    assert [(s.id, s.status, s.timestamp, s.recipient_id) for s in statuses] == [
+        ("wamid.OUT", "delivered", "1760000010", "5215550000001"),
+        ("wamid.OUT", "read", "1760000020", "5215550000001"),
+    ]
+
+
+def test_media_messages_get_label_caption_and_media_ref():
+    msgs = {m["id"]: m for m in _events()[0]}
+
+    assert msgs["wamid.B1"]["text"] == "[imagen] ticket de compra"
+    assert msgs["wamid.B1"]["media"] == {
+        "id": "1479537139650973", "mime_type": "image/jpeg",
+        "sha256": "mXx1Q8/Wq6pJ4wKb3VQJ5l1Xr6T4wQk0c8Rr3Yy8H2E=", "filename": None,
+    }
+    assert msgs["wamid.A2"]["text"] == "[nota de voz]"
+    assert msgs["wamid.A2"]["media"]["mime_type"] == "audio/ogg; codecs=opus"
+    assert msgs["wamid.A3"]["text"] == "[documento] factura.pdf"
+    assert "media" not in msgs["wamid.A1"]
+
+
+def test_unknown_message_types_decode_without_text_or_media():
+    msgs = {m["id"]: m for m in _events()[0]}
+
+    for mid, kind in (("wamid.A4", "reaction"), ("wamid.A5", "unsupported")):
+        assert msgs[mid]["type"] == kind
+        assert msgs[mid]["text"] == ""
+        assert "media" not in msgs[mid]
+
+
+def test_status_only_and_empty_payloads():
+    status_only = {"object": "whatsapp_business_account", "entry": [PAYLOAD["entry"][1] | {
+        "changes": [PAYLOAD["entry"][1]["changes"][1], {"field": "messages"}]}]}
+
+    msgs, statuses = _events(status_only)
+
+    assert msgs == [] and len(statuses) == 2
+    assert not is_valid_whatsapp_message(decode_webhook(b"{}"))
+    assert _events({"object": "whatsapp_business_account", "entry": []}) == ([], [])
+
+
+@pytest.mark.parametrize("raw", [
+    b"{not json",
+    b'{"entry": "no es una lista"}',
+    json.dumps({"entry": [{"changes": [{"value": {"messages": [{"from": "1", "timestamp": "1"}]}}]}]}).encode(),
+])
+def test_invalid_bodies_raise_decode_error(raw):
+    with pytest.raises(msgspec.DecodeError):  # ValidationError hereda de DecodeError
+        decode_webhook(raw)
@@ -0,0 +1,217 @@
+"""MessageWriter (write-behind de messages) contra un pool de asyncpg falso."""
+import asyncio
+import json
+
+import asyncpg
+import pytest
+
+from app.core import metrics
+from app.db import write_behind
+from app.db.write_behind import EXISTING_SQL, STATUS_RANK, UPDATE_MEDIA_SQL, UPDATE_STATUSES_SQL, MessageWriter
+
+
+class Postgres:
+    """
+    Tabla messages en memoria (channel_id -> fila) con lo mínimo que usa el
+    writer: create_many/upsert_many del ORM y los tres SQL de `conn.fetch`.
+    `down` simula Postgres caído; `bad` son contenidos que violan un CHECK.
+    """
+
+    def __init__(self, bad=()):
+        self.rows = {}
+        self.bad = set(bad)
+        self.down = False
+        self.batches = []
+
+    # AsyncPGORM
+    async def create_many(self, table, rows, conn=None):
+        self.batches.append(len(rows))
+        if any(r["content"] in self.bad for r in rows):
+            raise asyncpg.CheckViolationError("new row violates check constraint")
+        for r in rows:
+            self.rows[r["channel_id"]] = dict(r)
+
+    async def upsert_many(self, table, rows, conflict, conn=None):
+        for r in rows:
+            self.rows.setdefault(r["channel_id"], dict(r))
+
+    # asyncpg.Pool / Connection
+    def acquire(self):
+        return self
+
+    async def __aenter__(self):
+        if self.down:
+            raise ConnectionRefusedError("postgres down")
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def transaction(self):
+        return Transaction()
+
+    async def fetch(self, sql, *args):
+        if sql == UPDATE_STATUSES_SQL:
+            out = []
+            for cid, status, _ in zip(*args):
+                row = self.rows.get(cid)
+                if row is not None and STATUS_RANK[row["status"]] < STATUS_RANK[status]:
+                    row["status"] = status
+                    out.append({"channel_id": cid})
+            return out
+        if sql == EXISTING_SQL:
+            return [{"channel_id": c} for c in args[0] if c in self.rows]
+        if sql == UPDATE_MEDIA_SQL:
+            ids, media_ids = args[0], args[1]
+            out = []
+            for cid, media_id in zip(ids, media_ids):
+                if cid in self.rows:
+                    self.rows[cid]["media_id"] = media_id
+                    out.append({"channel_id": cid})
+            return out
+        raise AssertionError(f"SQL inesperado: {sql}")
+
+
+class Transaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def pg(monkeypatch):
+    db = Postgres(bad={"malo"})
+    monkeypatch.setattr(write_behind, "get_pool", lambda: db)
+    return db
+
+
+def _writer(pg, **kw) -> MessageWriter:
+    return MessageWriter(pg, **kw)
+
+
+def _row(cid: str, content: str = None, status: str = "sent") -> dict:
+    return {"id": cid, "session_id": "s", "channel_id": cid, "role": "user", "message_type": "text",
+            "content": content or cid, "status": status, "created_at": None, "updated_at": None}
+
+
+def _dropped(reason: str) -> float:
+    return metrics.DROPPED.labels(reason).value
+
+
+def test_bad_row_is_bisected_to_dead_letter_and_the_rest_is_written(pg, tmp_path):
+    path = tmp_path / "dl" / "messages.jsonl"
+    w = _writer(pg, dead_letter_path=str(path))
+    w.add_messages([_row(f"m{i}") for i in range(6)] + [_row("m6", "malo"), _row("m7")])
+    before = _dropped("dead_letter")
+
+    asyncio.run(w.flush())
+
+    assert sorted(pg.rows) == [f"m{i}" for i in range(8) if i != 6]
+    assert (w.written_messages, w.dead_lettered, w.pending) == (7, 1, 0)
+    assert _dropped("dead_letter") - before == 1
+    assert len(pg.batches) < 2 * 8  # bisección, no fila por fila
+    lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [(x["kind"], x["item"]["channel_id"]) for x in lines] == [("message", "m6")]
+    assert "CheckViolationError" in lines[0]["error"]
+
+
+def test_status_never_goes_back(pg):
+    w = _writer(pg)
+    w.add_messages([_row("a"), _row("b"), _row("c")])
+    asyncio.run(w.flush())
+    pg.rows["a"]["status"] = "read"
+
+    w.add_status("a", "delivered")   # llega tarde: la tabla ya dice read
+    w.add_status("b", "read")
+    w.add_status("b", "delivered")   # en el buffer también se queda el más avanzado
+    w.add_status("c", "bogus")       # desconocido: se ignora
+    asyncio.run(w.flush())
+
+    assert {c: r["status"] for c, r in pg.rows.items()} == {"a": "read", "b": "read", "c": "sent"}
+    assert w.written_statuses == 1
+    assert w.pending == 0  # "a" existe: no se reintenta
+
+
+def test_status_for_unknown_message_is_retried_until_it_appears(pg):
+    w = _writer(pg)
+    w.add_status("later", "delivered")
+    w.add_media("later", {"media_id": "mid"})
+    asyncio.run(w.flush())
+    assert w.pending == 2
+
+    w.add_messages([_row("later")])
+    asyncio.run(w.flush())
+
+    assert pg.rows["later"]["status"] == "delivered"
+    assert pg.rows["later"]["media_id"] == "mid"
+    assert w.pending == 0
+
+
+def test_max_buffer_drops_new_entries(pg):
+    w = _writer(pg, max_buffer=3)
+    before = _dropped("write_overflow")
+
+    w.add_messages([_row(f"m{i}") for i in range(5)])
+    w.add_status("m0", "delivered")   # clave nueva con el buffer lleno
+    w.add_media("m0", {"media_id": "x"})
+
+    assert (w.pending, w.dropped) == (3, 4)
+    assert _dropped("write_overflow") - before == 4
+
+
+def test_status_upgrade_of_buffered_key_is_not_dropped(pg):
+    w = _writer(pg, max_buffer=1)
+    w.add_status("m0", "delivered")
+
+    w.add_status("m0", "read")
+
+    assert w.dropped == 0
+    assert w._statuses["m0"][0] == "read"
+
+
+def test_failed_flush_keeps_batch_in_order(pg):
+    w = _writer(pg)
+    w.add_messages([_row("m0"), _row("m1")])
+    pg.down = True
+    with pytest.raises(ConnectionRefusedError):
+        asyncio.run(w.flush())
+    w.add_messages([_row("m2")])
+
+    assert [r["channel_id"] for r in w._messages] == ["m0", "m1", "m2"]
+
+
+def test_stop_drains_the_buffer(pg):
+    async def scenario():
+        w = _writer(pg, flush_ms=60000)
+        await w.start()
+        w.add_messages([_row("m0"), _row("m1")])
+        w.add_status("m0", "delivered")
+        await w.stop()
+        return w
+
+    w = asyncio.run(scenario())
+
+    assert sorted(pg.rows) == ["m0", "m1"] and pg.rows["m0"]["status"] == "delivered"
+    assert w.pending == 0
+
+
+def test_stop_with_postgres_down_dead_letters_everything(pg, tmp_path):
+    path = tmp_path / "messages.jsonl"
+
+    async def scenario():
+        w = _writer(pg, flush_ms=60000, dead_letter_path=str(path))
+        await w.start()
+        w.add_messages([_row("m0")])
+        w.add_status("m0", "read")
+        w.add_media("m0", {"media_id": "x"})
+        pg.down = True
+        await w.stop()
+        return w
+
+    w = asyncio.run(scenario())
+
+    kinds = [json.loads(line)["kind"] for line in path.read_text(encoding="utf-8").splitlines()]
+    assert kinds == ["message", "status", "media"]
+    assert (w.pending, w.dead_lettered) == (0, 3)